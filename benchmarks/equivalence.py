@@ -0,0 +1,178 @@
+"""
+
+    Equivalence checks of the optimised code paths.
+
+    Author: Explore Data Science Academy.
+
+    Description: Several optimisations replace a straightforward
+    computation with a faster one that must give the same result. Each
+    check below runs both on small synthetic data and asserts that they
+    agree, so that a later change cannot silently break the equivalence:
+
+    - svd_scorer: `SVDScorer` estimates against `surprise.SVD.predict`,
+      for known and unknown users and movies, in memory and as a saved
+      float32 artifact;
+    - content_index: `update_content_index` against a full build, after
+      movies are added, changed and removed;
+    - ratings_store: `RatingsStore.from_chunks` with chunk sizes 1, 7 and
+      the whole table, against `from_frame` and a direct pandas build, on
+      sorted ratings and on shuffled ratings with repeats.
+
+    Usage (from the root of this repository):
+
+        python -m benchmarks.equivalence
+        python -m benchmarks.equivalence svd_scorer
+
+"""
+import argparse
+import os
+import sys
+import tempfile
+import numpy as np
+import pandas as pd
+
+CHECKS = {}
+
+
+def check(name):
+    """Decorator registering a check under `name`."""
+    def decorator(function):
+        CHECKS[name] = function
+        return function
+    return decorator
+
+
+def _ratings(n_users=200, n_movies=300, n_ratings=6000, seed=42):
+    """Random ratings, with repeated (user, movie) pairs left in."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'userId': rng.integers(1, n_users + 1, n_ratings),
+        'movieId': rng.integers(1, n_movies + 1, n_ratings) * 3,
+        'rating': rng.integers(1, 11, n_ratings) / 2,
+    })
+
+
+@check('svd_scorer')
+def check_svd_scorer():
+    from surprise import SVD, Dataset, Reader
+    from recommenders.svd_engine import SVDScorer
+
+    ratings = _ratings().drop_duplicates(['userId', 'movieId'])
+    trainset = Dataset.load_from_df(
+        ratings, Reader(rating_scale=(0.5, 5.0))).build_full_trainset()
+    users = np.append(np.unique(ratings['userId'])[:50], [-1, 10 ** 6])
+    movies = np.append(np.unique(ratings['movieId'])[:20], [-1, 10 ** 6])
+    for biased in (True, False):
+        model = SVD(n_factors=8, n_epochs=5, biased=biased, random_state=0)
+        model.fit(trainset)
+        expected = np.array([[model.predict(user, movie).est for user in users]
+                             for movie in movies])
+        scorer = SVDScorer.from_surprise(model)
+        with tempfile.TemporaryDirectory() as workdir:
+            scorer.save(os.path.join(workdir, 'scorer'))
+            saved = SVDScorer.load(os.path.join(workdir, 'scorer'))
+            # Factors are stored as float32
+            for candidate, tolerance in ((scorer, 1e-9), (saved, 1e-5)):
+                by_movie = np.array([candidate.score_item(movie, users) for movie in movies])
+                by_user = np.array([candidate.score_user(user, movies) for user in users]).T
+                np.testing.assert_allclose(by_movie, expected, rtol=0, atol=tolerance)
+                np.testing.assert_allclose(by_user, expected, rtol=0, atol=tolerance)
+            # Release the memory-mapped arrays before the directory goes
+            del saved
+
+
+@check('content_index')
+def check_content_index():
+    from benchmarks.synthetic_data import generate_movies
+    from recommenders.content_index import (ContentIndex, build_content_index,
+                                            update_content_index)
+
+    rng = np.random.default_rng(42)
+    movies = generate_movies(1200, rng)
+    movies['keyWords'] = movies['genres'].str.replace('|', ' ')
+    old = movies.iloc[:1000].reset_index(drop=True)
+    changed = old.copy()
+    edited = rng.choice(len(changed), 30, replace=False)
+    changed.loc[edited, 'keyWords'] = changed.loc[edited[::-1], 'keyWords'].to_numpy() + ' Drama'
+    catalogues = {
+        'added': movies,
+        'changed': changed,
+        'removed': old.drop(rng.choice(len(old), 20, replace=False)).reset_index(drop=True),
+        'all': pd.concat([changed.drop(index=range(0, 1000, 40)), movies.iloc[1000:]],
+                         ignore_index=True),
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, 'content_index.npz')
+        build_content_index(old, k=20).save(path)
+        stored = ContentIndex.load(path)
+    for name, data in catalogues.items():
+        updated = update_content_index(stored, data, k=20, block_size=64)
+        rebuilt = build_content_index(data, k=20)
+        assert updated is not stored, name
+        for field in ('movie_ids', 'neighbours', 'scores', 'fingerprints'):
+            np.testing.assert_array_equal(getattr(updated, field), getattr(rebuilt, field),
+                                          err_msg=f"{field} after movies were {name}")
+        assert (updated.features != rebuilt.features).nnz == 0, name
+
+
+def _reference_store(ratings):
+    """Ratings store built directly with pandas, keeping the last of
+    repeated ratings."""
+    from scipy import sparse
+    from utils.ratings_store import RatingsStore
+    ratings = ratings.drop_duplicates(['userId', 'movieId'], keep='last')
+    user_ids, rows = np.unique(ratings['userId'].to_numpy(np.int32), return_inverse=True)
+    item_ids, cols = np.unique(ratings['movieId'].to_numpy(np.int32), return_inverse=True)
+    csr = sparse.csr_matrix((ratings['rating'].to_numpy(np.float32), (rows, cols)),
+                            shape=(len(user_ids), len(item_ids)))
+    csr.sort_indices()
+    return RatingsStore(user_ids, item_ids, csr)
+
+
+@check('ratings_store')
+def check_ratings_store():
+    from utils.ratings_store import RatingsStore
+
+    shuffled = _ratings()
+    ordered = shuffled.drop_duplicates(['userId', 'movieId'], keep='last') \
+        .sort_values(['userId', 'movieId'], ignore_index=True)
+    for name, ratings in (('sorted', ordered), ('shuffled', shuffled)):
+        expected = _reference_store(ratings)
+        stores = {'frame': RatingsStore.from_frame(ratings)}
+        for size in (1, 7, len(ratings)):
+            stores[f'chunks of {size}'] = RatingsStore.from_chunks(
+                ratings.iloc[start:start + size] for start in range(0, len(ratings), size))
+        for label, store in stores.items():
+            message = f"{label}, {name} ratings"
+            for field in ('user_ids', 'item_ids'):
+                np.testing.assert_array_equal(getattr(store, field), getattr(expected, field),
+                                              err_msg=message)
+            for field in ('indptr', 'indices', 'data'):
+                actual, wanted = getattr(store.csr, field), getattr(expected.csr, field)
+                np.testing.assert_array_equal(actual, wanted, err_msg=f"{field}, {message}")
+                assert actual.dtype == wanted.dtype, f"{field} dtype, {message}"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Check that the optimised code paths match their references.')
+    parser.add_argument('checks', nargs='*', metavar='check',
+                        help=f"Checks to run (default: all of {', '.join(CHECKS)}).")
+    args = parser.parse_args(argv)
+    unknown = sorted(set(args.checks) - set(CHECKS))
+    if unknown:
+        parser.error(f"unknown checks: {', '.join(unknown)}")
+    failed = 0
+    for name in args.checks or list(CHECKS):
+        try:
+            CHECKS[name]()
+        except AssertionError as e:
+            failed += 1
+            print(f"{name}: FAILED\n{e}", file=sys.stderr)
+        else:
+            print(f"{name}: ok", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
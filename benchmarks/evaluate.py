@@ -0,0 +1,397 @@
+"""
+
+    Offline ranking evaluation of the recommenders.
+
+    Author: Explore Data Science Academy.
+
+    Description: Measures how well the recommenders rank movies, so that a
+    faster engine can be checked against the accuracy it gives up. The
+    ratings in `resources/data/ratings.csv` are split by user and time.
+    Every user with enough ratings has their most recent ratings held out.
+    A sample of those users is then evaluated. Each user's favourites are
+    their most recent well-rated training movies, and the relevant movies
+    are their well-rated held-out ones. Rated movies missing from
+    `movies.csv` cannot be recommended, so they are neither.
+
+    The training split is laid out in a working directory the way
+    `resources/` is. A fresh model is trained on it with ALS and published
+    there, so neither the ratings store nor the model has seen a held-out
+    rating. The content index only depends on the movies, so it is copied
+    over.
+
+    Users are spread in blocks over a pool of worker processes that fork
+    after the models are loaded. Each engine scores a block of favourite
+    lists at once (see `recommenders.batch`). The report gives, per
+    engine:
+
+    - precision@k, recall@k, NDCG@k and hit rate, averaged over users;
+    - catalogue coverage, the share of movies recommended to anyone;
+    - latency per user (block time divided by block size) and throughput.
+
+    The 'popularity' engine recommends the most rated training movies
+    and serves as a reference. Results are written as JSON next to those
+    of `benchmarks/run_benchmarks.py`.
+
+    Usage (from the root of this repository):
+
+        python -m benchmarks.evaluate
+        python -m benchmarks.evaluate --engines content hybrid --k 20 --users 5000
+
+"""
+import argparse
+import datetime
+import json
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+
+from benchmarks.run_benchmarks import REPO_ROOT, RESULTS_DIR, _git_commit
+
+ENGINES = ('content', 'collaborative', 'hybrid', 'popularity')
+DATA_DIR = os.path.join(REPO_ROOT, 'resources', 'data')
+MODELS_DIR = os.path.join(REPO_ROOT, 'resources', 'models')
+SPLIT_NAME = 'split.json'
+
+
+def split_by_time(ratings, holdout=0.2, min_ratings=10):
+    """Hold out the most recent ratings of every user with enough of them.
+
+    Parameters
+    ----------
+    ratings : Pandas DataFrame
+        Ratings with userId, movieId, rating and timestamp columns.
+    holdout : float
+        Share of each eligible user's ratings held out, at least one.
+    min_ratings : int
+        Ratings a user needs for any of them to be held out.
+
+    Returns
+    -------
+    np.ndarray (bool)
+        Whether each rating is held out, aligned with `ratings`.
+
+    """
+    users = ratings['userId'].to_numpy()
+    order = np.lexsort((ratings['movieId'].to_numpy(), ratings['timestamp'].to_numpy(), users))
+    sorted_users = users[order]
+    _, starts, counts = np.unique(sorted_users, return_index=True, return_counts=True)
+    n_held = np.where(counts >= min_ratings,
+                      np.maximum(np.floor(counts * holdout), 1), 0).astype(np.int64)
+    # Position of each rating from the end of its user's history
+    from_end = np.repeat(starts + counts, counts) - 1 - np.arange(len(order))
+    held = np.zeros(len(order), dtype=bool)
+    held[order] = from_end < np.repeat(n_held, counts)
+    return held
+
+
+def evaluation_users(ratings, held, n_users=2000, n_seeds=3, like=4.0, seed=42,
+                     items=None):
+    """Favourites and relevant movies of a sample of held-out users.
+
+    Parameters
+    ----------
+    items : np.ndarray (int), optional
+        Movie ids that can be favourites or relevant, such as those of the
+        catalogue. Ratings of other movies stay in the training split but
+        are otherwise ignored. Defaults to every rated movie.
+
+    Returns
+    -------
+    tuple (list (np.ndarray), list (np.ndarray))
+        For each sampled user, the movie ids of their `n_seeds` most recent
+        liked training movies, and of their liked held-out movies.
+
+    """
+    users = ratings['userId'].to_numpy()
+    movies = ratings['movieId'].to_numpy()
+    liked = ratings['rating'].to_numpy() >= like
+    if items is not None:
+        liked &= np.isin(movies, items)
+    timestamps = ratings['timestamp'].to_numpy()
+
+    train = liked & ~held
+    # Latest liked training movies first within each user
+    order = np.flatnonzero(train)[np.lexsort((-timestamps[train], users[train]))]
+    train_users, starts = np.unique(users[order], return_index=True)
+    relevant = np.flatnonzero(liked & held)
+    relevant = relevant[np.argsort(users[relevant], kind='stable')]
+    relevant_users, relevant_starts = np.unique(users[relevant], return_index=True)
+
+    candidates = np.intersect1d(train_users, relevant_users)
+    rng = np.random.default_rng(seed)
+    chosen = np.sort(rng.choice(candidates, min(n_users, len(candidates)), replace=False))
+    seed_bounds = np.append(starts, len(order))
+    relevant_bounds = np.append(relevant_starts, len(relevant))
+    seeds, targets = [], []
+    for user in chosen:
+        i = np.searchsorted(train_users, user)
+        start = seed_bounds[i]
+        seeds.append(movies[order[start:min(start + n_seeds, seed_bounds[i + 1])]])
+        j = np.searchsorted(relevant_users, user)
+        targets.append(movies[relevant[relevant_bounds[j]:relevant_bounds[j + 1]]])
+    return seeds, targets
+
+
+def ranking_metrics(recommended, relevant, k, n_items):
+    """Ranking quality of top-k lists against relevant movies.
+
+    Parameters
+    ----------
+    recommended : np.ndarray (int), shape (n_users, k)
+        Recommended movie ids, best first, padded with -1.
+    relevant : list (np.ndarray)
+        Relevant movie ids of each user; none may be empty.
+    k : int
+        Length of the lists.
+    n_items : int
+        Number of movies that could be recommended.
+
+    Returns
+    -------
+    dict
+        Mean precision@k, recall@k, NDCG@k and hit rate over users, and
+        catalogue coverage.
+
+    """
+    n_users = len(relevant)
+    n_relevant = np.array([len(items) for items in relevant])
+    width = int(max(recommended.max(initial=0), max(items.max() for items in relevant))) + 1
+    relevant_keys = np.repeat(np.arange(n_users, dtype=np.int64), n_relevant) * width \
+        + np.concatenate(relevant)
+    keys = np.arange(n_users, dtype=np.int64)[:, None] * width + recommended
+    hits = np.isin(keys, relevant_keys) & (recommended >= 0)
+    n_hits = hits.sum(axis=1)
+    discounts = 1 / np.log2(np.arange(k) + 2)
+    ideal = np.cumsum(discounts)[np.minimum(n_relevant, k) - 1]
+    return {
+        'precision': float((n_hits / k).mean()),
+        'recall': float((n_hits / n_relevant).mean()),
+        'ndcg': float(((hits @ discounts) / ideal).mean()),
+        'hit_rate': float((n_hits > 0).mean()),
+        'coverage': float(len(np.unique(recommended[recommended >= 0])) / n_items),
+    }
+
+
+def prepare_workdir(workdir, holdout, min_ratings, n_factors, n_epochs):
+    """Lay out the training split and a model trained on it, as
+    `resources/` is. A workdir prepared with the same settings is reused.
+
+    Returns
+    -------
+    tuple (Pandas DataFrame, np.ndarray (bool))
+        Every rating of `ratings.csv`, and whether each is held out.
+
+    """
+    from recommenders.als import train_als
+    from recommenders.model_versions import publish
+    from utils.data_loader import load_ratings
+    from utils.ratings_store import load_ratings_store
+
+    ratings = load_ratings(os.path.join(DATA_DIR, 'ratings.csv'))
+    held = split_by_time(ratings, holdout, min_ratings)
+    settings = {'holdout': holdout, 'min_ratings': min_ratings,
+                'factors': n_factors, 'epochs': n_epochs,
+                'source_stamp': os.stat(os.path.join(DATA_DIR, 'ratings.csv')).st_mtime_ns}
+    split_path = os.path.join(workdir, SPLIT_NAME)
+    if os.path.exists(split_path):
+        with open(split_path) as f:
+            if json.load(f) == settings:
+                return ratings, held
+    data_dir = os.path.join(workdir, 'resources', 'data')
+    model_dir = os.path.join(workdir, 'resources', 'models')
+    shutil.rmtree(os.path.join(workdir, 'resources'), ignore_errors=True)
+    os.makedirs(data_dir)
+    os.makedirs(model_dir)
+    shutil.copy2(os.path.join(DATA_DIR, 'movies.csv'), data_dir)
+    ratings[~held].to_csv(os.path.join(data_dir, 'ratings.csv'), index=False)
+    content_index = os.path.join(MODELS_DIR, 'content_index.npz')
+    if os.path.exists(content_index):
+        shutil.copy2(content_index, model_dir)
+
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        scorer = train_als(load_ratings_store(), n_factors, n_epochs, holdout=0, verbose=False)
+        publish(scorer)
+    finally:
+        os.chdir(cwd)
+    with open(split_path, 'w') as f:
+        json.dump(settings, f)
+    return ratings, held
+
+
+def _popularity_block(seed_lists, top_n):
+    """Most rated training movies, less each list's favourites."""
+    from utils.catalogue import load_catalogue
+    from utils.ratings_store import load_ratings_store
+    catalogue = load_catalogue()
+    store = load_ratings_store()
+    ranked = store.item_ids[np.argsort(-store.item_counts, kind='stable')]
+    ranked = ranked[catalogue.rows_for_movie_ids(ranked) >= 0]
+    results = []
+    for movies in seed_lists:
+        seed_ids = [catalogue.movie_id(title) for title in movies]
+        top = ranked[:top_n + len(seed_ids)]
+        top = top[~np.isin(top, seed_ids)][:top_n]
+        results.append(catalogue.titles_for(catalogue.rows_for_movie_ids(top)))
+    return results
+
+
+def _evaluate_block(args):
+    """Worker entry point: recommend for one block of users."""
+    from recommenders.batch import recommend_batch
+    from utils.catalogue import load_catalogue
+    engine, position, seed_lists, k = args
+    catalogue = load_catalogue()
+    start = time.perf_counter()
+    if engine == 'popularity':
+        outputs = _popularity_block(seed_lists, k)
+    else:
+        outputs = recommend_batch(seed_lists, engine, k)
+    elapsed = time.perf_counter() - start
+    recommended = np.full((len(seed_lists), k), -1, dtype=np.int64)
+    errors = 0
+    for i, output in enumerate(outputs):
+        if isinstance(output, Exception):
+            errors += 1
+            continue
+        ids = [catalogue.movie_id(title) for title in output[:k]]
+        recommended[i, :len(ids)] = ids
+    return position, recommended, elapsed, errors
+
+
+def evaluate(engines, seeds, targets, k=10, workers=None, block_size=64):
+    """Evaluate engines on the data under the working directory.
+
+    Parameters
+    ----------
+    engines : list (str)
+        Engines to evaluate, out of `ENGINES`.
+    seeds, targets : list (np.ndarray)
+        Favourite and relevant movie ids of each user (see
+        `evaluation_users`).
+    k : int
+        Number of recommendations per user.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    block_size : int
+        Number of users recommended for at a time.
+
+    Returns
+    -------
+    dict
+        Metrics and timings per engine.
+
+    """
+    from utils import resources
+    from utils.catalogue import load_catalogue
+    catalogue = load_catalogue()
+    seed_lists = [catalogue.titles_for(catalogue.rows_for_movie_ids(ids)) for ids in seeds]
+    # Load models before forking so that workers share their memory
+    resources.warm_up(background=False)
+    context = multiprocessing.get_context(
+        'fork' if 'fork' in multiprocessing.get_all_start_methods() else None)
+    results = {}
+    with context.Pool(workers) as pool:
+        for engine in engines:
+            blocks = [(engine, start, seed_lists[start:start + block_size], k)
+                      for start in range(0, len(seed_lists), block_size)]
+            recommended = np.full((len(seed_lists), k), -1, dtype=np.int64)
+            block_seconds, errors = [], 0
+            started = time.perf_counter()
+            for position, block, elapsed, block_errors in pool.imap_unordered(
+                    _evaluate_block, blocks):
+                recommended[position:position + len(block)] = block
+                block_seconds.extend([elapsed / len(block)] * len(block))
+                errors += block_errors
+            wall = time.perf_counter() - started
+            latencies = np.array(block_seconds) * 1e3
+            results[engine] = {
+                **ranking_metrics(recommended, targets, k, len(catalogue)),
+                'users': len(seed_lists),
+                'errors': errors,
+                'latency_ms_mean': float(latencies.mean()),
+                'latency_ms_p50': float(np.percentile(latencies, 50)),
+                'latency_ms_p95': float(np.percentile(latencies, 95)),
+                'throughput_per_s': len(seed_lists) / wall,
+            }
+            r = results[engine]
+            print(f"{engine:>13}: P@{k} {r['precision']:.4f}, R@{k} {r['recall']:.4f}, "
+                  f"NDCG@{k} {r['ndcg']:.4f}, coverage {r['coverage']:.4f}, "
+                  f"{r['latency_ms_mean']:8.3f} ms/user, "
+                  f"{r['throughput_per_s']:9.1f} users/s", file=sys.stderr)
+    return results
+
+
+def main(argv=None):
+    from utils.catalogue import load_catalogue
+    parser = argparse.ArgumentParser(
+        description='Evaluate the ranking quality of the recommenders.')
+    parser.add_argument('--engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--users', type=int, default=2000,
+                        help='Number of held-out users to evaluate.')
+    parser.add_argument('--seeds', type=int, default=3,
+                        help='Favourite movies given to the recommenders per user.')
+    parser.add_argument('--holdout', type=float, default=0.2)
+    parser.add_argument('--min-ratings', type=int, default=10)
+    parser.add_argument('--like', type=float, default=4.0,
+                        help='Lowest rating counting as a liked movie.')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--block-size', type=int, default=64)
+    parser.add_argument('--factors', type=int, default=50)
+    parser.add_argument('--epochs', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help='Where to keep the training split and its '
+                        'model between runs (default: a temporary directory).')
+    parser.add_argument('--output', help='Result file (default: '
+                        'benchmarks/results/evaluation-<timestamp>.json).')
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output or os.path.join(
+        RESULTS_DIR, 'evaluation-' + datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'))
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='evaluation-'))
+    # Recommendations must be computed, not read from a previous run
+    os.environ['RECOMMENDER_RESULT_CACHE'] = '0'
+
+    started = time.time()
+    ratings, held = prepare_workdir(workdir, args.holdout, args.min_ratings,
+                                    args.factors, args.epochs)
+    # Only catalogue movies can be favourites or be recommended
+    catalogue = load_catalogue(os.path.join(DATA_DIR, 'movies.csv'))
+    seeds, targets = evaluation_users(ratings, held, args.users, args.seeds, args.like,
+                                      args.seed, catalogue.movie_ids)
+    print(f"Evaluating {len(seeds)} users with {int(held.sum())} held-out ratings",
+          file=sys.stderr)
+    # Every resource path is relative to the working directory
+    os.chdir(workdir)
+    results = evaluate(args.engines, seeds, targets, args.k, args.workers, args.block_size)
+    report = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'settings': {name: value for name, value in vars(args).items()
+                         if name not in ('output', 'workdir')},
+            'held_out_ratings': int(held.sum()),
+            'duration_s': time.time() - started,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,274 @@
+"""
+
+    Latency, memory and throughput benchmarks for the recommenders.
+
+    Author: Explore Data Science Academy.
+
+    Description: Times the public entry points of the recommenders
+    (`content_model`, `collab_model`, `hybrid_model`, `prediction_item`,
+    `pred_movies` and `load_movie_titles`) over randomly drawn favourite-movie lists, either
+    on the data shipped in `resources/` or on a synthetic MovieLens-scale
+    dataset. For every entry point the first (cold) call is reported
+    separately from the warm calls, along with latency percentiles,
+    throughput and peak traced memory. The result cache is turned off, so
+    that every call computes its recommendations. Results are written as
+    JSON so that runs made before and after a change can be compared
+    offline.
+
+    Usage (from the root of this repository):
+
+        python -m benchmarks.run_benchmarks
+        python -m benchmarks.run_benchmarks --scale 1m --output after.json
+        python -m benchmarks.run_benchmarks --compare before.json after.json
+
+"""
+import argparse
+import datetime
+import json
+import os
+import pickle
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+from benchmarks.synthetic_data import generate_dataset, SCALES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_ROOT, 'benchmarks', 'results')
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def train_svd(ratings_path, model_path, n_factors=50, n_epochs=5):
+    """Train and pickle a small surprise SVD for a synthetic dataset."""
+    import pandas as pd
+    from surprise import SVD, Reader, Dataset
+    ratings = pd.read_csv(ratings_path, usecols=['userId', 'movieId', 'rating'])
+    data = Dataset.load_from_df(ratings, Reader(rating_scale=(0.5, 5.0)))
+    model = SVD(n_factors=n_factors, n_epochs=n_epochs, random_state=42)
+    model.fit(data.build_full_trainset())
+    with open(model_path, 'wb') as f:
+        pickle.dump(model, f)
+
+
+def prepare_synthetic(scale, workdir, n_factors, n_epochs):
+    """Lay out a synthetic dataset and model the way `resources/` is."""
+    data_dir = os.path.join(workdir, 'resources', 'data')
+    model_dir = os.path.join(workdir, 'resources', 'models')
+    os.makedirs(model_dir, exist_ok=True)
+    if not os.path.exists(os.path.join(data_dir, 'ratings.csv')):
+        generate_dataset(data_dir, scale)
+    model_path = os.path.join(model_dir, 'SVD.pkl')
+    if not os.path.exists(model_path):
+        train_svd(os.path.join(data_dir, 'ratings.csv'), model_path,
+                  n_factors, n_epochs)
+
+
+def measure(fn, calls, setup=None):
+    """Benchmark `fn` over a list of argument tuples.
+
+    The first call is timed (and traced) on its own as the cold call; the
+    remaining calls are timed individually without tracing, then one more
+    call is traced to record the warm peak memory.
+
+    Returns
+    -------
+    dict
+        Timings in seconds and peak traced memory in MiB.
+
+    """
+    def run(args):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        fn(*args)
+        return time.perf_counter() - start
+
+    tracemalloc.start()
+    cold = run(calls[0])
+    cold_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    timings = np.array([run(args) for args in calls[1:]])
+
+    tracemalloc.start()
+    run(calls[-1])
+    warm_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        'calls': len(timings),
+        'cold_s': cold,
+        'mean_s': float(timings.mean()),
+        'p50_s': float(np.percentile(timings, 50)),
+        'p95_s': float(np.percentile(timings, 95)),
+        'max_s': float(timings.max()),
+        'throughput_per_s': float(len(timings) / timings.sum()),
+        'cold_peak_mib': cold_peak / 2 ** 20,
+        'warm_peak_mib': warm_peak / 2 ** 20,
+    }
+
+
+def run_benchmarks(repeats=50, seed=42, cases=None):
+    """Benchmark the entry points on the data under the working directory.
+
+    Parameters
+    ----------
+    repeats : int
+        Number of warm calls per entry point.
+    seed : int
+        Seed used to draw favourite-movie lists.
+    cases : list (str), optional
+        Entry points to run. Defaults to all of them.
+
+    Returns
+    -------
+    dict
+        Results per entry point.
+
+    """
+    # Timings must be of computed recommendations, not of result cache hits
+    os.environ['RECOMMENDER_RESULT_CACHE'] = '0'
+    from recommenders import collaborative_based, content_based, hybrid_based, model_versions
+    from utils import catalogue as catalogue_module
+    from utils.data_loader import load_movie_titles
+    from utils.ratings_store import load_ratings_store
+
+    movies_path = catalogue_module.MOVIES_PATH
+    catalogue = catalogue_module.load_catalogue(movies_path)
+    store = load_ratings_store()
+    # Favourites are movies covered by the content model that have ratings
+    rows = np.arange(min(len(catalogue), content_based.SUBSET_SIZE or len(catalogue)))
+    rows = rows[np.isin(catalogue.movie_ids[rows], store.item_ids)]
+    rng = np.random.default_rng(seed)
+    favourites = [catalogue.titles_for(rng.choice(rows, 3, replace=False))
+                  for _ in range(repeats + 1)]
+    favourite_ids = [[catalogue.movie_id(title) for title in titles]
+                     for titles in favourites]
+
+    has_model = os.path.exists(collaborative_based.MODEL_PATH) \
+        or model_versions.current_version() is not None
+    available = {
+        'load_movie_titles': (load_movie_titles, [(movies_path,)] * (repeats + 1),
+                              catalogue_module._load_catalogue.cache_clear),
+        'content_model': (content_based.content_model,
+                          [(titles, 10) for titles in favourites], None),
+        'prediction_item': (collaborative_based.prediction_item,
+                            [(ids[0],) for ids in favourite_ids], None),
+        'pred_movies': (collaborative_based.pred_movies,
+                        [(ids,) for ids in favourite_ids], None),
+        'collab_model': (collaborative_based.collab_model,
+                         [(titles, 10) for titles in favourites], None),
+        'hybrid_model': (hybrid_based.hybrid_model,
+                         [(titles, 10) for titles in favourites], None),
+    }
+    results = {}
+    for name in cases or list(available):
+        fn, calls, setup = available[name]
+        if name != 'load_movie_titles' and name != 'content_model' and not has_model:
+            results[name] = {'skipped': f"no model at {collaborative_based.MODEL_PATH}"}
+            continue
+        results[name] = measure(fn, calls, setup)
+        print(f"{name:>18}: cold {results[name]['cold_s'] * 1e3:9.2f} ms, "
+              f"p50 {results[name]['p50_s'] * 1e3:8.3f} ms, "
+              f"p95 {results[name]['p95_s'] * 1e3:8.3f} ms, "
+              f"{results[name]['throughput_per_s']:9.1f} calls/s, "
+              f"peak {results[name]['warm_peak_mib']:8.2f} MiB", file=sys.stderr)
+    return results
+
+
+def compare(before_path, after_path, tolerance=0.1):
+    """Print the change of each metric between two result files.
+
+    Returns
+    -------
+    bool
+        Whether any latency or memory metric regressed by more than
+        `tolerance` (a fraction).
+
+    """
+    with open(before_path) as f:
+        before = json.load(f)['results']
+    with open(after_path) as f:
+        after = json.load(f)['results']
+    regressed = False
+    metrics = ['cold_s', 'p50_s', 'p95_s', 'warm_peak_mib']
+    for name in sorted(set(before) & set(after)):
+        for metric in metrics:
+            old, new = before[name].get(metric), after[name].get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            flag = ''
+            if change > tolerance:
+                flag, regressed = '  REGRESSION', True
+            print(f"{name:>18} {metric:>14}: {old:12.6g} -> {new:12.6g} "
+                  f"({change:+7.1%}){flag}")
+    return regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmark the recommender entry points.')
+    parser.add_argument('--scale', choices=sorted(SCALES),
+                        help='Benchmark on synthetic data of this scale '
+                             'instead of the data in resources/.')
+    parser.add_argument('--workdir', help='Where to keep synthetic data and '
+                        'models between runs (default: a temporary directory).')
+    parser.add_argument('--repeats', type=int, default=50)
+    parser.add_argument('--cases', nargs='+')
+    parser.add_argument('--svd-factors', type=int, default=50)
+    parser.add_argument('--svd-epochs', type=int, default=5)
+    parser.add_argument('--output', help='Result file (default: '
+                        'benchmarks/results/<timestamp>.json).')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'))
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        return 1 if compare(*args.compare, tolerance=args.tolerance) else 0
+
+    output = os.path.abspath(args.output or os.path.join(
+        RESULTS_DIR, datetime.datetime.now().strftime('%Y%m%d-%H%M%S') + '.json'))
+    workdir = REPO_ROOT
+    if args.scale:
+        workdir = args.workdir or tempfile.mkdtemp(prefix=f'bench-{args.scale}-')
+        prepare_synthetic(args.scale, workdir, args.svd_factors, args.svd_epochs)
+    # Every resource path is relative to the working directory
+    os.chdir(workdir)
+
+    started = time.time()
+    results = run_benchmarks(args.repeats, cases=args.cases)
+    report = {
+        'meta': {
+            'created': datetime.datetime.now().isoformat(timespec='seconds'),
+            'commit': _git_commit(),
+            'dataset': args.scale or 'resources',
+            'repeats': args.repeats,
+            'duration_s': time.time() - started,
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'results': results,
+    }
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to: {output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
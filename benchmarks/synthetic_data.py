@@ -0,0 +1,178 @@
+"""
+
+    Synthetic MovieLens-scale data generator.
+
+    Author: Explore Data Science Academy.
+
+    Description: Writes `movies.csv` and `ratings.csv` files with the same
+    columns as the MovieLens data in `resources/data/`, at a configurable
+    scale. User activity and movie popularity follow long-tailed (Zipf-like)
+    distributions and ratings are half-star values drawn around per-user and
+    per-movie biases, so sparsity patterns resemble the real dataset.
+    Ratings are generated and written in bounded chunks, so even the 25M
+    scale never holds the full table in memory.
+
+    Usage (from the root of this repository):
+
+        python -m benchmarks.synthetic_data --scale 1m --output /tmp/ml-1m
+
+"""
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+GENRES = ['Action', 'Adventure', 'Animation', 'Children', 'Comedy', 'Crime',
+          'Documentary', 'Drama', 'Fantasy', 'Film-Noir', 'Horror', 'IMAX',
+          'Musical', 'Mystery', 'Romance', 'Sci-Fi', 'Thriller', 'War',
+          'Western']
+
+# (users, movies, ratings) of the MovieLens releases each scale mirrors
+SCALES = {
+    '100k': (671, 9066, 100004),
+    '1m': (6040, 3706, 1000209),
+    '10m': (71567, 10681, 10000054),
+    '25m': (162541, 62423, 25000095),
+}
+
+
+def generate_movies(n_movies, rng):
+    """Movie records with unique titles and one to four genres each."""
+    years = rng.integers(1920, 2020, size=n_movies)
+    n_genres = rng.integers(1, 5, size=n_movies)
+    genre_ids = rng.random((n_movies, len(GENRES))).argsort(axis=1)
+    genres = ['|'.join(sorted(GENRES[g] for g in row[:k]))
+              for row, k in zip(genre_ids, n_genres)]
+    return pd.DataFrame({
+        'movieId': np.arange(1, n_movies + 1, dtype=np.int32),
+        'title': [f"Synthetic Movie {i} ({year})"
+                  for i, year in enumerate(years, start=1)],
+        'genres': genres,
+    })
+
+
+def _zipf_weights(n, exponent, rng):
+    weights = 1. / np.arange(1, n + 1) ** exponent
+    rng.shuffle(weights)
+    return weights / weights.sum()
+
+
+def _draw_pairs(per_user, start, stop, n_movies, popularity, rng, rounds=8):
+    """Distinct (user, movie) pairs, encoded as user * n_movies + movie,
+    for the users in [start, stop)."""
+    users = np.arange(start, stop, dtype=np.int64)
+    needed = per_user[start:stop].copy()
+    pairs = np.empty(0, dtype=np.int64)
+    for attempt in range(rounds):
+        # Popular movies are more likely to be rated; later rounds draw
+        # uniformly to fill in heavy users' remaining movies quickly
+        weights = popularity if attempt < 2 else None
+        movie_ids = rng.choice(n_movies, size=needed.sum(), p=weights)
+        pairs = np.union1d(pairs, np.repeat(users, needed) * n_movies + movie_ids)
+        needed = per_user[start:stop] - np.bincount(
+            pairs // n_movies - start, minlength=stop - start)
+        if not needed.any():
+            break
+    return pairs
+
+
+def generate_ratings(n_users, n_movies, n_ratings, path, rng,
+                     chunk_size=1_000_000):
+    """Write about `n_ratings` synthetic ratings to `path`, generating at
+    most `chunk_size` rows at a time.
+
+    Every user rates at least one movie and rates each movie at most once.
+    Movies are redrawn when a user draws one twice, for a bounded number of
+    rounds, so marginally fewer than `n_ratings` rows may be written.
+
+    Returns
+    -------
+    int
+        Number of ratings written.
+
+    """
+    # Ratings per user, long-tailed with at least one rating each
+    activity = _zipf_weights(n_users, 0.8, rng)
+    per_user = 1 + rng.multinomial(n_ratings - n_users, activity)
+    # Nobody rates more movies than exist; hand the excess to other users
+    excess = np.maximum(per_user - n_movies, 0).sum()
+    while excess and (per_user < n_movies).any():
+        per_user = np.minimum(per_user, n_movies)
+        open_users = per_user < n_movies
+        weights = np.where(open_users, activity, 0.)
+        per_user += rng.multinomial(excess, weights / weights.sum())
+        excess = np.maximum(per_user - n_movies, 0).sum()
+    per_user = np.minimum(per_user, n_movies)
+    popularity = _zipf_weights(n_movies, 1.0, rng)
+    user_bias = rng.normal(0, 0.4, size=n_users)
+    movie_bias = rng.normal(0, 0.5, size=n_movies)
+    timestamp = 946684800
+    written = 0
+
+    with open(path, 'w') as f:
+        f.write('userId,movieId,rating,timestamp\n')
+        user = 0
+        while user < n_users:
+            # Gather whole users until the chunk is full
+            stop = user + 1
+            total = per_user[user]
+            while stop < n_users and total + per_user[stop] <= chunk_size:
+                total += per_user[stop]
+                stop += 1
+            pairs = _draw_pairs(per_user, user, stop, n_movies, popularity, rng)
+            user_ids = (pairs // n_movies).astype(np.int32)
+            movie_ids = (pairs % n_movies).astype(np.int32)
+            raw = 3.5 + user_bias[user_ids] + movie_bias[movie_ids] \
+                + rng.normal(0, 0.8, size=len(user_ids))
+            ratings = np.clip(np.round(raw * 2) / 2, 0.5, 5.0)
+            timestamps = timestamp + np.cumsum(
+                rng.integers(1, 600, size=len(user_ids)))
+            timestamp = int(timestamps[-1])
+            pd.DataFrame({'userId': user_ids + 1, 'movieId': movie_ids + 1,
+                          'rating': ratings, 'timestamp': timestamps}) \
+                .to_csv(f, header=False, index=False, float_format='%.1f')
+            written += len(user_ids)
+            user = stop
+    return written
+
+
+def generate_dataset(output_dir, scale='100k', seed=42, chunk_size=1_000_000):
+    """Write `movies.csv` and `ratings.csv` for a scale into `output_dir`.
+
+    Parameters
+    ----------
+    output_dir : str
+        Directory to write the files to; created if missing.
+    scale : str or tuple
+        Name of a preset in `SCALES`, or (users, movies, ratings).
+    seed : int
+        Seed of the random generator.
+    chunk_size : int
+        Maximum number of ratings generated at once.
+
+    Returns
+    -------
+    dict
+        Numbers of users, movies and ratings written.
+
+    """
+    n_users, n_movies, n_ratings = SCALES[scale] if isinstance(scale, str) else scale
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    generate_movies(n_movies, rng).to_csv(
+        os.path.join(output_dir, 'movies.csv'), index=False)
+    n_ratings = generate_ratings(n_users, n_movies, n_ratings,
+                                 os.path.join(output_dir, 'ratings.csv'),
+                                 rng, chunk_size)
+    return {'users': n_users, 'movies': n_movies, 'ratings': n_ratings}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1].strip())
+    parser.add_argument('--scale', default='100k', choices=sorted(SCALES))
+    parser.add_argument('--output', required=True)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    sizes = generate_dataset(args.output, args.scale, args.seed)
+    print(f"Generated {sizes['ratings']} ratings by {sizes['users']} users "
+          f"of {sizes['movies']} movies in: {args.output}")
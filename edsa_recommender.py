@@ -33,24 +33,147 @@ import streamlit.components.v1 as components
 # Data handling dependencies
 import pandas as pd
 import numpy as np
-import base64
+import io
+import matplotlib.pyplot as plt
 
 # Custom Libraries
 from utils.data_loader import load_movie_titles
-from recommenders.collaborative_based import collab_model
-from recommenders.content_based import content_model
-from PIL import Image 
+from recommenders import collaborative_based, content_based, hybrid_based
+from utils import eda_aggregates, profiling, resources, static_assets, title_search
 import plotly.express as px
 
+# Maximum number of distinct recommendation results kept in memory
+RESULT_CACHE_SIZE = 1024
+# Number of search matches offered by a favourite-movie picker
+SEARCH_RESULTS = 50
+
+@st.cache_resource(show_spinner=False)
+def cached_movie_titles(path_to_movies):
+    return load_movie_titles(path_to_movies)
+
+@st.cache_data(max_entries=RESULT_CACHE_SIZE, show_spinner=False)
+def recommend(algorithm, favourite_movies, top_n, model_version=None,
+              content_weight=None):
+    """Memoised recommendations, keyed by (algorithm, favourite movies,
+    top_n, model version, content weight). The least recently used results
+    are evicted first, and publishing a new model version or rebuilding the
+    content index starts a fresh set. Each engine loads only the datasets
+    and models it uses, once per server process."""
+    if algorithm == 'content':
+        return content_based.content_model(list(favourite_movies), top_n)
+    if algorithm == 'hybrid':
+        return hybrid_based.hybrid_model(list(favourite_movies), top_n,
+                                         content_weight, 1 - content_weight)
+    return collaborative_based.collab_model(list(favourite_movies), top_n)
+
+def content_model(movie_list, top_n=10):
+    return recommend('content', tuple(movie_list), top_n,
+                     content_based.model_version())
+
+def collab_model(movie_list, top_n=10):
+    return recommend('collaborative', tuple(movie_list), top_n,
+                     collaborative_based.model_version())
+
+def hybrid_model(movie_list, top_n=10, content_weight=hybrid_based.CONTENT_WEIGHT):
+    return recommend('hybrid', tuple(movie_list), top_n,
+                     (content_based.model_version(), collaborative_based.model_version()),
+                     content_weight)
+
+def render_debug_panel(n_traces=5):
+    """Sidebar table of the stage timings of the latest recommendations
+    computed by this server process."""
+    traces = profiling.recent_traces()[:n_traces]
+    if not traces:
+        st.sidebar.caption('No recommendations have been computed yet.')
+    for trace in traces:
+        st.sidebar.write(f"**{trace['name']}**: {trace['total_ms']:.1f} ms, "
+                         f"peak memory {trace['peak_rss_mb']} MB")
+        spans = pd.DataFrame(trace['spans'], columns=['name', 'depth', 'ms',
+                                                      'rss_mb', 'rss_delta_mb'])
+        spans['name'] = [' ' * 4 * depth + name
+                         for name, depth in zip(spans['name'], spans['depth'])]
+        st.sidebar.dataframe(spans.drop(columns='depth'), hide_index=True)
+
+def favourite_picker(label, default_options):
+    """Selectbox of a favourite movie, over the search matches of a typed
+    query, or over `default_options` while nothing has been typed. Only the
+    matches are sent to the browser, never the whole catalogue."""
+    query = st.text_input(f'Search titles for the {label.lower()}',
+                          placeholder='Type part of a title')
+    options = default_options
+    if query.strip():
+        matches = title_search.load_title_search().search(query, SEARCH_RESULTS)
+        if matches:
+            options = matches
+        else:
+            st.caption(f'No titles match "{query}".')
+    return st.selectbox(label, options)
+
+@st.cache_resource(show_spinner=False)
+def eda_figures(version):
+    """Figures and tables of the EDA page, built from the precomputed
+    aggregates once per `version` and shared by every session."""
+    _, tables = eda_aggregates.load_aggregates()
+    fig_top_directors = px.bar(tables['top_directors'], x='Number of Movies Released',
+                               y='Directors', orientation='h')
+    fig_top_directors.update_traces(marker_color='green',  # Change the bar color
+                  textfont_color='black',  # Change the label text color
+                  hovertemplate='<b>Directors : %{y}</b><br><b>Number of Movies Released: %{x}</b>',  # Change the tooltip text
+                  selector=dict(type='bar'))  # Select only the bar traces
+
+    # Pie chart of the genres, rendered once to a PNG image. Only slices
+    # above 1% of the ratings are labelled.
+    labels = tables['genre_counts']['Genre']
+    sizes = tables['genre_counts']['No of ratings']
+    threshold = sum(sizes) * 0.01
+    labels_selected = [n if v > threshold else '' for n, v in zip(labels, sizes)]
+    fig1, ax1 = plt.subplots()
+    ax1.pie(sizes, labels=labels_selected, autopct=lambda x: '{:2.0f}%'.format(x) if x > 1 else '',
+            shadow=False, startangle=0)
+    ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
+    genre_pie = io.BytesIO()
+    fig1.savefig(genre_pie, format='png', bbox_inches='tight')
+    plt.close(fig1)
+
+    return {'top_directors': fig_top_directors,
+            'luc_besson_movies': tables['luc_besson_movies'],
+            'genre_pie': genre_pie.getvalue(),
+            'top_drama': tables['top_drama']}
+
+@st.cache_resource(show_spinner=False)
+def build_static_assets():
+    """Bring the static copies of the app images up to date, once per
+    server process."""
+    static_assets.build_static_assets()
+
+def set_background(image):
+    """Use an image of `resources/imgs/` as the page background. The image
+    is referenced by its static URL, so the browser downloads it once and
+    caches it."""
+    st.markdown(f"""
+        <style>
+        [data-testid="stAppViewContainer"] > .main {{
+        background-image: url("{static_assets.static_url(image)}");
+        background-size: 100%;
+        background-position: center;
+        background-repeat: no-repeat;
+        background-attachment: fixed;
+        }}
+        </style>
+        """, unsafe_allow_html=True)
+
 # Data Loading
-title_list = load_movie_titles('resources/data/movies.csv')
+build_static_assets()
+title_list = cached_movie_titles('resources/data/movies.csv')
+# Load the recommender models in the background while the first page renders
+resources.warm_up()
 
 # App declaration
 def main():
 
     # DO NOT REMOVE the 'Recommender System' option below, however,
     # you are welcome to add more options to enrich your app.
-    page_options = ["Welcome","About Us","Uncovering Patterns of Movie Data", "Recommender System","Solution Overview", "Coming Soon"]
+    page_options = ["Welcome","About Us","Uncovering Patterns of Movie Data", "Recommender System","Hybrid Recommender","Solution Overview", "Coming Soon"]
 
     # -------------------------------------------------------------------
     # ----------- !! THIS CODE MUST NOT BE ALTERED !! -------------------
@@ -68,9 +191,9 @@ def main():
 
         # User-based preferences
         st.write('### Enter Your Three Favorite Movies')
-        movie_1 = st.selectbox('Fisrt Option',title_list[14930:15200])
-        movie_2 = st.selectbox('Second Option',title_list[25055:25255])
-        movie_3 = st.selectbox('Third Option',title_list[21100:21200])
+        movie_1 = favourite_picker('Fisrt Option',title_list[14930:15200])
+        movie_2 = favourite_picker('Second Option',title_list[25055:25255])
+        movie_3 = favourite_picker('Third Option',title_list[21100:21200])
         fav_movies = [movie_1,movie_2,movie_3]
 
         # Perform top-10 movie recommendation generation
@@ -105,30 +228,36 @@ def main():
     # -------------------------------------------------------------------
 
     # ------------- SAFE FOR ALTERING/EXTENSION -------------------
-    if page_selection == "Solution Overview":
-        @st.cache_data
-        #st.title("Solution Overview")  
-        def get_img_as_base64(file):
-            with open(file, "rb") as f:
-                data = f.read()
-            return base64.b64encode(data).decode()
+    if page_selection == "Hybrid Recommender":
+        st.write('# Hybrid Movie Recommender')
+        st.write('Blends content similarity with the latent taste factors '
+                 'learnt from ratings, in a single pass.')
+        content_weight = st.slider('Weight of content similarity', 0.0, 1.0,
+                                   hybrid_based.CONTENT_WEIGHT, 0.05,
+                                   help='0 ranks by latent factors only, '
+                                        '1 by content similarity only.')
 
+        st.write('### Enter Your Three Favorite Movies')
+        movie_1 = favourite_picker('Fisrt Option',title_list[14930:15200])
+        movie_2 = favourite_picker('Second Option',title_list[25055:25255])
+        movie_3 = favourite_picker('Third Option',title_list[21100:21200])
+        fav_movies = [movie_1,movie_2,movie_3]
 
-        img2 = get_img_as_base64("resources/imgs/bgimg2.png")
+        if st.button("Recommend"):
+            try:
+                with st.spinner('Crunching the numbers...'):
+                    top_recommendations = hybrid_model(movie_list=fav_movies,
+                                                       top_n=10,
+                                                       content_weight=content_weight)
+                st.title("We think you'll like:")
+                for i,j in enumerate(top_recommendations):
+                    st.subheader(str(i+1)+'. '+j)
+            except:
+                st.error("Oops! Looks like this algorithm does't work.\
+                          We'll need to fix it!")
 
-        page_bg_img = f"""
-        <style>
-        [data-testid="stAppViewContainer"] > .main {{
-        background-image: url("data:image/png;base64,{img2}");
-        background-size: 100%;
-        background-position: center;
-        background-repeat: no-repeat;
-        background-attachment: fixed;
-        }}
-        </style>
-        """
-
-        st.markdown(page_bg_img, unsafe_allow_html=True)
+    if page_selection == "Solution Overview":
+        set_background('bgimg2.png')
         st.title("Solution Overview")
 
         st.write("At CineAI, we have developed an exceptional solution that redefines how movies are recommended to you. Our advanced recommender systems combine the power of content-based filtering, collaborative filtering, and the Singular Value Decomposition (SVD) model to deliver accurate and personalized movie suggestions, perfectly tailored to your unique preferences.")
@@ -142,8 +271,7 @@ def main():
         st.write("Singular Value Decomposition (SVD) Model:")
         st.write("Incorporating the SVD model, our solution digs even deeper into your movie-watching history. This mathematical technique helps uncover latent factors that influence your movie preferences, revealing subtle patterns that may not be obvious through traditional methods. The SVD model allows us to make precise predictions on how you'll rate movies you haven't seen, enhancing the accuracy of our recommendations.")
 
-        image = Image.open("resources/imgs/AI human interact.png")
-        st.image(image, width=150)
+        st.image(static_assets.static_url("AI human interact.png"), width=150)
 
         st.write("The magic of our solution lies in how we seamlessly blend these three techniques to provide you with a comprehensive and highly personalized movie-watching experience. Our solution continuously learns and adapts as you interact with it, refining its recommendations over time. The more you use our platform, the better it understands your unique tastes, making each movie recommendation even more accurate and enjoyable.")
         st.write("By implementing our solution, businesses can boost user engagement, drive customer satisfaction, and increase platform affinity. For users, our solution opens the doors to a treasure trove of movies that perfectly match their interests, making their movie-watching experience more delightful and fulfilling.")
@@ -164,28 +292,7 @@ def main():
     # You may want to add more sections here for aspects such as an EDA,
     # or to provide your business pitch.
     if page_selection == "About Us":
-        @st.cache_data
-        def get_img_as_base64(file):
-            with open(file, "rb") as f:
-                data = f.read()
-            return base64.b64encode(data).decode()
-
-
-        img1 = get_img_as_base64("resources/imgs/bgimg1.gif")
-
-        page_bg_img = f"""
-        <style>
-        [data-testid="stAppViewContainer"] > .main {{
-        background-image: url("data:image/png;base64,{img1}");
-        background-size: 100%;
-        background-position: center;
-        background-repeat: no-repeat;
-        background-attachment: fixed;
-        }}
-        </style>
-        """
-
-        st.markdown(page_bg_img, unsafe_allow_html=True)
+        set_background('bgimg1.gif')
         st.title("About Us")
         #image = Image.open("filmstrip.png")
         #st.image(image)
@@ -195,9 +302,9 @@ def main():
 
         st.subheader("Meet the team")
 
-        imi = Image.open("resources/imgs/imi1.png")
-        renei = Image.open("resources/imgs/reneilwe1.png")
-        olwe = Image.open("resources/imgs/olwethu1.png")
+        imi = static_assets.static_url('imi1.png')
+        renei = static_assets.static_url('reneilwe1.png')
+        olwe = static_assets.static_url('olwethu1.png')
 
         col1, col2, col3 = st.columns(3)
 
@@ -216,10 +323,10 @@ def main():
             st.write("Olwethu Magadla")
             st.write("Data Engineer")
 
-        baart = Image.open("resources/imgs/baartman1.png")
-        anto = Image.open("resources/imgs/antonia1.png")
-        judy = Image.open("resources/imgs/judy1.png")
-        thato = Image.open("resources/imgs/thato1.png")
+        baart = static_assets.static_url('baartman1.png')
+        anto = static_assets.static_url('antonia1.png')
+        judy = static_assets.static_url('judy1.png')
+        thato = static_assets.static_url('thato1.png')
 
         col1, col2, col3 = st.columns(3)
 
@@ -252,124 +359,36 @@ def main():
         st.write("Discover incredible films that resonate with you, uncover hidden gems, and immerse yourself in a world of captivating storytelling. At CineAI, we are here to transform your movie experience and bring you closer to the movies you love.")
         st.write("Welcome to CineAI, where movies and AI converge to create an enchanting world of cinematic discovery.")
 
-        image = Image.open("resources/imgs/cineai Logo.png")
-        st.image(image, width=250, caption="Powered by: CineAI")
+        st.image(static_assets.static_url("cineai Logo.png"), width=250, caption="Powered by: CineAI")
         
     if page_selection == "Uncovering Patterns of Movie Data":
         st.title("Uncovering Patterns of Movie Data")
-        #st.markdown('<h3 style="text-align: center;">Number of Movies Released Each Year(from 1990)</h3>', unsafe_allow_html=True)
-        #filtered_df = pd.read_csv('resources/data/movies_year_summary.csv')
-        #st.line_chart(data=filtered_df , x='Year', y='Number of Movies', use_container_width=True)
-        #st.line_chart(data=year_counts , width=12, height= 6, use_container_width=True)'''
-
-        #st.markdown('<h3 style="text-align: center;">Top Ten Directors with Most Rated Movies</h3>', unsafe_allow_html=True)
-        top_directors_df = pd.read_csv("resources/data/top_10_directors_most_rated_movies.csv")
-        #st.bar_chart(top_directors_df, x = 'Number of Movies Released', y = 'Directors') 
+        # Figures are built once per version of the aggregated data
+        figures = eda_figures(eda_aggregates.source_version())
 
         #Top Ten Directors
         st.markdown("""<h3 style="text-align: center;">Top Ten Directors with Most Released Movies</h3><p style="text-align: center;"></p>""", unsafe_allow_html=True)
-        fig_top_directors=px.bar(top_directors_df,x='Number of Movies Released',y='Directors', orientation='h')
-        fig_top_directors.update_traces(marker_color='green',  # Change the bar color
-                      textfont_color='black',  # Change the label text color
-                      hovertemplate='<b>Directors : %{y}</b><br><b>Number of Movies Released: %{x}</b>',  # Change the tooltip text
-                      selector=dict(type='bar'))  # Select only the bar traces
-        st.write(fig_top_directors)
+        st.plotly_chart(figures['top_directors'])
 
         st.markdown('<h3 style="text-align: center;">Top 5 Movies Directed by Luc Besson</h3>', unsafe_allow_html=True)
-        movie_ratings_df = pd.read_csv("resources/data/luc_besson_movies.csv")
-        st.bar_chart(movie_ratings_df, x = 'Movie Titles', y = 'Ratings') 
-
-       
-        genre_df = pd.read_csv('resources/data/genrecount.csv')
-        #st.bar_chart(data=None, *, x=None, y=None, width=0, height=0, use_container_width=True)
-        #st.bar_chart(genre_df, x = 'Genre', y = 'No of ratings')
-        #This section is for a pie chart 
-        #import streamlit as st
-        import matplotlib.pyplot as plt
+        st.bar_chart(figures['luc_besson_movies'], x = 'Movie Titles', y = 'Ratings')
 
-        
-        # Pie chart, where the slices will be ordered and plotted counter-clockwise:
-        
         # Use Markdown syntax with CSS styling for the subheader
         st.markdown('<h3 style="text-align: center;">Distribution of Movie Genres</h3>', unsafe_allow_html=True)
-
-        # Rest of your Streamlit app code
-
-        #st.subheader("Distribution of Movie Genres")
-        labels = genre_df['Genre']
-        sizes = genre_df['No of ratings']
-        #explode = (0, 0.1, 0, 0)  # only "explode" the 2nd slice (i.e. 'Hogs')
-        
-        # Determine the threshold for displaying labels
-        threshold = sum(sizes) * 0.01
-
-        # Create a list of labels with a condition to display only for sizes above the threshold
-        labels_selected = [n if v > threshold else '' for n, v in zip(labels, sizes)]
-
-        fig1, ax1 = plt.subplots()
-        ax1.pie(sizes, labels=labels_selected, autopct=lambda x: '{:2.0f}%'.format(x) if x > 1 else '',
-                shadow=False, startangle=0)
-        ax1.axis('equal')  # Equal aspect ratio ensures that pie is drawn as a circle.
-
-        st.pyplot(fig1)
-        
-        #with st.expander("See explanation"):
-           # st.write(\"\"\"
-                #The chart above shows some numbers I picked for you.
-                #I #rolled actual dice for these, so they're *guaranteed* to
-                #be random.
-            #\"\"\")'''
-        
+        st.image(figures['genre_pie'])
 
         st.markdown('<h3 style="text-align: center;">Top Ten High Rated Movies in Drama Genre</h3>', unsafe_allow_html=True)
-        titles_df = pd.read_csv('resources/data/topdrama_titles.csv')
-        st.bar_chart(titles_df, x = 'Movie Title', y = 'Rating')
+        st.bar_chart(figures['top_drama'], x = 'Movie Title', y = 'Rating')
 
     if page_selection == "Welcome":
-          @st.cache_data
-          def get_img_as_base64(file):
-            with open(file, "rb") as f:
-                data = f.read()
-            return base64.b64encode(data).decode()
-          img = get_img_as_base64("resources/imgs/tv-screens2.png")
-          page_bg_img = f"""
-        <style>
-        [data-testid="stAppViewContainer"] > .main {{
-        background-image: url("data:image/png;base64,{img}");
-        background-size: 100%;
-        background-position: center;
-        background-repeat: no-repeat;
-        background-attachment: fixed;
-        }}
-        </style>
-        """
-          st.markdown(page_bg_img, unsafe_allow_html=True)
+          set_background('tv-screens2.png')
           st.title("Welcome to CineAI")
           st.subheader("Synchronizing Cinema with Artificial Intelligence")
           st.write("Elevate Your Movie Experience with Cutting-Edge AI Innovation!")
     if page_selection == "Coming Soon":
-        @st.cache_data
-        def get_img_as_base64(file):
-            with open(file, "rb") as f:
-                data = f.read()
-            return base64.b64encode(data).decode()
-
-
-        img3 = get_img_as_base64("resources/imgs/bgimg3.gif")
-
-        page_bg_img = f"""
-        <style>
-        [data-testid="stAppViewContainer"] > .main {{
-        background-image: url("data:image/png;base64,{img3}");
-        background-size: 100%;
-        background-position: center;
-        background-repeat: no-repeat;
-        background-attachment: fixed;
-        }}
-        </style>
-        """
-
-        st.markdown(page_bg_img, unsafe_allow_html=True)
+        # The animated background meant for this page (bgimg3.gif) was
+        # never added, so it shares the About Us one
+        set_background('bgimg1.gif')
         st.title("Coming Soon")
         st.write("Check out what the upcoming movie releases are and set a date to watch your most anticipated movie releases.")
 
@@ -378,6 +397,9 @@ def main():
         if st.button('Go to Upcoming Releases'):
             components.iframe("https://www.ign.com/upcoming/movies", height=800, scrolling=True)  # Current tab
         
+    # Per-stage timings, for diagnosing slow recommendations
+    if profiling.enabled() and st.sidebar.checkbox('Show debug timings'):
+        render_debug_panel()
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,240 @@
+"""
+
+    Approximate nearest-neighbour index over SVD item factors.
+
+    Author: Explore Data Science Academy.
+
+    Description: Random-projection locality-sensitive hashing (LSH) for
+    cosine similarity between latent item vectors, written in NumPy. Each
+    of `n_tables` hash tables assigns every item an `n_bits` code made of
+    the signs of its projections onto random hyperplanes; items sharing a
+    code share a bucket. A query gathers the items of its own bucket and of
+    the `n_probes` neighbouring buckets (its least certain bits flipped) in
+    every table, then ranks only those candidates exactly. More tables and
+    probes raise recall at the cost of query time, and `recall_report`
+    measures that trade-off against exact search.
+
+    The index is built when the SVD model is trained and saved next to it;
+    see `resources/models/train_colbased.py`.
+
+    Usage (from the root of this repository):
+
+        python -m recommenders.ann
+
+"""
+# Script dependencies
+import time
+import numpy as np
+from recommenders.ranking import top_k
+
+
+class LSHIndex:
+    """Multi-table random-projection LSH index for cosine similarity.
+
+    Parameters
+    ----------
+    vectors : np.ndarray, shape (n_items, dim)
+        Item vectors; normalised to unit length when indexed.
+    item_ids : np.ndarray
+        Raw id of each item, aligned with `vectors`.
+    n_tables : int
+        Number of independent hash tables.
+    n_bits : int, optional
+        Bits per hash code. Defaults to about log2(n_items / 8), which
+        puts roughly eight items in each bucket.
+    seed : int
+        Seed of the random hyperplanes.
+
+    """
+
+    def __init__(self, vectors, item_ids, n_tables=16, n_bits=None, seed=42,
+                 _planes=None, _order=None, _codes=None):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        self.vectors = vectors / np.where(norms > 0, norms, 1)
+        self.item_ids = np.asarray(item_ids)
+        self._id_rows = {item_id: row for row, item_id
+                         in enumerate(self.item_ids.tolist())}
+        if _planes is not None:
+            self.planes, self.order, self.codes = _planes, _order, _codes
+            return
+        n_items, dim = self.vectors.shape
+        if n_bits is None:
+            n_bits = int(np.clip(np.round(np.log2(max(n_items, 2) / 8)), 1, 30))
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((n_tables, n_bits, dim)).astype(np.float32)
+        codes = self._hash(self.vectors)
+        # Items of each table sorted by code, so buckets are contiguous
+        self.order = np.argsort(codes, axis=1, kind='stable').astype(np.int32)
+        self.codes = np.take_along_axis(codes, self.order, axis=1)
+
+    @property
+    def n_tables(self):
+        return self.planes.shape[0]
+
+    @property
+    def n_bits(self):
+        return self.planes.shape[1]
+
+    def __len__(self):
+        return len(self.item_ids)
+
+    def _projections(self, vectors):
+        """Projections of (n, dim) vectors, shape (n_tables, n_bits, n)."""
+        return np.einsum('tbd,nd->tbn', self.planes, vectors)
+
+    def _hash(self, vectors):
+        bits = self._projections(vectors) > 0
+        weights = (1 << np.arange(self.n_bits, dtype=np.int64))[None, :, None]
+        return (bits * weights).sum(axis=1)
+
+    def row(self, item_id):
+        """Row of a raw item id."""
+        try:
+            return self._id_rows[item_id]
+        except KeyError:
+            raise KeyError(f"Unknown item: {item_id!r}") from None
+
+    def rows(self, item_ids):
+        """Rows of many raw item ids, with -1 for unknown items."""
+        item_ids = np.asarray(item_ids).tolist()
+        return np.fromiter((self._id_rows.get(item_id, -1) for item_id in item_ids),
+                           dtype=np.intp, count=len(item_ids))
+
+    def candidates(self, vector, n_probes=0):
+        """Rows sharing a bucket with `vector` (or a probed neighbour
+        bucket) in any table."""
+        projections = self._projections(vector[None, :])[:, :, 0]
+        weights = 1 << np.arange(self.n_bits, dtype=np.int64)
+        codes = ((projections > 0) * weights).sum(axis=1)
+        # Probe the buckets across the least certain hyperplanes
+        n_probes = min(n_probes, self.n_bits)
+        flips = np.argsort(np.abs(projections), axis=1)[:, :n_probes]
+        probes = np.concatenate([codes[:, None], codes[:, None] ^ weights[flips]], axis=1)
+        found = []
+        for table in range(self.n_tables):
+            lo = np.searchsorted(self.codes[table], probes[table], side='left')
+            hi = np.searchsorted(self.codes[table], probes[table], side='right')
+            found.extend(self.order[table, start:stop] for start, stop in zip(lo, hi))
+        return np.unique(np.concatenate(found))
+
+    def query(self, vector, k=10, n_probes=0, exclude_row=None):
+        """Approximate top-k items by cosine similarity to `vector`.
+
+        Returns
+        -------
+        tuple (np.ndarray, np.ndarray)
+            Rows of the neighbours and their cosine similarity, best first.
+
+        """
+        vector = np.asarray(vector, dtype=np.float32)
+        vector = vector / max(np.linalg.norm(vector), 1e-12)
+        rows = self.candidates(vector, n_probes)
+        if exclude_row is not None:
+            rows = rows[rows != exclude_row]
+        scores = self.vectors[rows] @ vector
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def similar_items(self, item_id, k=10, n_probes=2):
+        """Raw ids and similarities of the items closest to an item."""
+        row = self.row(item_id)
+        rows, scores = self.query(self.vectors[row], k, n_probes, exclude_row=row)
+        return self.item_ids[rows], scores
+
+    def exact_query(self, vector, k=10, exclude_row=None):
+        """Exact top-k by brute force, for reference."""
+        vector = np.asarray(vector, dtype=np.float32)
+        scores = self.vectors @ (vector / max(np.linalg.norm(vector), 1e-12))
+        if exclude_row is not None:
+            scores[exclude_row] = -np.inf
+        best = top_k(scores, k)
+        return best, scores[best]
+
+    def save(self, path):
+        np.savez(path, vectors=self.vectors, item_ids=self.item_ids,
+                 planes=self.planes, order=self.order, codes=self.codes)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data['vectors'], data['item_ids'], _planes=data['planes'],
+                       _order=data['order'], _codes=data['codes'])
+
+
+def build_item_index(model, n_tables=16, n_bits=None, seed=42):
+    """Build an `LSHIndex` over the item factors of a trained SVD model.
+
+    Parameters
+    ----------
+    model : surprise.SVD or SVDScorer
+        Trained model exposing `qi`, with raw item ids available through
+        its trainset (surprise) or `raw_iids` (scorer).
+
+    Returns
+    -------
+    LSHIndex
+        Index over the model's items, keyed by raw item id.
+
+    """
+    if hasattr(model, 'raw_iids'):
+        item_ids = model.raw_iids
+    else:
+        trainset = model.trainset
+        item_ids = np.array([trainset.to_raw_iid(i) for i in trainset.all_items()])
+    return LSHIndex(model.qi, item_ids, n_tables, n_bits, seed)
+
+
+def recall_report(index, k=10, n_queries=200, probes=(0, 1, 2, 4, 8), seed=0):
+    """Measure recall@k and query time of the index against exact search.
+
+    Parameters
+    ----------
+    index : LSHIndex
+        Index to evaluate; its items are used as queries.
+    k : int
+        Number of neighbours retrieved per query.
+    n_queries : int
+        Number of items drawn as queries.
+    probes : sequence (int)
+        Numbers of probed buckets per table to evaluate.
+    seed : int
+        Seed used to draw the queries.
+
+    Returns
+    -------
+    list (dict)
+        One row per setting (exact search first) with mean recall@k, mean
+        candidates scored and mean query time in milliseconds.
+
+    """
+    rng = np.random.default_rng(seed)
+    queries = rng.choice(len(index), size=min(n_queries, len(index)), replace=False)
+    start = time.perf_counter()
+    exact = [set(index.exact_query(index.vectors[row], k, row)[0].tolist())
+             for row in queries]
+    exact_ms = (time.perf_counter() - start) * 1e3 / len(queries)
+    report = [{'setting': 'exact', 'recall': 1.0,
+               'candidates': len(index) - 1, 'query_ms': exact_ms}]
+    for n_probes in probes:
+        recall, candidates = [], []
+        start = time.perf_counter()
+        for row, truth in zip(queries, exact):
+            found, _ = index.query(index.vectors[row], k, n_probes, row)
+            recall.append(len(truth.intersection(found.tolist())) / max(len(truth), 1))
+        elapsed = time.perf_counter() - start
+        for row in queries:
+            candidates.append(len(index.candidates(index.vectors[row], n_probes)))
+        report.append({'setting': f'lsh tables={index.n_tables} bits={index.n_bits} '
+                                  f'probes={n_probes}',
+                       'recall': float(np.mean(recall)),
+                       'candidates': float(np.mean(candidates)),
+                       'query_ms': elapsed * 1e3 / len(queries)})
+    return report
+
+
+if __name__ == '__main__':
+    from recommenders.collaborative_based import item_ann
+    for row in recall_report(item_ann()):
+        print(f"{row['setting']:>36}: recall@10 {row['recall']:.3f}, "
+              f"{row['candidates']:8.1f} candidates, {row['query_ms']:.3f} ms/query")
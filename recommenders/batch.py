@@ -0,0 +1,291 @@
+"""
+
+    Offline batch recommendation over many favourite-movie lists.
+
+    Author: Explore Data Science Academy.
+
+    Description: Reads favourite-movie lists from a JSON Lines file and
+    writes one recommendation record per list to another, in input order.
+    Lists are processed in blocks across a pool of worker processes. The
+    models of the chosen engine, and only those, are loaded once in the
+    parent before the pool starts, so on platforms that fork, every worker
+    shares the same read-only model memory. The
+    content engine scores a whole block with a single sparse matrix
+    product. Only a few blocks per worker are read ahead of the output, so
+    memory does not grow with the input. Progress goes to stderr, and a
+    checkpoint is written after every block so an interrupted run resumes
+    where it stopped.
+
+    Input lines are either a JSON list of titles or an object such as
+    {"id": "user-1", "movies": ["Toy Story (1995)", ...]}. Output lines are
+    {"id": ..., "recommendations": [...]} or {"id": ..., "error": "..."}.
+
+    Usage (from the root of this repository):
+
+        python -m recommenders.batch seeds.jsonl recommendations.jsonl \\
+            --engine content --workers 4
+
+"""
+# Script dependencies
+import argparse
+import collections
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+from scipy import sparse
+
+from recommenders import collaborative_based, content_based, hybrid_based
+from recommenders.ranking import rank
+from utils import resources
+from utils.catalogue import load_catalogue
+
+ENGINES = ('content', 'collaborative', 'hybrid')
+# Resources each engine reads, loaded before the pool starts
+ENGINE_RESOURCES = {
+    'content': ('catalogue', 'content_index'),
+    'collaborative': ('catalogue', 'ratings_store', 'svd_engine'),
+    'hybrid': ('catalogue', 'content_index', 'item_ann', 'latent_rows'),
+}
+# Blocks submitted to the pool ahead of the output, per worker
+BLOCKS_AHEAD = 2
+
+
+def _content_block(seed_lists, top_n):
+    """Content-based recommendations for a block of favourite lists.
+
+    With the default 'sum' aggregation the score vectors of every list are
+    produced at once as (seed indicator matrix) x (neighbour index). Seeds
+    are resolved and excluded as `content_model` does it.
+
+    """
+    if content_based.AGGREGATION != 'sum':
+        return [content_based.content_model(movies, top_n) for movies in seed_lists]
+    catalogue = load_catalogue()
+    index = content_based.content_index()
+    results = [None] * len(seed_lists)
+    seed_rows = []
+    for i, movies in enumerate(seed_lists):
+        try:
+            seed_rows.append(content_based.seed_rows(movies)[0])
+        except KeyError as e:
+            results[i] = e
+            seed_rows.append([])
+    indptr = np.zeros(len(seed_lists) + 1, dtype=np.int64)
+    np.cumsum([len(rows) for rows in seed_rows], out=indptr[1:])
+    indices = np.fromiter(itertools.chain.from_iterable(seed_rows), dtype=np.int32,
+                          count=indptr[-1])
+    seeds = sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, indptr),
+                              shape=(len(seed_lists), len(index)))
+    scores = (seeds @ index.as_csr()).toarray()
+    for i, rows in enumerate(seed_rows):
+        if results[i] is None:
+            top_indexes, _ = rank(scores[i], top_n, exclude=rows)
+            results[i] = catalogue.titles_for(top_indexes)
+    return results
+
+
+def _per_list(model):
+    """Block function calling `model` on each list in turn."""
+    def block_function(seed_lists, top_n):
+        results = []
+        for movies in seed_lists:
+            try:
+                results.append(model(movies, top_n))
+            except (KeyError, ValueError) as e:
+                results.append(e)
+        return results
+    return block_function
+
+
+_BLOCK_FUNCTIONS = {
+    'content': _content_block,
+    'collaborative': _per_list(collaborative_based.collab_model),
+    'hybrid': _per_list(hybrid_based.hybrid_model),
+}
+
+
+def recommend_batch(seed_lists, engine='content', top_n=10):
+    """Recommendations for many favourite-movie lists at once.
+
+    Parameters
+    ----------
+    seed_lists : list (list (str))
+        Favourite movie titles of each list.
+    engine : str
+        One of `ENGINES`.
+    top_n : int
+        Number of recommendations per list.
+
+    Returns
+    -------
+    list
+        For each list, the recommended titles, or the exception raised
+        when the list could not be served (such as an unknown title).
+
+    """
+    try:
+        block_function = _BLOCK_FUNCTIONS[engine]
+    except KeyError:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}") from None
+    return block_function(list(seed_lists), top_n)
+
+
+def _parse_line(line, line_number):
+    record = json.loads(line)
+    if isinstance(record, list):
+        return line_number, record
+    return record.get('id', line_number), record['movies']
+
+
+def _process_block(args):
+    """Worker entry point: recommend for one block of input records."""
+    block, n_lines, engine, top_n = args
+    ids = [record_id for record_id, _ in block]
+    outputs = recommend_batch([movies for _, movies in block], engine, top_n)
+    lines = []
+    for record_id, output in zip(ids, outputs):
+        if isinstance(output, Exception):
+            message = output.args[0] if output.args else repr(output)
+            record = {'id': record_id, 'error': str(message)}
+        else:
+            record = {'id': record_id, 'recommendations': output}
+        lines.append(json.dumps(record) + '\n')
+    return n_lines, ''.join(lines)
+
+
+def _imap_bounded(pool, function, jobs, max_pending):
+    """Like `pool.imap`, but with at most `max_pending` jobs taken from
+    `jobs` and not yet returned at any time."""
+    pending = collections.deque()
+    for job in jobs:
+        pending.append(pool.apply_async(function, (job,)))
+        if len(pending) >= max_pending:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+def _read_blocks(input_path, block_size, skip):
+    """Blocks of parsed records after the first `skip` lines, each with the
+    number of input lines it covers (blank lines included)."""
+    with open(input_path) as f:
+        lines = enumerate(f)
+        for _ in itertools.islice(lines, skip):
+            pass
+        while True:
+            chunk = list(itertools.islice(lines, block_size))
+            if not chunk:
+                return
+            yield [_parse_line(line, number) for number, line in chunk
+                   if line.strip()], len(chunk)
+
+
+def _load_checkpoint(path):
+    if not os.path.exists(path):
+        return 0, 0
+    with open(path) as f:
+        checkpoint = json.load(f)
+    return checkpoint['lines_done'], checkpoint['output_bytes']
+
+
+def _save_checkpoint(path, lines_done, output_bytes):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump({'lines_done': lines_done, 'output_bytes': output_bytes}, f)
+    os.replace(tmp_path, path)
+
+
+def _warm_up_worker(engine):
+    resources.warm_up(ENGINE_RESOURCES[engine], background=False)
+
+
+def run_batch(input_path, output_path, engine='content', top_n=10, workers=None,
+              block_size=256, resume=True):
+    """Stream recommendations for every list of an input file to a file.
+
+    Parameters
+    ----------
+    input_path : str
+        JSON Lines file of favourite-movie lists.
+    output_path : str
+        JSON Lines file receiving one record per input list, in order.
+    engine : str
+        One of `ENGINES`.
+    top_n : int
+        Number of recommendations per list.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    block_size : int
+        Number of lists handed to a worker at a time.
+    resume : bool
+        Continue from the checkpoint of a previous, interrupted run. The
+        checkpoint is removed once the run completes.
+
+    Returns
+    -------
+    int
+        Number of input lines processed by this run.
+
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine {engine!r}; expected one of {ENGINES}")
+    checkpoint_path = output_path + '.checkpoint'
+    lines_done, output_bytes = _load_checkpoint(checkpoint_path) if resume else (0, 0)
+    with open(input_path) as f:
+        total = sum(1 for _ in f)
+
+    # Load models before forking so that workers share their memory
+    _warm_up_worker(engine)
+    methods = multiprocessing.get_all_start_methods()
+    if 'fork' in methods:
+        context, initializer = multiprocessing.get_context('fork'), None
+    else:
+        context, initializer = multiprocessing.get_context(), _warm_up_worker
+
+    mode = 'r+' if lines_done and os.path.exists(output_path) else 'w'
+    started = time.time()
+    processed = 0
+    with open(output_path, mode) as out, \
+            context.Pool(workers, initializer=initializer, initargs=(engine,)) as pool:
+        # Drop anything written after the last checkpoint
+        out.seek(output_bytes if mode == 'r+' else 0)
+        out.truncate()
+        jobs = ((block, n_lines, engine, top_n) for block, n_lines
+                in _read_blocks(input_path, block_size, lines_done))
+        max_pending = BLOCKS_AHEAD * (workers or os.cpu_count() or 1)
+        for count, lines in _imap_bounded(pool, _process_block, jobs, max_pending):
+            out.write(lines)
+            out.flush()
+            lines_done += count
+            processed += count
+            _save_checkpoint(checkpoint_path, lines_done, out.tell())
+            elapsed = time.time() - started
+            rate = processed / elapsed if elapsed else 0.
+            eta = (total - lines_done) / rate if rate else float('inf')
+            print(f"\r{lines_done}/{total} lists, {rate:.0f} lists/s, "
+                  f"ETA {eta:.0f}s", end='', file=sys.stderr)
+    print(file=sys.stderr)
+    # The output is complete, so a later run starts afresh
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return processed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compute recommendations for many favourite-movie lists.')
+    parser.add_argument('input', help='JSON Lines file of favourite-movie lists.')
+    parser.add_argument('output', help='JSON Lines file to write recommendations to.')
+    parser.add_argument('--engine', choices=ENGINES, default='content')
+    parser.add_argument('--top-n', type=int, default=10)
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--block-size', type=int, default=256)
+    parser.add_argument('--no-resume', action='store_true',
+                        help='Start over instead of resuming from a checkpoint.')
+    args = parser.parse_args()
+    run_batch(args.input, args.output, args.engine, args.top_n, args.workers,
+              args.block_size, resume=not args.no_resume)
@@ -28,23 +28,63 @@
 """
 
 # Script dependencies
-import pandas as pd
 import numpy as np
+import os
 import pickle
-import copy
-from surprise import Reader, Dataset
-from surprise import SVD, NormalPredictor, BaselineOnly, KNNBasic, NMF
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import CountVectorizer
-import scipy as sp 
-
-# Importing data
-movies_df = pd.read_csv('resources/data/movies.csv',sep = ',')
-ratings_df = pd.read_csv('resources/data/ratings.csv')
-ratings_df.drop(['timestamp'], axis=1,inplace=True)
+import functools
+from surprise.prediction_algorithms.predictions import Prediction
+from recommenders.svd_engine import SVDScorer
+from recommenders import model_versions
+from recommenders.ann import LSHIndex, build_item_index
+from recommenders.ranking import rank, merge_seeds, DEFAULT_AGGREGATION
+from utils.resources import lazy_resource
+from utils.catalogue import load_catalogue
+from utils.profiling import profiled, span
+from utils.ratings_store import RATINGS_PATH, load_ratings_store
+from utils import result_cache
+
+MODEL_PATH = 'resources/models/SVD.pkl'
+# Approximate nearest-neighbour index over the model's item factors
+ANN_PATH = 'resources/models/SVD_ann.npz'
+# How the scores of several favourite movies are combined, 'sum' or 'max';
+# requests giving favourite weights use 'weighted' (see
+# `recommenders.ranking.aggregate_scores`)
+AGGREGATION = DEFAULT_AGGREGATION
 
 # We make use of an SVD model trained on a subset of the MovieLens 10k dataset.
-model=pickle.load(open('resources/models/SVD.pkl', 'rb'))
+# The pickled model is only read when no slim model version has been
+# published, so it is not registered for warm-up.
+@functools.lru_cache(maxsize=1)
+def svd_model():
+    with open(MODEL_PATH, 'rb') as f:
+        return pickle.load(f)
+
+# Bias terms and factor matrices of the model, for vectorised scoring.
+# The current published version (from training, the ALS trainer or an
+# incremental fold-in) is memory-mapped, so worker processes share its
+# pages. It takes precedence over the pickled model, and is reloaded as
+# soon as a new version is published.
+@lazy_resource('svd_engine', stamp=model_versions.current_stamp)
+def svd_engine():
+    if model_versions.current_version() is not None:
+        return model_versions.load_version()
+    return SVDScorer.from_surprise(svd_model())
+
+# Index saved at training time, or built from the model if missing.
+@lazy_resource('item_ann', stamp=model_versions.current_stamp)
+def item_ann():
+    if model_versions.current_version() is not None:
+        return model_versions.load_version_index()
+    if os.path.exists(ANN_PATH):
+        return LSHIndex.load(ANN_PATH)
+    return build_item_index(svd_engine())
+
+def model_version():
+    """Identifier of the model, ratings and settings behind
+    `collab_model`, under which its results are cached."""
+    model = model_versions.current_version() or result_cache.file_version(MODEL_PATH)
+    ratings = result_cache.file_version(RATINGS_PATH)
+    return model and ratings and f'{model}-{ratings}-{AGGREGATION}'
 
 def prediction_item(item_id):
     """Map a given favourite movie to users within the
@@ -61,14 +101,13 @@ def prediction_item(item_id):
         User IDs of users with similar high ratings for the given movie.
 
     """
-    # Data preprosessing
-    reader = Reader(rating_scale=(0, 5))
-    load_df = Dataset.load_from_df(ratings_df,reader)
-    a_train = load_df.build_full_trainset()
-
-    predictions = []
-    for ui in a_train.all_users():
-        predictions.append(model.predict(iid=item_id,uid=ui, verbose = False))
+    # Users of the shared ratings store, loaded once per process
+    uids = load_ratings_store().user_ids
+
+    # Scoring the item against every user in a single pass
+    estimates = svd_engine().score_item(item_id, uids)
+    predictions = [Prediction(uid, item_id, None, est, {})
+                   for uid, est in zip(uids, estimates)]
     return predictions
 
 def pred_movies(movie_list):
@@ -77,8 +116,8 @@ def pred_movies(movie_list):
 
     Parameters
     ----------
-    movie_list : list
-        Three favourite movies selected by the app user.
+    movie_list : list (int)
+        Movie IDs of the favourite movies selected by the app user.
 
     Returns
     -------
@@ -88,20 +127,21 @@ def pred_movies(movie_list):
     """
     # Store the id of users
     id_store=[]
+    uids = load_ratings_store().user_ids
     # For each movie selected by a user of the app,
     # predict a corresponding user within the dataset with the highest rating
     for i in movie_list:
-        predictions = prediction_item(item_id = i)
-        predictions.sort(key=lambda x: x.est, reverse=True)
         # Take the top 10 user id's from each movie with highest rankings
-        for pred in predictions[:10]:
-            id_store.append(pred.uid)
+        top_uids, _ = svd_engine().top_users(i, 10, uids)
+        id_store.extend(top_uids.tolist())
     # Return a list of user id's
     return id_store
 
 # !! DO NOT CHANGE THIS FUNCTION SIGNATURE !!
 # You are, however, encouraged to change its content.  
-def collab_model(movie_list,top_n=10):
+@profiled('collab_model')
+@result_cache.cached('collaborative', model_version)
+def collab_model(movie_list,top_n=10,weights=None):
     """Performs Collaborative filtering based upon a list of movies supplied
        by the app user.
 
@@ -111,74 +151,92 @@ def collab_model(movie_list,top_n=10):
         Favorite movies chosen by the app user.
     top_n : type
         Number of top recommendations to return to the user.
+    weights : list (float), optional
+        Non-negative weight of each chosen movie. When given, the scores
+        of the chosen movies are combined with the 'weighted' aggregation.
 
     Returns
     -------
     list (str)
-        Titles of the top-n movie recommendations to the user.
+        Titles of the top-n movie recommendations to the user. Fewer are
+        returned when fewer movies are related to the chosen ones.
 
     """
 
-    indices = pd.Series(movies_df['title'])
-    movie_ids = pred_movies(movie_list)
-    df_init_users = ratings_df[ratings_df['userId']==movie_ids[0]]
-    
-    # Adding ratings for other users in movie_ids[1:]
-    for i in movie_ids[1:]:
-        df_init_users = df_init_users.append(ratings_df[ratings_df['userId'] == i])
-
-    # Including predictions for the chosen movies
-    for movie_id in movie_list:
-        predictions_df = pd.DataFrame(prediction_item(movie_id))
-        for user_id in set(df_init_users['userId']):
-            movie_idx = indices[indices == movie_id].index[0]
-            est = predictions_df['est'][predictions_df['uid'] == user_id].values[0]
-            df_init_users = df_init_users.append(pd.Series([int(user_id), int(movie_idx), est], index=['userId', 'movieId', 'rating']), ignore_index=True)
-
-    # Removing duplicate entries
-    df_init_users.drop_duplicates(inplace=True)
-
-    # Creating a pivot table
-    util_matrix = df_init_users.pivot_table(index=['userId'], columns=['movieId'], values='rating')
-
-    # Filling Nan values with 0's and saving the utility matrix in scipy's sparse matrix format
-    util_matrix.fillna(0, inplace=True)
-    util_matrix_sparse = sp.sparse.csr_matrix(util_matrix.values)
-
-    # Getting cosine similarity matrix
-    user_similarity = cosine_similarity(util_matrix_sparse.T)
-
-    # Saving the matrix as a dataframe 
-    cosine_sim = pd.DataFrame(user_similarity, index=util_matrix.columns, columns=util_matrix.columns)
-
-    # Calculating user similarity based on the given 'df_init_users' data
-    user_similarity = cosine_similarity(np.array(df_init_users), np.array(df_init_users))
-    cosine_sim = pd.DataFrame(user_similarity, index=df_init_users['movieId'].values.astype(int), columns=df_init_users['movieId'].values.astype(int))
-
-    # Removing duplicate rows from the  matrix
-    cosine_sim = cosine_sim.loc[~cosine_sim.index.duplicated(keep='first')]
-
-    # Transpose the matrix
-    cosine_sim = cosine_sim.T
-    
-    idx_1 = indices[indices == movie_list[0]].index[0]
-    idx_2 = indices[indices == movie_list[1]].index[0]
-    idx_3 = indices[indices == movie_list[2]].index[0]
-    # Creating a Series with the similarity scores in descending order
-    rank_1 = cosine_sim[idx_1]
-    rank_2 = cosine_sim[idx_2]
-    rank_3 = cosine_sim[idx_3]
-    # Calculating the scores
-    score_series_1 = pd.Series(rank_1).sort_values(ascending = False)
-    score_series_2 = pd.Series(rank_2).sort_values(ascending = False)
-    score_series_3 = pd.Series(rank_3).sort_values(ascending = False)
-     # Appending the names of movies
-    listings = score_series_1.append(score_series_1).append(score_series_3).sort_values(ascending = False)
-    recommended_movies = []
-    # Choose top 50
-    top_50_indexes = list(listings.iloc[1:50].index)
-    # Removing chosen movies
-    top_indexes = np.setdiff1d(top_50_indexes,[idx_1,idx_2,idx_3])
-    for i in top_indexes[:top_n]:
-        recommended_movies.append(list(movies_df['title'])[i])
+    with span('load_catalogue'):
+        catalogue = load_catalogue()
+    with span('load_ratings_store'):
+        store = load_ratings_store()
+    with span('resolve_titles'):
+        # Resolving the chosen titles to their MovieLens movie IDs; a title
+        # chosen twice counts once, with the sum of its weights
+        titles, weights = merge_seeds(movie_list, weights)
+        favourite_ids = [catalogue.movie_id(title) for title in titles]
+    with span('neighbour_users'):
+        # Users of the dataset with the highest predicted ratings for them
+        user_ids = np.unique(pred_movies(favourite_ids))
+
+    with span('predict_favourites'):
+        # Including predictions for the chosen movies
+        engine = svd_engine()
+        favourite_ratings = np.column_stack(
+            [engine.score_item(movie_id, user_ids) for movie_id in favourite_ids])
+
+    with span('accumulate_ratings'):
+        # Accumulating, over the neighbourhood users, the dot products
+        # between every movie's ratings and the chosen movies' predicted
+        # ratings. Each user's ratings are read as views into the
+        # user-major matrix.
+        n_items = store.shape[1]
+        dot = np.zeros((n_items, len(favourite_ids)))
+        sq_norms = np.zeros(n_items)
+        for pos, user_id in enumerate(user_ids):
+            cols, ratings = store.user_ratings(user_id)
+            dot[cols] += np.outer(ratings, favourite_ratings[pos])
+            sq_norms[cols] += ratings ** 2
+
+    with span('cosine_similarity'):
+        # Cosine similarity of every movie to each chosen movie
+        norms = np.sqrt(sq_norms)[:, None] * np.linalg.norm(favourite_ratings, axis=0)
+        cosine_sim = np.divide(dot, norms, out=np.zeros_like(dot), where=norms > 0)
+
+    with span('rank'):
+        # Combining the scores of all chosen movies in one pass, leaving out
+        # the chosen movies and movies missing from the catalogue
+        rows = catalogue.rows_for_movie_ids(store.item_ids)
+        exclude = (rows < 0) | np.isin(store.item_ids, favourite_ids)
+        method = AGGREGATION if weights is None else 'weighted'
+        top_cols, _ = rank(cosine_sim.T, top_n, exclude=exclude,
+                           method=method, weights=weights)
+    with span('titles'):
+        recommended_movies = catalogue.titles_for(rows[top_cols])
+    return recommended_movies
+
+def similar_movies(movie_title, top_n=10):
+    """Movies whose latent SVD factors are closest to those of a given
+    movie ("because you liked X").
+
+    Parameters
+    ----------
+    movie_title : str
+        Title of a movie liked by the app user.
+    top_n : int
+        Number of similar movies to return.
+
+    Returns
+    -------
+    list (str)
+        Titles of the top-n most similar movies, or an empty list when the
+        model has no factors for the movie (it has no ratings).
+
+    """
+    catalogue = load_catalogue()
+    index = item_ann()
+    movie_id = catalogue.movie_id(movie_title)
+    if index.rows([movie_id])[0] < 0:
+        return []
+    # Asking for a few extra items, as some may be missing from the catalogue
+    item_ids, _ = index.similar_items(movie_id, top_n + 10)
+    rows = catalogue.rows_for_movie_ids(item_ids)
+    recommended_movies = catalogue.titles_for(rows[rows >= 0][:top_n])
     return recommended_movies
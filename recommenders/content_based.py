@@ -31,21 +31,28 @@
 import os
 import pandas as pd
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.feature_extraction.text import CountVectorizer
-
-# Importing data
-movies = pd.read_csv('resources/data/movies.csv', sep = ',')
-ratings = pd.read_csv('resources/data/ratings.csv')
-movies.dropna(inplace=True)
+from recommenders.content_index import INDEX_PATH, load_content_index
+from recommenders.ranking import rank, merge_seeds, DEFAULT_AGGREGATION
+from utils.catalogue import load_catalogue
+from utils.profiling import profiled, span
+from utils.resources import lazy_resource
+from utils import result_cache
+
+# Number of movies covered by the content-based recommender (None: all)
+SUBSET_SIZE = None
+# How the scores of several favourite movies are combined, 'sum' or 'max';
+# requests giving favourite weights use 'weighted' (see
+# `recommenders.ranking.aggregate_scores`)
+AGGREGATION = DEFAULT_AGGREGATION
 
 def data_preprocessing(subset_size):
     """Prepare data for use within Content filtering algorithm.
 
     Parameters
     ----------
-    subset_size : int
-        Number of movies to use within the algorithm.
+    subset_size : int or None
+        Number of movies to use within the algorithm; None uses the
+        whole catalogue.
 
     Returns
     -------
@@ -53,15 +60,58 @@ def data_preprocessing(subset_size):
         Subset of movies selected for content-based filtering.
 
     """
-    # Split genre data into individual words.
-    movies['keyWords'] = movies['genres'].str.replace('|', ' ')
+    # Movies shared with the rest of the app, loaded on first use
+    movies = load_catalogue().movies
     # Subset of the data
-    movies_subset = movies[:subset_size]
+    movies_subset = movies[:subset_size].copy()
+    # Split genre data into individual words.
+    movies_subset['keyWords'] = movies_subset['genres'].str.replace('|', ' ')
     return movies_subset
 
+# Precomputed top-k neighbours of every movie in the subset
+@lazy_resource('content_index')
+def content_index():
+    return load_content_index(data_preprocessing(SUBSET_SIZE))
+
+def seed_rows(movie_list, weights=None):
+    """Catalogue rows of the chosen movies that the content index covers.
+
+    A title chosen twice counts once, with the sum of its weights. Movies
+    outside the indexed subset have no neighbours to draw on, so they are
+    left out. Raises KeyError for a title missing from the catalogue.
+
+    Parameters
+    ----------
+    movie_list : list (str)
+        Favorite movies chosen by the app user.
+    weights : list (float), optional
+        Weight of each chosen movie.
+
+    Returns
+    -------
+    tuple (list (int), np.ndarray or None)
+        Rows of the chosen movies, in order of first choice, and their
+        weights when `weights` is given.
+
+    """
+    catalogue = load_catalogue()
+    index = content_index()
+    titles, weights = merge_seeds(movie_list, weights)
+    rows = np.array([catalogue.row(title) for title in titles], dtype=np.intp)
+    covered = rows < len(index)
+    return rows[covered].tolist(), None if weights is None else weights[covered]
+
+def model_version():
+    """Identifier of the content index and settings behind
+    `content_model`, under which its results are cached."""
+    version = result_cache.file_version(INDEX_PATH)
+    return version and f'{version}-{SUBSET_SIZE}-{AGGREGATION}'
+
 # !! DO NOT CHANGE THIS FUNCTION SIGNATURE !!
 # You are, however, encouraged to change its content.  
-def content_model(movie_list,top_n=10):
+@profiled('content_model')
+@result_cache.cached('content', model_version)
+def content_model(movie_list,top_n=10,weights=None):
     """Performs Content filtering based upon a list of movies supplied
        by the app user.
 
@@ -71,42 +121,31 @@ def content_model(movie_list,top_n=10):
         Favorite movies chosen by the app user.
     top_n : type
         Number of top recommendations to return to the user.
+    weights : list (float), optional
+        Non-negative weight of each chosen movie. When given, the scores
+        of the chosen movies are combined with the 'weighted' aggregation.
 
     Returns
     -------
     list (str)
-        Titles of the top-n movie recommendations to the user.
+        Titles of the top-n movie recommendations to the user. Fewer are
+        returned when fewer movies are related to the chosen ones.
 
     """
-    # Initializing the empty list of recommended movies
-    recommended_movies = []
-    data = data_preprocessing(27000)
-    # Instantiating and generating the count matrix
-    count_vec = CountVectorizer()
-    count_matrix = count_vec.fit_transform(data['keyWords'])
-    indices = pd.Series(data['title'])
-    cosine_sim = cosine_similarity(count_matrix, count_matrix)
-    # Getting the index of the movie that matches the title
-    idx_1 = indices[indices == movie_list[0]].index[0]
-    idx_2 = indices[indices == movie_list[1]].index[0]
-    idx_3 = indices[indices == movie_list[2]].index[0]
-    # Creating a Series with the similarity scores in descending order
-    rank_1 = cosine_sim[idx_1]
-    rank_2 = cosine_sim[idx_2]
-    rank_3 = cosine_sim[idx_3]
-    # Calculating the scores
-    score_series_1 = pd.Series(rank_1).sort_values(ascending = False)
-    score_series_2 = pd.Series(rank_2).sort_values(ascending = False)
-    score_series_3 = pd.Series(rank_3).sort_values(ascending = False)
-    # Getting the indexes of the 10 most similar movies
-    listings = score_series_1.append(score_series_1).append(score_series_3).sort_values(ascending = False)
-
-    # Store movie names
-    recommended_movies = []
-    # Appending the names of movies
-    top_50_indexes = list(listings.iloc[1:50].index)
-    # Removing chosen movies
-    top_indexes = np.setdiff1d(top_50_indexes,[idx_1,idx_2,idx_3])
-    for i in top_indexes[:top_n]:
-        recommended_movies.append(list(movies['title'])[i])
+    with span('load_catalogue'):
+        catalogue = load_catalogue()
+    with span('load_content_index'):
+        index = content_index()
+    with span('resolve_titles'):
+        # Getting the index of each movie that matches a chosen title, for
+        # however many movies were chosen
+        rows, weights = seed_rows(movie_list, weights)
+    with span('score_and_rank'):
+        # Precomputed neighbour scores of every chosen movie, combined in
+        # one pass, with the chosen movies themselves masked out
+        method = AGGREGATION if weights is None else 'weighted'
+        top_indexes, _ = rank(index.score_matrix(rows), top_n, exclude=rows,
+                              method=method, weights=weights)
+    with span('titles'):
+        recommended_movies = catalogue.titles_for(top_indexes)
     return recommended_movies
@@ -0,0 +1,421 @@
+"""
+
+    Precomputed top-k neighbour index for content-based filtering.
+
+    Author: Explore Data Science Academy.
+
+    Description: Offline build step which stores, for every movie in the
+    content catalogue, its `k` most similar movies (by cosine similarity
+    of genre keywords) along with their similarity scores. The index is
+    held as two fixed-width arrays of shape (n_movies, k) so that serving
+    a recommendation only requires a row lookup instead of refitting a
+    vectorizer and materialising a dense n x n similarity matrix.
+
+    Keywords are turned into features by hashing, so there is no
+    vocabulary to refit. The index keeps each movie's features and a
+    fingerprint of its keywords, so it can be updated incrementally when
+    the catalogue grows or changes. Only new and changed movies are
+    vectorised and given fresh neighbour lists. Other movies merge the new
+    movies into their existing lists. Only lists that pointed at a changed
+    or removed movie are recomputed in full. The result is the same as a
+    full rebuild, at a cost that grows with the size of the change rather
+    than the size of the catalogue.
+
+    Usage (from the root of this repository):
+
+        python -m recommenders.content_index
+
+"""
+# Script dependencies
+import os
+import zlib
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+INDEX_PATH = 'resources/models/content_index.npz'
+# Width of the hashed keyword features
+N_FEATURES = 2 ** 18
+# Largest similarity slab (rows x movies) scored at once
+SLAB_SIZE = 2 ** 24
+
+
+class ContentIndex:
+    """Top-k content neighbours for each movie of the catalogue.
+
+    Parameters
+    ----------
+    movie_ids : np.ndarray (int)
+        MovieLens movie IDs, one per row of the index.
+    neighbours : np.ndarray (int32), shape (n_movies, k)
+        Row positions of the `k` nearest neighbours of each movie, sorted
+        by decreasing similarity. Rows with fewer than `k` neighbours are
+        padded with -1.
+    scores : np.ndarray (float32), shape (n_movies, k)
+        Cosine similarity of each neighbour, padded with 0.
+    features : scipy.sparse.csr_matrix, optional
+        Unit-length hashed keyword features of each movie.
+    fingerprints : np.ndarray (int64), optional
+        Checksum of each movie's keywords, used to detect changes.
+
+    """
+
+    def __init__(self, movie_ids, neighbours, scores, features=None, fingerprints=None):
+        self.movie_ids = np.asarray(movie_ids)
+        self.neighbours = np.asarray(neighbours, dtype=np.int32)
+        self.scores = np.asarray(scores, dtype=np.float32)
+        self.features = features
+        self.fingerprints = fingerprints
+        self._csr = None
+
+    @property
+    def k(self):
+        return self.neighbours.shape[1]
+
+    def __len__(self):
+        return self.neighbours.shape[0]
+
+    def lookup(self, row):
+        """Return the (neighbour rows, scores) of a single movie row."""
+        valid = self.neighbours[row] >= 0
+        return self.neighbours[row][valid], self.scores[row][valid]
+
+    def score_matrix(self, rows):
+        """Similarity of every movie to each of the given movie rows.
+
+        Parameters
+        ----------
+        rows : sequence (int)
+            Rows of the seed movies.
+
+        Returns
+        -------
+        np.ndarray (float32), shape (len(rows), n_movies)
+            Stored neighbour scores of each seed; 0 for movies outside its
+            top-k neighbours.
+
+        """
+        rows = np.asarray(rows, dtype=np.intp)
+        neighbours = self.neighbours[rows]
+        valid = neighbours >= 0
+        seeds = np.broadcast_to(np.arange(len(rows))[:, None], neighbours.shape)
+        matrix = np.zeros((len(rows), len(self)), dtype=np.float32)
+        matrix[seeds[valid], neighbours[valid]] = self.scores[rows][valid]
+        return matrix
+
+    def as_csr(self):
+        """The index as a sparse (n_movies x n_movies) similarity matrix,
+        holding each movie's top-k neighbour scores in its row."""
+        if self._csr is None:
+            valid = self.neighbours >= 0
+            indptr = np.zeros(len(self) + 1, dtype=np.int64)
+            np.cumsum(valid.sum(axis=1), out=indptr[1:])
+            self._csr = sparse.csr_matrix(
+                (self.scores[valid], self.neighbours[valid], indptr),
+                shape=(len(self), len(self)))
+        return self._csr
+
+    def save(self, path=INDEX_PATH):
+        """Write the index to `path`, adding the .npz extension if missing.
+
+        The file is written under a temporary name and renamed into place,
+        so readers never see a partly written index.
+
+        """
+        if not path.endswith('.npz'):
+            path += '.npz'
+        staging = path + '.tmp'
+        # Through a file object, so that numpy keeps the staging name
+        with open(staging, 'wb') as f:
+            np.savez(f, movie_ids=self.movie_ids,
+                     neighbours=self.neighbours, scores=self.scores,
+                     features_data=self.features.data,
+                     features_indices=self.features.indices,
+                     features_indptr=self.features.indptr,
+                     fingerprints=self.fingerprints)
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with np.load(path) as data:
+            features, fingerprints = None, None
+            # Indexes saved before incremental updates lack these
+            if 'fingerprints' in data:
+                features = sparse.csr_matrix(
+                    (data['features_data'], data['features_indices'],
+                     data['features_indptr']),
+                    shape=(len(data['movie_ids']), N_FEATURES))
+                fingerprints = data['fingerprints']
+            return cls(data['movie_ids'], data['neighbours'], data['scores'],
+                       features, fingerprints)
+
+
+def keyword_features(keywords):
+    """Unit-length hashed bag-of-words features of keyword strings."""
+    if len(keywords) == 0:
+        # The vectorizer cannot transform an empty batch
+        return sparse.csr_matrix((0, N_FEATURES), dtype=np.float32)
+    vectorizer = HashingVectorizer(n_features=N_FEATURES, alternate_sign=False,
+                                   norm='l2', dtype=np.float32)
+    return vectorizer.transform(keywords).tocsr()
+
+
+def keyword_fingerprints(keywords):
+    """Checksums of keyword strings, stable across processes."""
+    return np.fromiter((zlib.crc32(str(words).encode('utf-8')) for words in keywords),
+                       dtype=np.int64, count=len(keywords))
+
+
+def _sort_keys(sim, rows, n):
+    """Pack (score, -row) into int64 keys that sort like the pairs.
+
+    Non-negative float32 bit patterns sort like the floats they encode, so
+    equal scores are ordered in favour of the lower row.
+
+    """
+    return (sim.view(np.int32).astype(np.int64) << 32) | (n - 1 - np.asarray(rows, dtype=np.int64))
+
+
+def _select(keys, k):
+    """Per row, the positions of the `k` highest keys, best first."""
+    part = np.argpartition(-keys, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(keys, part, axis=1), axis=1)
+    return np.take_along_axis(part, order, axis=1)
+
+
+def _block_size(n):
+    return max(1, SLAB_SIZE // max(n, 1))
+
+
+def _distinct_rows(features):
+    """Group identical rows of a sparse matrix.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        First row of each distinct row, and the group of every row.
+
+    """
+    features = features.tocsr()
+    seen = {}
+    groups = np.empty(features.shape[0], dtype=np.intp)
+    indptr, indices, data = features.indptr, features.indices, features.data
+    for row in range(features.shape[0]):
+        lo, hi = indptr[row], indptr[row + 1]
+        key = indices[lo:hi].tobytes() + data[lo:hi].tobytes()
+        groups[row] = seen.setdefault(key, len(seen))
+    first = np.empty(len(seen), dtype=np.intp)
+    first[groups[::-1]] = np.arange(len(groups))[::-1]
+    return first, groups
+
+
+def top_k_neighbours(features, k, block_size=None, rows=None):
+    """Compute the `k` most cosine-similar rows of rows of `features`.
+
+    Movies with identical features rank every other movie identically, so
+    one ranking of `k + 1` rows is computed per distinct feature row and
+    each movie drops itself from it. Rankings are computed block by block
+    so that at most a (block_size x n_movies) slab is held in memory at
+    any time.
+
+    Parameters
+    ----------
+    features : scipy.sparse matrix, shape (n_movies, n_features)
+        Feature vectors of the movies.
+    k : int
+        Number of neighbours to retain per movie.
+    block_size : int, optional
+        Number of distinct rows scored per block. Defaults to a slab of
+        about `SLAB_SIZE` similarities.
+    rows : np.ndarray (int), optional
+        Rows to find neighbours for. Defaults to every row.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Neighbour rows (int32) and scores (float32), each (len(rows), k).
+        Ties in score are broken in favour of the lower row.
+
+    """
+    features = normalize(features.astype(np.float32), norm='l2', axis=1)
+    features_t = features.T.tocsc()
+    n = features.shape[0]
+    rows = np.arange(n) if rows is None else np.asarray(rows, dtype=np.intp)
+    block_size = block_size or _block_size(n)
+    k = min(k, n - 1)
+    first, groups = _distinct_rows(features)
+    needed, slots = np.unique(groups[rows], return_inverse=True)
+    ranked = np.empty((len(needed), k + 1), dtype=np.int32)
+    ranked_scores = np.empty((len(needed), k + 1), dtype=np.float32)
+    for start in range(0, len(needed), block_size):
+        block = first[needed[start:start + block_size]]
+        sim = (features[block] @ features_t).toarray()
+        np.clip(sim, 0, None, out=sim)
+        part = _select(_sort_keys(sim, np.arange(n), n), k + 1)
+        ranked[start:start + len(block)] = part
+        ranked_scores[start:start + len(block)] = np.take_along_axis(sim, part, axis=1)
+
+    # A movie is never its own neighbour: drop it, or else the last entry
+    ranked, ranked_scores = ranked[slots], ranked_scores[slots]
+    is_self = ranked == rows[:, None]
+    drop = np.where(is_self.any(axis=1), is_self.argmax(axis=1), k)
+    keep = np.arange(k)[None, :] + (np.arange(k)[None, :] >= drop[:, None])
+    return (np.take_along_axis(ranked, keep, axis=1),
+            np.take_along_axis(ranked_scores, keep, axis=1))
+
+
+def build_content_index(data, k=50, block_size=None):
+    """Build a `ContentIndex` over the given movies.
+
+    Parameters
+    ----------
+    data : Pandas DataFrame
+        Movies with `movieId` and `keyWords` columns, in catalogue order.
+    k : int
+        Number of neighbours to retain per movie.
+    block_size : int, optional
+        Number of rows scored per block.
+
+    Returns
+    -------
+    ContentIndex
+        The built index, aligned row-for-row with `data`.
+
+    """
+    keywords = data['keyWords'].tolist()
+    features, fingerprints = keyword_features(keywords), keyword_fingerprints(keywords)
+    neighbours, scores = top_k_neighbours(features, k, block_size)
+    return ContentIndex(data['movieId'].values, neighbours, scores,
+                        features, fingerprints)
+
+
+def update_content_index(index, data, k=50, block_size=None):
+    """Bring an index up to date with a changed catalogue.
+
+    New movies and movies whose keywords changed get fresh features and
+    neighbour lists. Every other movie keeps its list, merged with the new
+    and changed movies. Lists that pointed at a changed or removed movie
+    are recomputed. Falls back to a full build when the unchanged movies
+    were reordered, or when most of the catalogue changed.
+
+    Parameters
+    ----------
+    index : ContentIndex
+        Index built for an earlier version of the catalogue.
+    data : Pandas DataFrame
+        Movies with `movieId` and `keyWords` columns, in catalogue order.
+    k : int
+        Number of neighbours to retain per movie.
+    block_size : int, optional
+        Number of rows scored per block.
+
+    Returns
+    -------
+    ContentIndex
+        Index aligned row-for-row with `data`; identical to
+        `build_content_index(data, k)`.
+
+    """
+    movie_ids = data['movieId'].values
+    n = len(movie_ids)
+    if index.fingerprints is None or index.k != min(k, n - 1):
+        return build_content_index(data, k, block_size)
+    keywords = data['keyWords'].tolist()
+    fingerprints = keyword_fingerprints(keywords)
+
+    # Row of each movie in the old index, if it is there unchanged
+    order = np.argsort(index.movie_ids, kind='stable')
+    found = np.minimum(np.searchsorted(index.movie_ids, movie_ids, sorter=order),
+                       len(order) - 1)
+    old_rows = order[found]
+    unchanged = (index.movie_ids[old_rows] == movie_ids) \
+        & (index.fingerprints[old_rows] == fingerprints)
+    changed = np.flatnonzero(~unchanged)
+    if not np.all(np.diff(old_rows[unchanged]) > 0) or len(changed) > n // 2:
+        return build_content_index(data, k, block_size)
+    if len(changed) == 0 and len(index) == n:
+        return index
+
+    # Features: reuse those of unchanged movies, hash the rest
+    pieces = sparse.vstack([index.features[old_rows[unchanged]],
+                            keyword_features([keywords[row] for row in changed])]).tocsr()
+    position = np.empty(n, dtype=np.intp)
+    position[np.flatnonzero(unchanged)] = np.arange(unchanged.sum())
+    position[changed] = unchanged.sum() + np.arange(len(changed))
+    features = pieces[position]
+
+    # Existing lists, renumbered; entries for changed or removed movies
+    # become -1 and force a full recomputation of their list
+    new_row = np.full(len(index), -1, dtype=np.int64)
+    new_row[old_rows[unchanged]] = np.flatnonzero(unchanged)
+    kept = np.flatnonzero(unchanged)
+    neighbours = np.full((n, index.k), -1, dtype=np.int32)
+    scores = np.zeros((n, index.k), dtype=np.float32)
+    old_lists = index.neighbours[old_rows[kept]]
+    neighbours[kept] = np.where(old_lists >= 0, new_row[old_lists], -1)
+    scores[kept] = index.scores[old_rows[kept]]
+    stale = kept[(neighbours[kept] < 0).any(axis=1)]
+    merge = np.setdiff1d(kept, stale)
+
+    # Merge the changed movies into the remaining lists, a block at a time.
+    # Lists are sorted, so a row only changes if a candidate beats its last
+    unit = normalize(features.astype(np.float32), norm='l2', axis=1)
+    merged_keys = _sort_keys(scores[merge], neighbours[merge], n)
+    block_size = block_size or _block_size(len(merge))
+    for start in range(0, len(changed), block_size):
+        block = changed[start:start + block_size]
+        sim = (unit[merge] @ unit[block].T).toarray()
+        np.clip(sim, 0, None, out=sim)
+        block_keys = _sort_keys(sim, block, n)
+        better = np.flatnonzero(block_keys.max(axis=1) > merged_keys[:, -1])
+        rows = merge[better]
+        keys = np.concatenate([merged_keys[better], block_keys[better]], axis=1)
+        columns = np.concatenate([neighbours[rows], np.broadcast_to(
+            block.astype(np.int32), (len(rows), len(block)))], axis=1)
+        values = np.concatenate([scores[rows], sim[better]], axis=1)
+        best = _select(keys, index.k)
+        neighbours[rows] = np.take_along_axis(columns, best, axis=1)
+        scores[rows] = np.take_along_axis(values, best, axis=1)
+        merged_keys[better] = np.take_along_axis(keys, best, axis=1)
+
+    # Fresh lists for changed movies and lists that lost a neighbour
+    recompute = np.union1d(changed, stale)
+    neighbours[recompute], scores[recompute] = top_k_neighbours(
+        features, index.k, block_size, rows=recompute)
+    return ContentIndex(movie_ids, neighbours, scores, features, fingerprints)
+
+
+def load_content_index(data, path=INDEX_PATH):
+    """Load the content index, updating and saving it if it is missing
+    or out of date with respect to `data`.
+
+    Parameters
+    ----------
+    data : Pandas DataFrame
+        Movies with `movieId` and `keyWords` columns, in catalogue order.
+    path : str
+        Location of the stored index.
+
+    Returns
+    -------
+    ContentIndex
+        Index aligned row-for-row with `data`.
+
+    """
+    if not os.path.exists(path):
+        index = build_content_index(data)
+        index.save(path)
+        return index
+    stored = ContentIndex.load(path)
+    index = update_content_index(stored, data, stored.k)
+    if index is not stored:
+        index.save(path)
+    return index
+
+
+if __name__ == '__main__':
+    from recommenders.content_based import data_preprocessing, SUBSET_SIZE
+    index = build_content_index(data_preprocessing(SUBSET_SIZE))
+    print(f"Content index built for {len(index)} movies. Saving to: {INDEX_PATH}")
+    index.save(INDEX_PATH)
@@ -0,0 +1,181 @@
+"""
+
+    Incremental fold-in of new ratings into a trained factor model.
+
+    Author: Explore Data Science Academy.
+
+    Description: Updates the current factor model with new ratings without
+    retraining it from scratch. Users and movies that the model has not
+    seen are appended to its id maps. The factors and biases of every user
+    with new ratings are then re-solved by least squares, against all of
+    their ratings with the movie factors held fixed. Users the model
+    already knows are only re-solved when their earlier ratings are given
+    as `history`; otherwise their factors are left unchanged, as solving
+    them from the new ratings alone would discard the earlier ones. The
+    factors of new
+    movies are solved against the users who rated them. A few alternations
+    between the two settle users and new movies that depend on each other.
+    The factors of existing movies are left unchanged, so estimates for
+    users without new ratings stay as they were. The updated model is
+    published as a new version, which running apps pick up without a
+    restart.
+
+    `fold_in` does not store the new ratings. The command below appends
+    them to the ratings file after publishing the model, so that the
+    ratings store and later fold-ins include them; other callers must do
+    the same, for instance with `append_ratings`.
+
+    Usage (from the root of this repository):
+
+        python -m recommenders.fold_in new_ratings.csv
+
+    where `new_ratings.csv` has userId, movieId and rating columns.
+
+"""
+# Script dependencies
+import argparse
+import os
+import time
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from recommenders.als import solve_side
+from recommenders.model_versions import publish
+from recommenders.svd_engine import SVDScorer
+from utils.ratings_store import RATINGS_PATH, load_ratings_store
+
+
+def _unseen(inner, raw_ids):
+    """Distinct raw ids without an inner id, in order of first appearance."""
+    unseen = raw_ids[inner < 0]
+    _, first = np.unique(unseen, return_index=True)
+    return unseen[np.sort(first)]
+
+
+def _grow(array, length):
+    """`array` padded with zero rows up to `length` rows."""
+    grown = np.zeros((length,) + array.shape[1:], dtype=np.float32)
+    grown[:len(array)] = array
+    return grown
+
+
+def fold_in(scorer, user_ids, item_ids, ratings, history=None, reg=0.1, n_iters=3):
+    """Fold new ratings into a factor model.
+
+    Parameters
+    ----------
+    scorer : SVDScorer
+        Model to update; it is left unchanged.
+    user_ids, item_ids, ratings : array-like
+        Raw user ids, raw movie ids and values of the new ratings.
+    history : RatingsStore, optional
+        Earlier ratings. When given, users with new ratings are re-solved
+        against their earlier ratings too, and a new rating replaces an
+        earlier rating of the same movie. When omitted, only users new to
+        the model are solved; the new ratings of known users still inform
+        the factors of new movies, but their own factors are unchanged.
+    reg : float
+        Ridge penalty per rating, as used by the ALS trainer.
+    n_iters : int
+        Alternations between users and new movies.
+
+    Returns
+    -------
+    SVDScorer
+        Updated model with the new users and movies appended.
+
+    """
+    user_ids, item_ids = np.asarray(user_ids), np.asarray(item_ids)
+    ratings = np.asarray(ratings, dtype=np.float32)
+    raw_uids = np.concatenate([scorer.raw_uids,
+                               _unseen(scorer.user_inner(user_ids), user_ids)])
+    raw_iids = np.concatenate([scorer.raw_iids,
+                               _unseen(scorer.item_inner(item_ids), item_ids)])
+    updated = SVDScorer(global_mean=scorer.global_mean,
+                        bu=_grow(scorer.bu, len(raw_uids)), bi=_grow(scorer.bi, len(raw_iids)),
+                        pu=_grow(scorer.pu, len(raw_uids)), qi=_grow(scorer.qi, len(raw_iids)),
+                        raw_uids=raw_uids, raw_iids=raw_iids,
+                        rating_scale=scorer.rating_scale, biased=scorer.biased)
+    pu, bu, qi, bi = updated.pu, updated.bu, updated.qi, updated.bi
+
+    users = updated.user_inner(user_ids).astype(np.int64)
+    items = updated.item_inner(item_ids).astype(np.int64)
+    if history is not None:
+        # Earlier ratings of the affected users, on movies the model knows
+        old_users, old_items, old_ratings = [], [], []
+        for raw in np.unique(user_ids).tolist():
+            cols, values = history.user_ratings(raw)
+            inner = updated.item_inner(history.item_ids[cols])
+            old_users.append(np.full((inner >= 0).sum(), updated.user_inner([raw])[0]))
+            old_items.append(inner[inner >= 0])
+            old_ratings.append(values[inner >= 0])
+        users = np.concatenate(old_users + [users])
+        items = np.concatenate(old_items + [items])
+        ratings = np.concatenate(old_ratings + [ratings])
+    # Keep the last rating of each (user, movie) pair
+    keys = users * len(raw_iids) + items
+    _, last = np.unique(keys[::-1], return_index=True)
+    keep = len(keys) - 1 - last
+    users, items, ratings = users[keep], items[keep], ratings[keep]
+
+    affected, local_users = np.unique(users, return_inverse=True)
+    # Without their earlier ratings, known users keep their factors
+    solved = affected >= (0 if history is not None else len(scorer.raw_uids))
+    by_user = sparse.csr_matrix((ratings, (local_users, items)),
+                                shape=(len(affected), len(raw_iids)))
+    by_user.sort_indices()
+    new_items = np.arange(len(scorer.raw_iids), len(raw_iids))
+    by_new_item = by_user[:, new_items].T.tocsr()
+
+    global_mean = updated.global_mean
+    for _ in range(n_iters if len(new_items) else 1):
+        if solved.any():
+            solution = solve_side(by_user[solved], bi, global_mean, qi, reg)
+            pu[affected[solved]], bu[affected[solved]] = solution[:, :-1], solution[:, -1]
+        if len(new_items):
+            solution = solve_side(by_new_item, bu[affected], global_mean, pu[affected], reg)
+            qi[new_items], bi[new_items] = solution[:, :-1], solution[:, -1]
+
+    return updated
+
+
+def append_ratings(new_ratings, path=RATINGS_PATH):
+    """Append ratings to the ratings file, timestamped now.
+
+    Parameters
+    ----------
+    new_ratings : pd.DataFrame
+        Ratings with userId, movieId and rating columns.
+    path : str
+        Ratings file in .csv format, with a timestamp column last.
+
+    """
+    rows = new_ratings[['userId', 'movieId', 'rating']].assign(timestamp=int(time.time()))
+    with open(path, 'rb') as f:
+        f.seek(max(os.path.getsize(path) - 2, 0))
+        ending = f.read()
+    newline = '\r\n' if ending.endswith(b'\r\n') else '\n'
+    with open(path, 'a', newline='') as f:
+        if not ending.endswith(b'\n'):
+            f.write(newline)
+        rows.to_csv(f, header=False, index=False, lineterminator=newline)
+
+
+if __name__ == '__main__':
+    from recommenders.collaborative_based import svd_engine
+
+    parser = argparse.ArgumentParser(
+        description='Fold new ratings into the current model and publish it.')
+    parser.add_argument('ratings', help='CSV file with userId, movieId and rating columns.')
+    parser.add_argument('--reg', type=float, default=0.1)
+    parser.add_argument('--iterations', type=int, default=3)
+    args = parser.parse_args()
+    new_ratings = pd.read_csv(args.ratings, usecols=['userId', 'movieId', 'rating'])
+    scorer = fold_in(svd_engine(), new_ratings['userId'], new_ratings['movieId'],
+                     new_ratings['rating'], history=load_ratings_store(),
+                     reg=args.reg, n_iters=args.iterations)
+    print(f"Folded in {len(new_ratings)} ratings. "
+          f"Published model version: {publish(scorer)}")
+    append_ratings(new_ratings)
+    print(f"Appended the new ratings to: {RATINGS_PATH}")
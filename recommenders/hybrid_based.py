@@ -0,0 +1,159 @@
+"""
+
+    Hybrid content and collaborative filtering for item recommendation.
+
+    Author: Explore Data Science Academy.
+
+    Description: Blends the two precomputed signals that the other
+    recommenders rely on: content similarity from the top-k content
+    neighbour index, and cosine similarity between the SVD item factors
+    held by the item nearest-neighbour index. Only a small candidate set is
+    scored: the precomputed content neighbours of the chosen movies. For
+    these candidates both signals are looked up and scaled to (0, 1]. The
+    blend is weighted by `CONTENT_WEIGHT` and `LATENT_WEIGHT`, and
+    everything is computed in one vectorised pass. This costs about as
+    much as the content-based recommender, and far less than the
+    collaborative one.
+
+    Setting `LATENT_CANDIDATES` widens the candidate set with approximate
+    latent neighbours of the chosen movies' mean factor vector. This finds
+    movies with no content similarity to the choices, at the price of one
+    nearest-neighbour query per recommendation.
+
+"""
+# Script dependencies
+import numpy as np
+from recommenders import model_versions
+from recommenders.collaborative_based import item_ann
+from recommenders.content_based import content_index
+from recommenders.ranking import top_k
+from utils.catalogue import load_catalogue
+from utils.profiling import profiled, span
+from utils.resources import lazy_resource
+
+# Default weights of the content and latent signals in the blend
+CONTENT_WEIGHT = 0.5
+LATENT_WEIGHT = 0.5
+# Approximate latent neighbours added to the candidates (0: none)
+LATENT_CANDIDATES = 0
+# Scaled value of the lowest positive score of a signal, which keeps the
+# blended score of every related candidate positive
+SCALE_FLOOR = 0.01
+
+
+# Row of every catalogue movie in the latent index (-1 if unknown to the model)
+@lazy_resource('latent_rows', stamp=model_versions.current_stamp)
+def latent_rows():
+    return item_ann().rows(load_catalogue().movie_ids)
+
+
+def _scale(scores):
+    """Min-max scale the positive scores to [SCALE_FLOOR, 1], and the
+    others, which mark unrelated candidates, to 0. Constant positive
+    scores, such as those of a single candidate, scale to 1."""
+    scaled = np.zeros(len(scores))
+    positive = scores > 0
+    if not positive.any():
+        return scaled
+    low, high = scores[positive].min(), scores[positive].max()
+    if high <= low:
+        scaled[positive] = 1
+    else:
+        scaled[positive] = SCALE_FLOOR + (1 - SCALE_FLOOR) * (scores[positive] - low) / (high - low)
+    return scaled
+
+
+def hybrid_scores(seed_rows, content_weight=CONTENT_WEIGHT, latent_weight=LATENT_WEIGHT):
+    """Blended scores of the candidates for a set of chosen movies.
+
+    Parameters
+    ----------
+    seed_rows : list (int)
+        Catalogue rows of the chosen movies.
+    content_weight, latent_weight : float
+        Weights of the scaled content and latent similarity.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Catalogue rows of the candidates (chosen movies excluded) and their
+        blended scores.
+
+    """
+    catalogue = load_catalogue()
+    index = content_index()
+    ann = item_ann()
+    to_latent = latent_rows()
+    seed_rows = np.asarray(seed_rows, dtype=np.intp)
+    indexed_seeds = seed_rows[seed_rows < len(index)]
+
+    # Latent vectors of the chosen movies known to the model
+    seed_vectors = to_latent[seed_rows]
+    seed_vectors = ann.vectors[seed_vectors[seed_vectors >= 0]]
+
+    # Candidates: the content neighbours of the chosen movies, with their
+    # content similarity summed over the chosen movies
+    neighbours = [index.neighbours[indexed_seeds].ravel()]
+    similarity = [index.scores[indexed_seeds].ravel()]
+    if LATENT_CANDIDATES and len(seed_vectors):
+        ann_rows, _ = ann.query(seed_vectors.mean(axis=0), LATENT_CANDIDATES, n_probes=1)
+        neighbours.append(catalogue.rows_for_movie_ids(ann.item_ids[ann_rows]))
+        similarity.append(np.zeros(len(ann_rows)))
+    candidates, positions = np.unique(np.concatenate(neighbours), return_inverse=True)
+    content = np.bincount(positions, weights=np.concatenate(similarity),
+                          minlength=len(candidates))
+    keep = (candidates >= 0) & ~np.isin(candidates, seed_rows)
+    candidates, content = candidates[keep], content[keep]
+    if len(candidates) == 0:
+        return candidates, np.empty(0)
+
+    # Latent cosine similarity, averaged over the chosen movies
+    latent = np.zeros(len(candidates))
+    candidate_vectors = to_latent[candidates]
+    has_vector = candidate_vectors >= 0
+    if len(seed_vectors) and has_vector.any():
+        latent[has_vector] = (ann.vectors[candidate_vectors[has_vector]]
+                              @ seed_vectors.T).mean(axis=1)
+
+    # Padding neighbours and other candidates similar to the chosen movies
+    # by neither signal are not recommended
+    related = (content > 0) | (latent > 0)
+    candidates, content, latent = candidates[related], content[related], latent[related]
+
+    blended = content_weight * _scale(content) + latent_weight * _scale(latent)
+    return candidates, blended
+
+
+@profiled('hybrid_model')
+def hybrid_model(movie_list, top_n=10, content_weight=CONTENT_WEIGHT,
+                 latent_weight=LATENT_WEIGHT):
+    """Performs hybrid filtering based upon a list of movies supplied by
+       the app user.
+
+    Parameters
+    ----------
+    movie_list : list (str)
+        Favorite movies chosen by the app user.
+    top_n : int
+        Number of top recommendations to return to the user.
+    content_weight, latent_weight : float
+        Weights of the content and latent similarity in the blend.
+
+    Returns
+    -------
+    list (str)
+        Titles of the top-n movie recommendations to the user.
+
+    """
+    with span('load_catalogue'):
+        catalogue = load_catalogue()
+    with span('resolve_titles'):
+        seed_rows = [catalogue.row(title) for title in movie_list]
+    with span('hybrid_scores'):
+        candidates, scores = hybrid_scores(seed_rows, content_weight, latent_weight)
+    with span('rank'):
+        best = top_k(scores, top_n)
+        best = best[scores[best] > 0]
+    with span('titles'):
+        recommended_movies = catalogue.titles_for(candidates[best])
+    return recommended_movies
@@ -0,0 +1,138 @@
+"""
+
+    Versioned store of published factor models.
+
+    Author: Explore Data Science Academy.
+
+    Description: Trained or updated factor models (`SVDScorer` instances)
+    are published as numbered versions under `resources/models/versions/`.
+    Each version is a directory holding the slim, memory-mapped factor
+    artifact and the item nearest-neighbour index built from it. A
+    `CURRENT` file names the version the app serves. Publishing first
+    writes the new version under a temporary name, then renames it into
+    place, and finally swaps the pointer with `os.replace`. Readers
+    therefore see either the old model or the new one, never a partly
+    written one. Running apps notice the new pointer through
+    `current_stamp` and reload the model without restarting.
+
+    Usage (from the root of this repository), to publish the factors of a
+    pickled surprise SVD model:
+
+        python -m recommenders.model_versions resources/models/SVD.pkl
+
+"""
+# Script dependencies
+import argparse
+import os
+import pickle
+import shutil
+import tempfile
+
+from recommenders.ann import LSHIndex, build_item_index
+from recommenders.svd_engine import SVDScorer
+
+VERSIONS_DIR = 'resources/models/versions'
+POINTER_NAME = 'CURRENT'
+FACTORS_NAME = 'factors'
+ANN_NAME = 'ann.npz'
+
+
+def _pointer_path(versions_dir):
+    return os.path.join(versions_dir, POINTER_NAME)
+
+
+def current_version(versions_dir=VERSIONS_DIR):
+    """Name of the version being served, or None if none was published."""
+    try:
+        with open(_pointer_path(versions_dir)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_stamp(versions_dir=VERSIONS_DIR):
+    """Cheap identifier of the current pointer, which changes on publish."""
+    try:
+        stat = os.stat(_pointer_path(versions_dir))
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns
+
+
+def list_versions(versions_dir=VERSIONS_DIR):
+    """Names of the published versions, oldest first."""
+    if not os.path.isdir(versions_dir):
+        return []
+    return sorted(name for name in os.listdir(versions_dir)
+                  if name.startswith('v') and name[1:].isdigit())
+
+
+def version_path(version, versions_dir=VERSIONS_DIR):
+    return os.path.join(versions_dir, version)
+
+
+def load_version(version=None, versions_dir=VERSIONS_DIR):
+    """Load the factors of a version (by default the current one)."""
+    version = version or current_version(versions_dir)
+    if version is None:
+        raise FileNotFoundError(f"No model has been published in {versions_dir}")
+    return SVDScorer.load(os.path.join(version_path(version, versions_dir), FACTORS_NAME))
+
+
+def load_version_index(version=None, versions_dir=VERSIONS_DIR):
+    """Load the item nearest-neighbour index of a version."""
+    version = version or current_version(versions_dir)
+    if version is None:
+        raise FileNotFoundError(f"No model has been published in {versions_dir}")
+    return LSHIndex.load(os.path.join(version_path(version, versions_dir), ANN_NAME))
+
+
+def publish(scorer, versions_dir=VERSIONS_DIR, keep=5):
+    """Atomically publish a model as the new current version.
+
+    Parameters
+    ----------
+    scorer : SVDScorer
+        Factors to publish.
+    versions_dir : str
+        Directory holding the versions and the `CURRENT` pointer.
+    keep : int
+        Number of most recent versions kept; older ones are deleted.
+
+    Returns
+    -------
+    str
+        Name of the published version.
+
+    """
+    os.makedirs(versions_dir, exist_ok=True)
+    versions = list_versions(versions_dir)
+    number = int(versions[-1][1:]) + 1 if versions else 1
+    version = f'v{number:06d}'
+
+    staging = tempfile.mkdtemp(prefix=f'.{version}-', dir=versions_dir)
+    os.chmod(staging, 0o755)
+    scorer.save(os.path.join(staging, FACTORS_NAME))
+    build_item_index(scorer).save(os.path.join(staging, ANN_NAME))
+    os.replace(staging, version_path(version, versions_dir))
+
+    pointer = _pointer_path(versions_dir)
+    with open(pointer + '.tmp', 'w') as f:
+        f.write(version + '\n')
+    os.replace(pointer + '.tmp', pointer)
+
+    # Processes still serving an old version keep its memory-mapped files
+    # readable until they reload, even once they are deleted
+    for old in list_versions(versions_dir)[:-keep]:
+        shutil.rmtree(version_path(old, versions_dir), ignore_errors=True)
+    return version
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Publish the factors of a pickled surprise SVD model.')
+    parser.add_argument('model', help='Pickled surprise SVD model.')
+    args = parser.parse_args()
+    with open(args.model, 'rb') as f:
+        model = pickle.load(f)
+    print(f"Published model version: {publish(SVDScorer.from_surprise(model))}")
@@ -0,0 +1,172 @@
+"""
+
+    Ranking stage shared by the recommenders.
+
+    Author: Explore Data Science Academy.
+
+    Description: Combines the score vectors of any number of seed (favourite)
+    movies into a single score per candidate in one vectorised pass, masks
+    the seeds and other excluded candidates, and selects the top-n with
+    `argpartition` so that only the selected candidates are sorted. By
+    default only candidates with a positive score are selected, so fewer
+    than n may be returned.
+
+"""
+# Script dependencies
+import numpy as np
+
+# Ways of combining the scores of several seed movies
+AGGREGATIONS = ('sum', 'max', 'weighted')
+DEFAULT_AGGREGATION = 'sum'
+
+
+def top_k(scores, k):
+    """Positions of the `k` highest scores, best first.
+
+    Uses `argpartition` so that only the selected entries are sorted. Ties
+    are resolved in favour of the lower position, giving the same result
+    as a stable descending sort of the full array.
+
+    Parameters
+    ----------
+    scores : np.ndarray
+        One-dimensional array of scores.
+    k : int
+        Number of positions to return.
+
+    Returns
+    -------
+    np.ndarray
+        Positions of the top-k scores, ordered by decreasing score.
+
+    """
+    n = scores.shape[0]
+    if k <= 0 or n == 0:
+        return np.empty(0, dtype=np.intp)
+    if k >= n:
+        return np.argsort(-scores, kind='stable')
+    threshold = scores[np.argpartition(-scores, k - 1)[k - 1]]
+    above = np.flatnonzero(scores > threshold)
+    ties = np.flatnonzero(scores == threshold)[:k - above.size]
+    selected = np.concatenate([above, ties])
+    return selected[np.argsort(-scores[selected], kind='stable')]
+
+
+def merge_seeds(seeds, weights=None):
+    """Seeds without repeats, in order of first occurrence, and their
+    weights, the weights of a repeated seed being added up.
+
+    Parameters
+    ----------
+    seeds : sequence
+        Seed movies, such as titles.
+    weights : sequence (float), optional
+        One weight per entry of `seeds`.
+
+    Returns
+    -------
+    tuple (list, np.ndarray or None)
+        Distinct seeds, and their weights when `weights` is given.
+
+    """
+    unique = list(dict.fromkeys(seeds))
+    if weights is None:
+        return unique, None
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (len(seeds),):
+        raise ValueError(f"Expected one weight per seed ({len(seeds)}), "
+                         f"got {weights.shape[0] if weights.ndim else 'a scalar'}")
+    positions = {seed: position for position, seed in enumerate(unique)}
+    merged = np.zeros(len(unique))
+    np.add.at(merged, [positions[seed] for seed in seeds], weights)
+    return unique, merged
+
+
+def validate_weights(weights, n_seeds):
+    """Seed weights as an array, checked for use by the 'weighted'
+    aggregation: one finite, non-negative weight per seed, not all zero."""
+    if weights is None:
+        raise ValueError("The 'weighted' aggregation needs one weight per seed")
+    weights = np.asarray(weights, dtype=np.float64)
+    if weights.shape != (n_seeds,):
+        raise ValueError(f"Expected one weight per seed ({n_seeds}), "
+                         f"got {weights.shape[0] if weights.ndim else 'a scalar'}")
+    if not np.all(np.isfinite(weights)) or np.any(weights < 0):
+        raise ValueError("Seed weights must be finite and non-negative")
+    if n_seeds and not weights.any():
+        raise ValueError("At least one seed weight must be positive")
+    return weights
+
+
+def aggregate_scores(scores, method=DEFAULT_AGGREGATION, weights=None):
+    """Combine per-seed score vectors into one score per candidate.
+
+    Parameters
+    ----------
+    scores : np.ndarray, shape (n_seeds, n_candidates)
+        Score of every candidate with respect to each seed.
+    method : str
+        'sum' adds the scores of all seeds, rewarding candidates close to
+        several of them; 'max' keeps each candidate's best score;
+        'weighted' adds the scores scaled by `weights`.
+    weights : sequence (float), optional
+        One weight per seed, required by the 'weighted' method (see
+        `validate_weights`).
+
+    Returns
+    -------
+    np.ndarray, shape (n_candidates,)
+        Combined scores.
+
+    """
+    scores = np.asarray(scores)
+    if method == 'sum':
+        return scores.sum(axis=0)
+    if method == 'max':
+        return scores.max(axis=0)
+    if method == 'weighted':
+        return validate_weights(weights, scores.shape[0]).astype(scores.dtype) @ scores
+    raise ValueError(f"Unknown aggregation {method!r}; expected one of {AGGREGATIONS}")
+
+
+def rank(scores, n, exclude=None, method=DEFAULT_AGGREGATION, weights=None,
+         positive_only=True):
+    """Select the top-n candidates for a set of seeds.
+
+    Parameters
+    ----------
+    scores : np.ndarray, shape (n_seeds, n_candidates) or (n_candidates,)
+        Per-seed scores, or scores already combined across seeds.
+    n : int
+        Number of candidates to return.
+    exclude : array-like (int or bool), optional
+        Positions (or a boolean mask) of candidates which must not be
+        returned, such as the seeds themselves.
+    method, weights
+        How per-seed scores are combined; see `aggregate_scores`.
+    positive_only : bool
+        Leave out candidates whose combined score is not positive, i.e.
+        unrelated to the seeds. Fewer than `n` candidates are then
+        returned when fewer have a positive score.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Positions of the selected candidates and their combined scores,
+        best first. Excluded candidates are never returned.
+
+    """
+    scores = np.asarray(scores)
+    if scores.ndim == 2:
+        combined = aggregate_scores(scores, method, weights)
+    else:
+        combined = scores.copy()
+    combined = combined.astype(np.float64, copy=False)
+    if exclude is not None:
+        combined[exclude] = -np.inf
+    best = top_k(combined, n)
+    if positive_only:
+        best = best[combined[best] > 0]
+    else:
+        best = best[combined[best] > -np.inf]
+    return best, combined[best]
@@ -0,0 +1,373 @@
+"""
+
+    Headless JSON HTTP service for the recommenders.
+
+    Author: Explore Data Science Academy.
+
+    Description: Serves recommendations to other systems without going
+    through the Streamlit app. The server is a small HTTP/1.1
+    implementation on asyncio from the standard library, so it runs
+    anywhere the app does. Datasets and models are loaded once when the
+    service starts, and every request shares those instances. Scoring is
+    CPU-bound, so it runs on a pool of worker threads, while the event loop
+    only parses requests and writes responses.
+
+    Requests are micro-batched. Requests for the same engine and number of
+    recommendations wait in a queue, and a worker takes every request
+    queued at that point, up to `max_batch`, as one block. An idle service
+    therefore answers each request at once. Under load, requests pile up
+    while the workers are busy and are served in blocks, which the content
+    engine scores with a single sparse matrix product (see
+    `recommenders.batch`).
+
+    Endpoints:
+
+        GET  /health                     status and batching counters
+        POST /recommend/content          {"movies": [...], "top_n": 10}
+        POST /recommend/collaborative    {"movies": [...], "top_n": 10}
+        POST /recommend/hybrid           {"movies": [...], "top_n": 10}
+        POST /similar                    {"movie": "...", "top_n": 10}
+
+    Recommendations are returned as {"recommendations": [...]}. An unknown
+    title or an invalid request returns status 400 with {"error": "..."}.
+
+    Usage (from the root of this repository):
+
+        python -m recommenders.service --port 8000 --workers 2
+
+"""
+# Script dependencies
+import argparse
+import asyncio
+import collections
+import json
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+from recommenders import batch, collaborative_based, model_versions
+from utils import resources
+
+logger = logging.getLogger('recommender.service')
+
+MAX_TOP_N = 100
+MAX_BODY_BYTES = 1 << 20
+MAX_HEADER_LINES = 100
+# Seconds a connection may stay idle between two requests
+KEEP_ALIVE_TIMEOUT = 15
+
+
+def _similar_block(titles, top_n):
+    """Similar-item results for a block of titles."""
+    results = []
+    for title in titles:
+        try:
+            results.append(collaborative_based.similar_movies(title, top_n))
+        except (KeyError, ValueError) as e:
+            results.append(e)
+    return results
+
+
+def _run_block(engine, top_n, items):
+    if engine == 'similar':
+        return _similar_block(items, top_n)
+    return batch.recommend_batch(items, engine, top_n)
+
+
+class RequestError(Exception):
+    """A request that cannot be served, with the HTTP status to answer."""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class MicroBatcher:
+    """Groups concurrent requests into blocks run on a thread pool.
+
+    Parameters
+    ----------
+    executor : concurrent.futures.Executor
+        Pool the blocks run on.
+    n_workers : int
+        Maximum number of blocks running at once.
+    max_batch : int
+        Maximum number of requests in a block.
+    max_wait : float
+        Seconds to wait for more requests before running a block. The
+        default of 0 only batches requests that queue up while every
+        worker is busy.
+
+    """
+
+    def __init__(self, executor, n_workers, max_batch=64, max_wait=0.):
+        self.executor = executor
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = 0
+        self.batches = 0
+        self._slots = asyncio.Semaphore(n_workers)
+        # Queued (item, future) pairs by (engine, top_n), oldest key first
+        self._queues = collections.OrderedDict()
+        self._queued = asyncio.Event()
+        self._dispatcher = None
+
+    def start(self):
+        self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def stop(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, engine, top_n, item):
+        """Queue one request and wait for its result."""
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault((engine, top_n), []).append((item, future))
+        self.requests += 1
+        self._queued.set()
+        return await future
+
+    async def _dispatch(self):
+        while True:
+            await self._queued.wait()
+            await self._slots.acquire()
+            if self.max_wait:
+                await asyncio.sleep(self.max_wait)
+            key, queue = next(iter(self._queues.items()))
+            block, rest = queue[:self.max_batch], queue[self.max_batch:]
+            if rest:
+                # Leave the rest for the next block, behind other keys
+                del self._queues[key]
+                self._queues[key] = rest
+            else:
+                del self._queues[key]
+                if not self._queues:
+                    self._queued.clear()
+            self.batches += 1
+            asyncio.get_running_loop().create_task(self._run(key, block))
+
+    async def _run(self, key, block):
+        engine, top_n = key
+        items = [item for item, _ in block]
+        try:
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, _run_block, engine, top_n, items)
+        except Exception as e:
+            logger.exception('Block of %d %s requests failed', len(block), engine)
+            results = [e] * len(block)
+        finally:
+            self._slots.release()
+        for (_, future), result in zip(block, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+
+def _top_n(payload):
+    top_n = payload.get('top_n', 10)
+    if not isinstance(top_n, int) or isinstance(top_n, bool) or not 1 <= top_n <= MAX_TOP_N:
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           f"'top_n' must be an integer from 1 to {MAX_TOP_N}")
+    return top_n
+
+
+def _movies(payload):
+    movies = payload.get('movies')
+    if not isinstance(movies, list) or not movies \
+            or not all(isinstance(title, str) for title in movies):
+        raise RequestError(HTTPStatus.BAD_REQUEST,
+                           "'movies' must be a non-empty list of titles")
+    return movies
+
+
+def _movie(payload):
+    movie = payload.get('movie')
+    if not isinstance(movie, str):
+        raise RequestError(HTTPStatus.BAD_REQUEST, "'movie' must be a title")
+    return movie
+
+
+class RecommenderService:
+    """HTTP front end of the recommenders.
+
+    Parameters
+    ----------
+    workers : int
+        Number of threads scoring requests.
+    max_batch : int
+        Maximum number of requests scored as one block.
+    max_wait : float
+        Seconds a block waits for more requests (see `MicroBatcher`).
+
+    """
+
+    ENGINE_PATHS = {f'/recommend/{engine}': engine for engine in batch.ENGINES}
+
+    def __init__(self, workers=2, max_batch=64, max_wait=0.):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.started = None
+        self.executor = None
+        self.batcher = None
+        self.server = None
+
+    async def start(self, host='127.0.0.1', port=8000):
+        """Load the models and start listening; returns the asyncio server."""
+        self.executor = ThreadPoolExecutor(self.workers, thread_name_prefix='recommender')
+        loop = asyncio.get_running_loop()
+        # Load everything once, before the first request is accepted
+        await loop.run_in_executor(self.executor,
+                                   lambda: resources.warm_up(background=False))
+        self.batcher = MicroBatcher(self.executor, self.workers, self.max_batch,
+                                    self.max_wait)
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        self.started = time.time()
+        return self.server
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        if self.batcher is not None:
+            await self.batcher.stop()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+
+    async def handle(self, method, path, payload):
+        """Result of one request, as (status, JSON-serialisable body)."""
+        if path == '/health':
+            if method != 'GET':
+                raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, 'Use GET')
+            return HTTPStatus.OK, {
+                'status': 'ok',
+                'model_version': model_versions.current_version(),
+                'uptime_s': round(time.time() - self.started, 1),
+                'requests': self.batcher.requests,
+                'batches': self.batcher.batches,
+            }
+        if path in self.ENGINE_PATHS:
+            engine, item = self.ENGINE_PATHS[path], _movies
+        elif path == '/similar':
+            engine, item = 'similar', _movie
+        else:
+            raise RequestError(HTTPStatus.NOT_FOUND, f'No endpoint {path}')
+        if method != 'POST':
+            raise RequestError(HTTPStatus.METHOD_NOT_ALLOWED, 'Use POST')
+        if not isinstance(payload, dict):
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Expected a JSON object')
+        try:
+            recommendations = await self.batcher.submit(engine, _top_n(payload), item(payload))
+        except (KeyError, ValueError) as e:
+            message = e.args[0] if e.args else repr(e)
+            raise RequestError(HTTPStatus.BAD_REQUEST, str(message)) from None
+        return HTTPStatus.OK, {'recommendations': recommendations}
+
+    async def _read_request(self, reader):
+        """Method, path, JSON payload and keep-alive flag of the next
+        request, or None once the client has closed the connection."""
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, version = request_line.decode('latin-1').split()
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Malformed request line') from None
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        else:
+            raise RequestError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, 'Too many headers')
+        connection = headers.get('connection', '').lower()
+        keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise RequestError(HTTPStatus.BAD_REQUEST, 'Invalid Content-Length') from None
+        if length > MAX_BODY_BYTES:
+            raise RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, 'Request body too large')
+        payload = None
+        if length:
+            try:
+                payload = json.loads(await reader.readexactly(length))
+            except ValueError:
+                raise RequestError(HTTPStatus.BAD_REQUEST, 'Invalid JSON body') from None
+        return method.upper(), target.split('?', 1)[0], payload, keep_alive
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await asyncio.wait_for(self._read_request(reader),
+                                                     KEEP_ALIVE_TIMEOUT)
+                    if request is None:
+                        break
+                    method, path, payload, keep_alive = request
+                    status, body = await self.handle(method, path, payload)
+                except RequestError as e:
+                    status, body = e.status, {'error': str(e)}
+                except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+                    break
+                except Exception:
+                    logger.exception('Request failed')
+                    status, body = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal error'}
+                data = json.dumps(body).encode()
+                writer.write(
+                    f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+                    f'Content-Type: application/json\r\n'
+                    f'Content-Length: {len(data)}\r\n'
+                    f'Connection: {"keep-alive" if keep_alive else "close"}\r\n'
+                    f'\r\n'.encode('latin-1') + data)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(host='127.0.0.1', port=8000, workers=2, max_batch=64, max_wait=0.):
+    """Run the service until cancelled."""
+    service = RecommenderService(workers, max_batch, max_wait)
+    server = await service.start(host, port)
+    logger.info('Serving recommendations on http://%s:%d', host, port)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Serve recommendations as JSON over HTTP.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2,
+                        help='Number of threads scoring requests.')
+    parser.add_argument('--max-batch', type=int, default=64,
+                        help='Maximum number of requests scored as one block.')
+    parser.add_argument('--max-wait-ms', type=float, default=0.,
+                        help='Time a block waits for more requests to join it.')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.max_batch,
+                          args.max_wait_ms / 1e3))
+    except KeyboardInterrupt:
+        pass
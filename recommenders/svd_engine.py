@@ -0,0 +1,254 @@
+"""
+
+    Vectorised scoring engine for trained SVD models.
+
+    Author: Explore Data Science Academy.
+
+    Description: Extracts the global mean, bias terms and latent factor
+    matrices from a trained `surprise` SVD model so that an item can be
+    scored against every user (or a user against every item) with a single
+    NumPy matrix-vector product. Estimates follow the exact semantics of
+    `SVD.predict`: unknown users or items fall back to the available bias
+    terms and every estimate is clipped to the rating scale. Results agree
+    with `SVD.predict` up to floating-point rounding of the dot products.
+
+    A scorer is saved as a slim artifact: a directory holding the biases,
+    the float32 factor matrices and the raw id arrays as `.npy` files, plus
+    a small `meta.json`. Loading memory-maps the arrays instead of reading
+    them. Every process serving the same artifact therefore shares its
+    pages through the OS page cache, and loading takes next to no time.
+    Raw ids are looked up by binary search over a stored sort order, so no
+    per-process id dictionaries need to be built.
+
+"""
+# Script dependencies
+import json
+import os
+import numpy as np
+from recommenders.ranking import top_k
+
+ARTIFACT_FORMAT_VERSION = 1
+_ARRAYS = ('bu', 'bi', 'pu', 'qi', 'raw_uids', 'raw_iids', 'uid_order', 'iid_order')
+
+
+def _lookup(ids, order, raw_ids):
+    """Positions of `raw_ids` within `ids` (sorted by `order`), -1 if absent."""
+    raw_ids = np.asarray(raw_ids)
+    if len(ids) == 0:
+        return np.full(raw_ids.shape, -1, dtype=np.intp)
+    found = np.minimum(np.searchsorted(ids, raw_ids, sorter=order), len(ids) - 1)
+    inner = order[found]
+    return np.where(ids[inner] == raw_ids, inner, -1).astype(np.intp)
+
+
+class SVDScorer:
+    """Vectorised equivalent of `surprise.SVD.predict`.
+
+    Parameters
+    ----------
+    global_mean : float
+        Mean of all ratings in the training set.
+    bu, bi : np.ndarray
+        User and item biases, indexed by inner id.
+    pu, qi : np.ndarray
+        User and item latent factors, indexed by inner id.
+    raw_uids, raw_iids : np.ndarray
+        Raw user/item id of each inner id.
+    rating_scale : tuple
+        (lowest, highest) possible rating, used to clip estimates.
+    biased : bool
+        Whether the model was trained with bias terms.
+    uid_order, iid_order : np.ndarray, optional
+        Permutations sorting `raw_uids` and `raw_iids`; computed if absent.
+
+    """
+
+    def __init__(self, global_mean, bu, bi, pu, qi, raw_uids, raw_iids,
+                 rating_scale, biased=True, uid_order=None, iid_order=None):
+        self.global_mean = global_mean
+        self.bu = bu
+        self.bi = bi
+        self.pu = pu
+        self.qi = qi
+        self.raw_uids = np.asarray(raw_uids)
+        self.raw_iids = np.asarray(raw_iids)
+        self.rating_scale = rating_scale
+        self.biased = biased
+        self.uid_order = (np.argsort(self.raw_uids, kind='stable')
+                          if uid_order is None else uid_order)
+        self.iid_order = (np.argsort(self.raw_iids, kind='stable')
+                          if iid_order is None else iid_order)
+
+    @classmethod
+    def from_surprise(cls, model):
+        """Build a scorer from a fitted `surprise.SVD` instance."""
+        trainset = model.trainset
+        return cls(global_mean=trainset.global_mean,
+                   bu=model.bu, bi=model.bi, pu=model.pu, qi=model.qi,
+                   raw_uids=np.array([trainset.to_raw_uid(u) for u in trainset.all_users()]),
+                   raw_iids=np.array([trainset.to_raw_iid(i) for i in trainset.all_items()]),
+                   rating_scale=trainset.rating_scale,
+                   biased=model.biased)
+
+    def save(self, path):
+        """Write the scorer as an artifact directory at `path`.
+
+        Factor matrices are stored as float32. The directory is assembled
+        under a temporary name and renamed into place, so readers never see
+        a partly written artifact.
+
+        """
+        if os.path.exists(path):
+            raise FileExistsError(f"Model artifact already exists: {path}")
+        staging = path.rstrip(os.sep) + '.tmp'
+        os.makedirs(staging, exist_ok=True)
+        for name in _ARRAYS:
+            value = getattr(self, name)
+            if name in ('pu', 'qi'):
+                value = value.astype(np.float32, copy=False)
+            np.save(os.path.join(staging, name + '.npy'), np.ascontiguousarray(value))
+        meta = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'global_mean': float(self.global_mean),
+            'rating_scale': [float(bound) for bound in self.rating_scale],
+            'biased': bool(self.biased),
+            'n_users': len(self.raw_uids),
+            'n_items': len(self.raw_iids),
+            'n_factors': int(self.qi.shape[1]),
+        }
+        with open(os.path.join(staging, 'meta.json'), 'w') as f:
+            json.dump(meta, f, indent=2)
+        os.replace(staging, path)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open an artifact written by `save`.
+
+        Parameters
+        ----------
+        path : str
+            Artifact directory.
+        mmap : bool
+            Memory-map the arrays read-only rather than reading them.
+
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+        if meta['format_version'] != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported model artifact version "
+                             f"{meta['format_version']} in {path}")
+        arrays = {name: np.load(os.path.join(path, name + '.npy'),
+                                mmap_mode='r' if mmap else None)
+                  for name in _ARRAYS}
+        return cls(global_mean=meta['global_mean'],
+                   rating_scale=tuple(meta['rating_scale']),
+                   biased=meta['biased'], **arrays)
+
+    def user_inner(self, raw_uids):
+        """Inner ids of raw user ids, with -1 for users unknown to the model."""
+        return _lookup(self.raw_uids, self.uid_order, raw_uids)
+
+    def item_inner(self, raw_iids):
+        """Inner ids of raw item ids, with -1 for items unknown to the model."""
+        return _lookup(self.raw_iids, self.iid_order, raw_iids)
+
+    def _estimate(self, users, items):
+        """Clipped estimates for aligned arrays of inner ids (-1: unknown)."""
+        known_user = users >= 0
+        known_item = items >= 0
+        both = known_user & known_item
+        if self.biased:
+            est = np.full(both.shape, self.global_mean, dtype=np.float64)
+            est += np.where(known_user, self.bu[users], 0.)
+            est += np.where(known_item, self.bi[items], 0.)
+        else:
+            # Impossible predictions default to the global mean
+            est = np.where(both, 0., self.global_mean)
+        est[both] += np.einsum('ij,ij->i', self.qi[items[both]],
+                               self.pu[users[both]])
+        lower, higher = self.rating_scale
+        return np.clip(est, lower, higher)
+
+    def score_item(self, raw_iid, raw_uids=None):
+        """Estimate the rating of one item by many users.
+
+        Parameters
+        ----------
+        raw_iid : object
+            Raw id of the item to score.
+        raw_uids : sequence, optional
+            Raw ids of the users. Defaults to every user of the model.
+
+        Returns
+        -------
+        np.ndarray
+            Estimated ratings, aligned with `raw_uids`.
+
+        """
+        if raw_uids is None:
+            users = np.arange(len(self.raw_uids))
+        else:
+            users = self.user_inner(raw_uids)
+        item = self.item_inner([raw_iid])[0]
+        if item >= 0 and np.all(users >= 0):
+            # Fast path: one matrix-vector product over all users
+            est = np.zeros(len(users))
+            if self.biased:
+                est += self.global_mean
+                est += self.bu[users]
+                est += self.bi[item]
+            est += self.pu[users] @ self.qi[item]
+            lower, higher = self.rating_scale
+            return np.clip(est, lower, higher)
+        return self._estimate(users, np.full(len(users), item))
+
+    def score_user(self, raw_uid, raw_iids=None):
+        """Estimate the ratings a single user gives to many items.
+
+        Parameters
+        ----------
+        raw_uid : object
+            Raw id of the user to score for.
+        raw_iids : sequence, optional
+            Raw ids of the items. Defaults to every item of the model.
+
+        Returns
+        -------
+        np.ndarray
+            Estimated ratings, aligned with `raw_iids`.
+
+        """
+        if raw_iids is None:
+            items = np.arange(len(self.raw_iids))
+        else:
+            items = self.item_inner(raw_iids)
+        user = self.user_inner([raw_uid])[0]
+        return self._estimate(np.full(len(items), user), items)
+
+    def top_users(self, raw_iid, k, raw_uids=None):
+        """Users with the highest estimated rating for an item.
+
+        Returns
+        -------
+        tuple (np.ndarray, np.ndarray)
+            Raw user ids and their estimates, best first.
+
+        """
+        est = self.score_item(raw_iid, raw_uids)
+        uids = self.raw_uids if raw_uids is None else np.asarray(raw_uids)
+        best = top_k(est, k)
+        return uids[best], est[best]
+
+    def top_items(self, raw_uid, k, raw_iids=None):
+        """Items with the highest estimated rating by a user.
+
+        Returns
+        -------
+        tuple (np.ndarray, np.ndarray)
+            Raw item ids and their estimates, best first.
+
+        """
+        est = self.score_user(raw_uid, raw_iids)
+        iids = self.raw_iids if raw_iids is None else np.asarray(raw_iids)
+        best = top_k(est, k)
+        return iids[best], est[best]
@@ -5,36 +5,58 @@
     Author: Explore Data Science Academy.
 
     Description: Simple script to train and save an instance of the
-    SVDpp algorithm on MovieLens data.
+    SVDpp algorithm on MovieLens data. Besides the pickled model, the
+    biases, float32 factors and id maps are published as a slim,
+    memory-mapped model version, which is what the app serves. Ratings
+    are read in bounded chunks into a sparse ratings store, from which
+    the surprise trainset is filled directly, so the whole CSV is never
+    held in memory as a frame.
 
 """
 # Script dependencies
+import os
+import sys
 import numpy as np
-import pandas as pd
 from surprise import SVD
-import surprise
 import pickle
 
-# Importing datasets
-ratings = pd.read_csv('../data/ratings.csv')
-ratings.drop('timestamp',axis=1,inplace=True)
+# Make the repository's packages importable when run from this folder
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from recommenders.ann import build_item_index
+from recommenders.model_versions import publish
+from recommenders.svd_engine import SVDScorer
+from utils.data_loader import iter_ratings
+from utils.ratings_store import RatingsStore
+
+# Importing datasets, one chunk at a time
+ratings = RatingsStore.from_chunks(
+    iter_ratings('../data/ratings.csv', columns=['userId', 'movieId', 'rating']))
 
 def svd_pp(save_path):
     # Check the range of the rating
-    min_rat = ratings['rating'].min()
-    max_rat = ratings['rating'].max()
-    # Changing ratings to their standard form
-    reader = surprise.Reader(rating_scale = (min_rat,max_rat))
-    # Loading the data frame using surprice
-    data_load = surprise.Dataset.load_from_df(ratings, reader)
+    min_rat = float(ratings.csr.data.min())
+    max_rat = float(ratings.csr.data.max())
+    # Loading the ratings into a surprise trainset, on the standard scale
+    trainset = ratings.to_trainset(rating_scale = (min_rat,max_rat))
     # Insatntiating surpricce
     #method = SVD(n_factors = 400 , lr_all = 0.005 , reg_all = 0.02 , n_epochs = 50 , init_std_dev = 0.0001)
     method = SVD(n_epochs=50,n_factors=400,init_std_dev=0.001,random_state=42,verbose=True)
     # Loading a trainset into the model
-    model = method.fit(data_load.build_full_trainset())
+    model = method.fit(trainset)
     print (f"Training completed. Saving model to: {save_path}")
-
-    return pickle.dump(model, open(save_path,'wb'))
+    pickle.dump(model, open(save_path,'wb'))
+
+    # Approximate nearest-neighbour index over the item factors, stored
+    # next to the model for "because you liked X" queries
+    ann_path = os.path.splitext(save_path)[0] + '_ann.npz'
+    print (f"Saving item factor index to: {ann_path}")
+    build_item_index(model).save(ann_path)
+
+    # Slim artifact served by the app, without the trainset
+    versions_dir = os.path.join(os.path.dirname(os.path.abspath(save_path)), 'versions')
+    version = publish(SVDScorer.from_surprise(model), versions_dir)
+    print (f"Published model version {version} to: {versions_dir}")
+    return model
 
 if __name__ == '__main__':
     svd_pp('SVD.pkl')
@@ -0,0 +1,115 @@
+"""
+
+    Hash-based lookup index over the movie catalogue.
+
+    Author: Explore Data Science Academy.
+
+    Description: Maps movie titles and MovieLens movie IDs to catalogue
+    rows (and rows back to titles) with dictionary lookups, replacing
+    linear scans over the 62k titles. Rows are positions in `movies.csv`
+    once records with missing values are dropped. When a title appears
+    more than once, the first occurrence is the one a title resolves to;
+    `rows_for_title` lists every occurrence.
+
+"""
+# Data handling dependencies
+import functools
+import os
+import numpy as np
+from utils import resources
+from utils.data_loader import load_movies
+
+MOVIES_PATH = 'resources/data/movies.csv'
+
+
+class MovieCatalogue:
+    """Lookup index over a movies table.
+
+    Parameters
+    ----------
+    movies : Pandas DataFrame
+        Movie records with `movieId` and `title` columns. Rows are
+        indexed by position.
+
+    """
+
+    def __init__(self, movies):
+        self.movies = movies.reset_index(drop=True)
+        self.titles = self.movies['title'].to_numpy(dtype=object)
+        self.movie_ids = self.movies['movieId'].to_numpy()
+        self._title_rows = {}
+        for row, title in enumerate(self.titles):
+            self._title_rows.setdefault(title, []).append(row)
+        self._movie_id_rows = {movie_id: row for row, movie_id
+                               in enumerate(self.movie_ids.tolist())}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def __contains__(self, title):
+        return title in self._title_rows
+
+    def row(self, title):
+        """Catalogue row of a title (its first occurrence)."""
+        try:
+            return self._title_rows[title][0]
+        except KeyError:
+            raise KeyError(f"Unknown movie title: {title!r}") from None
+
+    def rows_for_title(self, title):
+        """Catalogue rows of every occurrence of a title."""
+        return list(self._title_rows.get(title, []))
+
+    def row_for_movie_id(self, movie_id):
+        """Catalogue row of a MovieLens movie ID."""
+        try:
+            return self._movie_id_rows[movie_id]
+        except KeyError:
+            raise KeyError(f"Unknown movie ID: {movie_id!r}") from None
+
+    def rows_for_movie_ids(self, movie_ids):
+        """Catalogue rows of several movie IDs, -1 for unknown IDs."""
+        return np.fromiter((self._movie_id_rows.get(movie_id, -1)
+                            for movie_id in np.asarray(movie_ids).tolist()),
+                           dtype=np.intp, count=len(movie_ids))
+
+    def movie_id(self, title):
+        """MovieLens movie ID of a title (its first occurrence)."""
+        return self.movie_ids[self.row(title)].item()
+
+    def title(self, row):
+        """Title stored at a catalogue row."""
+        return self.titles[row]
+
+    def titles_for(self, rows):
+        """Titles stored at several catalogue rows, in order."""
+        return self.titles[np.asarray(rows, dtype=np.intp)].tolist()
+
+
+@functools.lru_cache(maxsize=None)
+def _load_catalogue(path):
+    movies = load_movies(path)
+    movies = movies.dropna()
+    return MovieCatalogue(movies)
+
+
+def load_catalogue(path=MOVIES_PATH):
+    """Load the movie catalogue, once per process and path.
+
+    Parameters
+    ----------
+    path : str
+        Relative or absolute path to movie database stored
+        in .csv format.
+
+    Returns
+    -------
+    MovieCatalogue
+        Lookup index over the movies.
+
+    """
+    return _load_catalogue(os.path.abspath(path))
+
+
+# Shared with the rest of the app through the resource registry
+resources.register('catalogue', load_catalogue)
@@ -0,0 +1,240 @@
+"""
+
+    Compact binary columnar storage for the movie and rating tables.
+
+    Author: Explore Data Science Academy.
+
+    Description: A table is stored as a directory holding one `.npy` file
+    per column and a `meta.json` describing the columns. Numeric columns
+    are downcast (int32 ids, float32 ratings) and memory-mapped on read;
+    text columns are stored as UTF-8 bytes plus offsets; low-cardinality
+    text columns (such as genres) are stored as categorical codes. Each
+    table records the modification time and size of the CSV it was
+    converted from, and readers fall back to the CSV whenever the two no
+    longer match.
+
+    Usage (from the root of this repository):
+
+        python -m utils.columnar
+
+"""
+# Data handling dependencies
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+
+FORMAT_VERSION = 1
+
+MOVIES_DTYPES = {'movieId': np.int32, 'title': str, 'genres': 'category'}
+RATINGS_DTYPES = {'userId': np.int32, 'movieId': np.int32,
+                  'rating': np.float32, 'timestamp': np.int64}
+
+
+def columnar_path(csv_path):
+    """Directory holding the columnar copy of a CSV file."""
+    root, _ = os.path.splitext(csv_path)
+    return root + '.cols'
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _smallest_int(codes_max):
+    for dtype in (np.int8, np.int16, np.int32):
+        if codes_max <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
+
+
+def write_table(df, path, source=None):
+    """Write a DataFrame as a columnar table.
+
+    Columns of `category` dtype are stored as codes and categories, other
+    non-numeric columns as UTF-8 strings, and numeric columns as-is.
+
+    Parameters
+    ----------
+    df : Pandas DataFrame
+        Table to store, already cast to the desired dtypes.
+    path : str
+        Output directory; replaced atomically if it already exists.
+    source : str, optional
+        CSV file the table was converted from, whose stamp is recorded.
+
+    """
+    tmp_path = path + '.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    columns = []
+    for name in df.columns:
+        column = df[name]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            codes = column.cat.codes.to_numpy()
+            codes = codes.astype(_smallest_int(max(codes.max(initial=0), 0)))
+            np.save(os.path.join(tmp_path, name + '.codes.npy'), codes)
+            columns.append({'name': name, 'kind': 'categorical',
+                            'categories': column.cat.categories.astype(str).tolist()})
+        elif pd.api.types.is_numeric_dtype(column.dtype):
+            np.save(os.path.join(tmp_path, name + '.npy'), column.to_numpy())
+            columns.append({'name': name, 'kind': 'numeric',
+                            'dtype': str(column.dtype)})
+        else:
+            missing = column.isna().to_numpy()
+            if missing.any():
+                np.save(os.path.join(tmp_path, name + '.missing.npy'), missing)
+            encoded = [b'' if is_missing else str(value).encode('utf-8')
+                       for value, is_missing in zip(column, missing)]
+            offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+            np.cumsum([len(value) for value in encoded], out=offsets[1:])
+            blob = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+            np.save(os.path.join(tmp_path, name + '.bytes.npy'), blob)
+            np.save(os.path.join(tmp_path, name + '.offsets.npy'), offsets)
+            columns.append({'name': name, 'kind': 'string',
+                            'has_missing': bool(missing.any())})
+    meta = {'format_version': FORMAT_VERSION, 'rows': len(df),
+            'columns': columns,
+            'source_stamp': _file_stamp(source) if source else None}
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(path, ignore_errors=True)
+    os.replace(tmp_path, path)
+
+
+def read_meta(path):
+    with open(os.path.join(path, 'meta.json')) as f:
+        return json.load(f)
+
+
+def read_table(path, columns=None, mmap=True):
+    """Read a columnar table into a DataFrame.
+
+    Parameters
+    ----------
+    path : str
+        Table directory written by `write_table`.
+    columns : list (str), optional
+        Columns to read. Defaults to all columns.
+    mmap : bool
+        Memory-map numeric columns instead of reading them into memory.
+
+    Returns
+    -------
+    Pandas DataFrame
+        The stored table.
+
+    """
+    meta = read_meta(path)
+    mmap_mode = 'r' if mmap else None
+    data = {}
+    for column in meta['columns']:
+        name = column['name']
+        if columns is not None and name not in columns:
+            continue
+        if column['kind'] == 'numeric':
+            data[name] = np.load(os.path.join(path, name + '.npy'),
+                                 mmap_mode=mmap_mode)
+        elif column['kind'] == 'categorical':
+            codes = np.load(os.path.join(path, name + '.codes.npy'))
+            data[name] = pd.Categorical.from_codes(codes, column['categories'])
+        else:
+            blob = np.load(os.path.join(path, name + '.bytes.npy')).tobytes()
+            offsets = np.load(os.path.join(path, name + '.offsets.npy')).tolist()
+            values = [blob[start:stop].decode('utf-8')
+                      for start, stop in zip(offsets[:-1], offsets[1:])]
+            if column.get('has_missing'):
+                missing = np.load(os.path.join(path, name + '.missing.npy'))
+                values = [None if is_missing else value
+                          for value, is_missing in zip(values, missing)]
+            data[name] = values
+    order = [name for name in (columns or data) if name in data]
+    return pd.DataFrame(data, columns=order, copy=False)
+
+
+def is_current(csv_path):
+    """Whether a CSV file has an up-to-date columnar copy."""
+    path = columnar_path(csv_path)
+    if not os.path.exists(os.path.join(path, 'meta.json')):
+        return False
+    meta = read_meta(path)
+    if meta.get('format_version') != FORMAT_VERSION:
+        return False
+    # A columnar copy without its CSV is taken as the source of truth
+    return not os.path.exists(csv_path) or meta['source_stamp'] == _file_stamp(csv_path)
+
+
+def read_csv_or_columnar(csv_path, dtypes, columns=None):
+    """Read a table from its columnar copy when current, else from CSV.
+
+    Parameters
+    ----------
+    csv_path : str
+        Relative or absolute path to the table stored in .csv format.
+    dtypes : dict
+        Column dtypes applied when falling back to the CSV.
+    columns : list (str), optional
+        Columns to read. Defaults to all columns.
+
+    Returns
+    -------
+    Pandas DataFrame
+        The table, with compact dtypes.
+
+    """
+    if is_current(csv_path):
+        return read_table(columnar_path(csv_path), columns)
+    if columns is not None:
+        dtypes = {name: dtype for name, dtype in dtypes.items() if name in columns}
+    return pd.read_csv(csv_path, usecols=columns, dtype=dtypes)
+
+
+def iter_csv_or_columnar(csv_path, dtypes, columns=None, chunk_size=1_000_000):
+    """Read a table in chunks of at most `chunk_size` rows.
+
+    Chunks of a current columnar copy are slices of its memory-mapped
+    columns; otherwise the CSV is parsed one chunk at a time. Either way
+    only one chunk is held in memory by the reader.
+
+    Parameters
+    ----------
+    csv_path : str
+        Relative or absolute path to the table stored in .csv format.
+    dtypes : dict
+        Column dtypes applied when falling back to the CSV.
+    columns : list (str), optional
+        Columns to read. Defaults to all columns.
+    chunk_size : int
+        Maximum number of rows per chunk.
+
+    Yields
+    ------
+    Pandas DataFrame
+        Consecutive rows of the table, with compact dtypes.
+
+    """
+    if is_current(csv_path):
+        table = read_table(columnar_path(csv_path), columns)
+        for start in range(0, len(table), chunk_size):
+            yield table.iloc[start:start + chunk_size]
+        return
+    if columns is not None:
+        dtypes = {name: dtype for name, dtype in dtypes.items() if name in columns}
+    with pd.read_csv(csv_path, usecols=columns, dtype=dtypes, chunksize=chunk_size) as reader:
+        yield from reader
+
+
+def convert_csv(csv_path, dtypes):
+    """Write the columnar copy of a CSV file, cast to `dtypes`."""
+    df = pd.read_csv(csv_path, dtype=dtypes)
+    write_table(df, columnar_path(csv_path), source=csv_path)
+    return df
+
+
+if __name__ == '__main__':
+    for csv_path, dtypes in [('resources/data/movies.csv', MOVIES_DTYPES),
+                             ('resources/data/ratings.csv', RATINGS_DTYPES)]:
+        df = convert_csv(csv_path, dtypes)
+        print(f"Converted {csv_path} ({len(df)} rows) to: {columnar_path(csv_path)}")
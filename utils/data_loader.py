@@ -8,6 +8,77 @@
 # Data handling dependencies
 import pandas as pd
 import numpy as np
+from utils.columnar import (read_csv_or_columnar, iter_csv_or_columnar,
+                            MOVIES_DTYPES, RATINGS_DTYPES)
+
+# Number of rating records read at a time by `iter_ratings`
+CHUNK_SIZE = 1_000_000
+
+def load_movies(path_to_movies, columns=None):
+    """Load movie records, with int32 ids and categorical genres.
+
+    Reads the binary columnar copy of the file when it is up to date
+    (see `utils.columnar`), falling back to the .csv file otherwise.
+
+    Parameters
+    ----------
+    path_to_movies : str
+        Relative or absolute path to movie database stored
+        in .csv format.
+    columns : list (str), optional
+        Columns to load. Defaults to all columns.
+
+    Returns
+    -------
+    Pandas DataFrame
+        Movie records.
+
+    """
+    return read_csv_or_columnar(path_to_movies, MOVIES_DTYPES, columns)
+
+def load_ratings(path_to_ratings, columns=None):
+    """Load rating records, with int32 ids and float32 ratings.
+
+    Reads the binary columnar copy of the file when it is up to date
+    (see `utils.columnar`), falling back to the .csv file otherwise.
+
+    Parameters
+    ----------
+    path_to_ratings : str
+        Relative or absolute path to rating database stored
+        in .csv format.
+    columns : list (str), optional
+        Columns to load. Defaults to all columns.
+
+    Returns
+    -------
+    Pandas DataFrame
+        Rating records.
+
+    """
+    return read_csv_or_columnar(path_to_ratings, RATINGS_DTYPES, columns)
+
+def iter_ratings(path_to_ratings, columns=None, chunk_size=CHUNK_SIZE):
+    """Stream rating records in bounded chunks, with int32 ids and float32
+    ratings, so that tables larger than memory can be processed.
+
+    Parameters
+    ----------
+    path_to_ratings : str
+        Relative or absolute path to rating database stored
+        in .csv format.
+    columns : list (str), optional
+        Columns to load. Defaults to all columns.
+    chunk_size : int
+        Maximum number of records per chunk.
+
+    Returns
+    -------
+    iterator (Pandas DataFrame)
+        Consecutive chunks of rating records.
+
+    """
+    return iter_csv_or_columnar(path_to_ratings, RATINGS_DTYPES, columns, chunk_size)
 
 def load_movie_titles(path_to_movies):
     """Load movie titles from database records.
@@ -24,7 +95,6 @@ def load_movie_titles(path_to_movies):
         Movie titles.
 
     """
-    df = pd.read_csv(path_to_movies)
-    df = df.dropna()
-    movie_list = df['title'].to_list()
+    from utils.catalogue import load_catalogue
+    movie_list = load_catalogue(path_to_movies).titles.tolist()
     return movie_list
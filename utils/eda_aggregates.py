@@ -0,0 +1,214 @@
+"""
+
+    Precomputed aggregates behind the exploratory data analysis page.
+
+    Author: Explore Data Science Academy.
+
+    Description: Computes the summary tables shown on the "Uncovering
+    Patterns of Movie Data" page from `movies.csv` and `ratings.csv`.
+    Ratings are read once, in chunks, from their columnar copy when it is
+    current and from the CSV otherwise, and folded into a rating count and
+    sum per movie. Every table is then derived from these totals and the
+    movie records:
+
+    - the number of ratings per genre;
+    - the number of movies released, and of ratings they received, per
+      year;
+    - the highest rated drama movies.
+
+    The MovieLens files have no director information, so the two director
+    tables are carried over from their hand-exported CSV files. The tables
+    are stored in one JSON artifact along with a format version and the
+    modification time and size of every source file. `load_aggregates`
+    rebuilds the artifact when it is missing, in an older format, or older
+    than its sources.
+
+    Usage (from the root of this repository):
+
+        python -m utils.eda_aggregates
+
+"""
+# Data handling dependencies
+import argparse
+import hashlib
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from utils.data_loader import iter_ratings, load_movies
+
+FORMAT_VERSION = 1
+AGGREGATES_PATH = 'resources/data/eda_aggregates.json'
+MOVIES_PATH = 'resources/data/movies.csv'
+RATINGS_PATH = 'resources/data/ratings.csv'
+# Tables without a source in the MovieLens data, kept as exported
+CARRIED_TABLES = {
+    'top_directors': 'resources/data/top_10_directors_most_rated_movies.csv',
+    'luc_besson_movies': 'resources/data/luc_besson_movies.csv',
+}
+# First release year of the yearly summary
+FIRST_YEAR = 1990
+# Length of the top-rated list, and ratings a movie needs to be listed
+TOP_N = 10
+MIN_RATINGS = 20
+CHUNK_SIZE = 1_000_000
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return [stat.st_mtime_ns, stat.st_size]
+
+
+def _sources(movies_path, ratings_path):
+    return {'movies': movies_path, 'ratings': ratings_path, **CARRIED_TABLES}
+
+
+def source_version(movies_path=MOVIES_PATH, ratings_path=RATINGS_PATH):
+    """Identifier of the current source files, which changes with any of
+    them; cheap enough to call on every page render."""
+    stamps = {name: _file_stamp(path) for name, path
+              in _sources(movies_path, ratings_path).items()}
+    key = json.dumps([FORMAT_VERSION, stamps], sort_keys=True)
+    return hashlib.sha1(key.encode()).hexdigest()[:12]
+
+
+def rating_totals(ratings_path, movie_ids, chunk_size=CHUNK_SIZE):
+    """Number and sum of the ratings of each movie, in one pass.
+
+    Parameters
+    ----------
+    ratings_path : str
+        Ratings file in .csv format.
+    movie_ids : np.ndarray (int)
+        MovieLens movie IDs to total the ratings of.
+    chunk_size : int
+        Number of ratings read at a time.
+
+    Returns
+    -------
+    tuple (np.ndarray, np.ndarray)
+        Rating count and rating sum of each movie of `movie_ids`. Ratings
+        of other movies are ignored.
+
+    """
+    order = np.argsort(movie_ids)
+    sorted_ids = movie_ids[order]
+    counts = np.zeros(len(movie_ids), dtype=np.int64)
+    sums = np.zeros(len(movie_ids))
+    for chunk in iter_ratings(ratings_path, columns=['movieId', 'rating'],
+                              chunk_size=chunk_size):
+        ids = chunk['movieId'].to_numpy()
+        positions = np.minimum(np.searchsorted(sorted_ids, ids), len(sorted_ids) - 1)
+        known = sorted_ids[positions] == ids
+        rows = order[positions[known]]
+        counts += np.bincount(rows, minlength=len(movie_ids))
+        sums += np.bincount(rows, weights=chunk['rating'].to_numpy()[known],
+                            minlength=len(movie_ids))
+    return counts, sums
+
+
+def compute_aggregates(movies_path=MOVIES_PATH, ratings_path=RATINGS_PATH,
+                       chunk_size=CHUNK_SIZE):
+    """Compute every table of the EDA page.
+
+    Returns
+    -------
+    dict (str: Pandas DataFrame)
+        Tables by name.
+
+    """
+    movies = load_movies(movies_path).dropna().reset_index(drop=True)
+    counts, sums = rating_totals(ratings_path, movies['movieId'].to_numpy(), chunk_size)
+    movies['count'] = counts
+    movies['sum'] = sums
+
+    genres = movies[['genres', 'count']].assign(
+        genres=movies['genres'].astype(str).str.split('|')).explode('genres')
+    genre_counts = (genres.groupby('genres')['count'].sum()
+                    .sort_values(ascending=False, kind='stable').reset_index())
+    genre_counts.columns = ['Genre', 'No of ratings']
+
+    movies['year'] = pd.to_numeric(
+        movies['title'].str.extract(r'\((\d{4})\)\s*$')[0], errors='coerce')
+    released = movies[movies['year'] >= FIRST_YEAR]
+    year_summary = released.groupby('year').agg(
+        movies=('movieId', 'size'), ratings=('count', 'sum')).reset_index()
+    year_summary.columns = ['Year', 'Number of Movies', 'Number of Ratings']
+    year_summary['Year'] = year_summary['Year'].astype(int)
+
+    is_drama = movies['genres'].astype(str).str.contains(r'(?:^|\|)Drama(?:\||$)')
+    dramas = movies[is_drama & (movies['count'] >= MIN_RATINGS)]
+    dramas = dramas.assign(mean=dramas['sum'] / dramas['count'])
+    top_drama = dramas.sort_values(['mean', 'count'], ascending=False, kind='stable').head(TOP_N)
+    top_drama = pd.DataFrame({'Movie Title': top_drama['title'].to_numpy(),
+                              'Rating': top_drama['mean'].round(2).to_numpy()})
+
+    tables = {'genre_counts': genre_counts, 'year_summary': year_summary,
+              'top_drama': top_drama}
+    for name, path in CARRIED_TABLES.items():
+        tables[name] = pd.read_csv(path, index_col=0)
+    return tables
+
+
+def build_aggregates(path=AGGREGATES_PATH, movies_path=MOVIES_PATH,
+                     ratings_path=RATINGS_PATH, chunk_size=CHUNK_SIZE):
+    """Compute the tables and store them, with their provenance, as the
+    aggregates artifact. The file is replaced atomically.
+
+    Returns
+    -------
+    dict
+        The stored artifact (see `load_aggregates`).
+
+    """
+    version = source_version(movies_path, ratings_path)
+    tables = compute_aggregates(movies_path, ratings_path, chunk_size)
+    artifact = {
+        'format_version': FORMAT_VERSION,
+        'version': version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sources': {name: {'path': source, 'stamp': _file_stamp(source)}
+                    for name, source in _sources(movies_path, ratings_path).items()},
+        'tables': {name: {'columns': table.columns.tolist(),
+                          'rows': table.to_numpy().tolist()}
+                   for name, table in tables.items()},
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(artifact, f)
+    os.replace(tmp_path, path)
+    return artifact
+
+
+def load_aggregates(path=AGGREGATES_PATH, movies_path=MOVIES_PATH,
+                    ratings_path=RATINGS_PATH):
+    """Load the aggregates artifact, rebuilding it if it is out of date.
+
+    Returns
+    -------
+    tuple (str, dict (str: Pandas DataFrame))
+        Version of the aggregates and the tables by name.
+
+    """
+    version = source_version(movies_path, ratings_path)
+    artifact = None
+    if os.path.exists(path):
+        with open(path) as f:
+            artifact = json.load(f)
+    if artifact is None or artifact.get('format_version') != FORMAT_VERSION \
+            or artifact.get('version') != version:
+        artifact = build_aggregates(path, movies_path, ratings_path)
+    tables = {name: pd.DataFrame(table['rows'], columns=table['columns'])
+              for name, table in artifact['tables'].items()}
+    return artifact['version'], tables
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compute the aggregates shown on the EDA page.')
+    parser.add_argument('--output', default=AGGREGATES_PATH)
+    parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+    args = parser.parse_args()
+    artifact = build_aggregates(args.output, chunk_size=args.chunk_size)
+    print(f"Aggregates version {artifact['version']} saved to: {args.output}")
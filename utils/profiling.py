@@ -0,0 +1,204 @@
+"""
+
+    Lightweight per-stage timing and memory counters.
+
+    Author: Explore Data Science Academy.
+
+    Description: Recommenders wrap their entry point with `profiled` and
+    each stage with `span`. One call of a profiled function is a trace. A
+    trace records every stage's wall time, the process's resident memory
+    after the stage, and how much that memory grew. Spans nest, so a stage
+    that calls another recommender shows up as its own span. Finished
+    traces are logged as one JSON object per line on the
+    `recommender.profiling` logger. The most recent traces are also kept
+    in memory for the app's debug panel.
+
+    To collect the logs in a file, set RECOMMENDER_PROFILING_LOG to its
+    path. Set the environment variable RECOMMENDER_PROFILING=0 to turn
+    profiling off. A disabled span is a shared no-op context manager, and a
+    disabled profiled function adds one flag check to each call.
+
+"""
+# Script dependencies
+import collections
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ENV_VAR = 'RECOMMENDER_PROFILING'
+LOG_ENV_VAR = 'RECOMMENDER_PROFILING_LOG'
+# Number of finished traces kept for the debug panel
+HISTORY_SIZE = 50
+
+logger = logging.getLogger('recommender.profiling')
+if os.environ.get(LOG_ENV_VAR):
+    _handler = logging.FileHandler(os.environ[LOG_ENV_VAR])
+    _handler.setFormatter(logging.Formatter('%(message)s'))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_enabled = os.environ.get(ENV_VAR, '1').strip().lower() not in ('0', 'false', 'off', 'no')
+_local = threading.local()
+_history = collections.deque(maxlen=HISTORY_SIZE)
+_history_lock = threading.Lock()
+_null_span = contextlib.nullcontext()
+_page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+# Open /proc/self/statm of the process that opened it, as (pid, fd)
+_statm = (None, None)
+
+
+def enabled():
+    """Whether spans and traces are being recorded."""
+    return _enabled
+
+
+def set_enabled(value):
+    """Turn profiling on or off for the whole process."""
+    global _enabled
+    _enabled = bool(value)
+
+
+def rss_mb():
+    """Resident memory of the process in MB, or None if unavailable."""
+    global _statm
+    pid, fd = _statm
+    try:
+        # The file stays open, so each reading is a single system call.
+        # A forked child reopens it, as /proc/self was resolved on opening.
+        if pid != os.getpid():
+            fd = os.open('/proc/self/statm', os.O_RDONLY)
+            _statm = (os.getpid(), fd)
+        return int(os.pread(fd, 128, 0).split()[1]) * _page_size / 2 ** 20
+    except (OSError, AttributeError, IndexError, ValueError):
+        return None
+
+
+def peak_rss_mb():
+    """Peak resident memory of the process in MB, or None if unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in KB on Linux, in bytes on macOS
+    return round(peak / 2 ** 20 if sys.platform == 'darwin' else peak / 2 ** 10, 1)
+
+
+class _Span:
+    """Timing and memory of one stage of the active trace."""
+
+    __slots__ = ('trace', 'name', 'depth', 'start', 'rss_start')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.depth = self.trace['_depth']
+        self.trace['_depth'] += 1
+        self.rss_start = rss_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        rss = rss_mb()
+        self.trace['_depth'] -= 1
+        self.trace['spans'].append({
+            'name': self.name,
+            'depth': self.depth,
+            'start_ms': round((self.start - self.trace['_start']) * 1e3, 3),
+            'ms': round(elapsed * 1e3, 3),
+            'rss_mb': None if rss is None else round(rss, 1),
+            'rss_delta_mb': None if rss is None or self.rss_start is None
+            else round(rss - self.rss_start, 1),
+        })
+        return False
+
+
+def span(name):
+    """Context manager timing one stage of the active trace.
+
+    Outside a trace, or with profiling disabled, it does nothing.
+
+    Parameters
+    ----------
+    name : str
+        Name of the stage, such as 'rank'.
+
+    """
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return _null_span
+    return _Span(trace, name)
+
+
+def profiled(name):
+    """Decorator recording each call of a function as a trace.
+
+    A call made while another trace is active is recorded as a span of
+    that trace instead.
+
+    Parameters
+    ----------
+    name : str
+        Name of the trace, such as 'content_model'.
+
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return function(*args, **kwargs)
+            if getattr(_local, 'trace', None) is not None:
+                with span(name):
+                    return function(*args, **kwargs)
+            start = time.perf_counter()
+            trace = {'name': name, 'spans': [], '_depth': 0, '_start': start}
+            _local.trace = trace
+            error = None
+            try:
+                return function(*args, **kwargs)
+            except Exception as e:
+                error = type(e).__name__
+                raise
+            finally:
+                _local.trace = None
+                _finish(trace, time.perf_counter() - start, error)
+        return wrapper
+    return decorator
+
+
+def _finish(trace, elapsed, error):
+    del trace['_depth'], trace['_start']
+    # Spans are appended as they end; report them in the order they began
+    trace['spans'].sort(key=lambda s: s['start_ms'])
+    trace.update({
+        'timestamp': round(time.time(), 3),
+        'total_ms': round(elapsed * 1e3, 3),
+        'peak_rss_mb': peak_rss_mb(),
+        'error': error,
+    })
+    with _history_lock:
+        _history.append(trace)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(trace))
+
+
+def recent_traces(name=None):
+    """Finished traces, most recent first, optionally only those of `name`."""
+    with _history_lock:
+        traces = list(_history)
+    return [trace for trace in reversed(traces) if name is None or trace['name'] == name]
+
+
+def clear_traces():
+    with _history_lock:
+        _history.clear()
@@ -0,0 +1,264 @@
+"""
+
+    Sparse user x item ratings store.
+
+    Author: Explore Data Science Academy.
+
+    Description: Holds the ratings table as a user-major (CSR) and an
+    item-major (CSC) sparse matrix together with int32 maps between raw
+    MovieLens ids and matrix positions. The store is built directly from
+    the (userId, movieId, rating) columns without pivoting, persisted next
+    to the other model binaries and reused until `ratings.csv` changes.
+    Per-user and per-item ratings are returned as views into the matrices,
+    so neighbourhoods can be assembled without copying rating data.
+
+    Ratings are ingested in bounded chunks. Only the compact id and rating
+    columns of each chunk are kept, and the id maps grow chunk by chunk,
+    so peak memory follows the size of the matrices rather than that of
+    the CSV text.
+
+"""
+# Data handling dependencies
+import collections
+import functools
+import os
+import numpy as np
+from scipy import sparse
+from utils import resources
+from utils.data_loader import iter_ratings
+
+RATINGS_PATH = 'resources/data/ratings.csv'
+STORE_PATH = 'resources/models/ratings_store.npz'
+
+
+class RatingsStore:
+    """User x item ratings held in CSR and CSC form.
+
+    Parameters
+    ----------
+    user_ids : np.ndarray (int32)
+        Sorted raw user ids; `user_ids[row]` is the user of a CSR row.
+    item_ids : np.ndarray (int32)
+        Sorted raw movie ids; `item_ids[col]` is the movie of a column.
+    csr : scipy.sparse.csr_matrix (float32)
+        Ratings with users as rows and movies as columns.
+
+    """
+
+    def __init__(self, user_ids, item_ids, csr):
+        self.user_ids = np.asarray(user_ids, dtype=np.int32)
+        self.item_ids = np.asarray(item_ids, dtype=np.int32)
+        self.csr = csr
+        self.csc = csr.tocsc()
+
+    @property
+    def shape(self):
+        return self.csr.shape
+
+    @property
+    def nnz(self):
+        return self.csr.nnz
+
+    @classmethod
+    def from_frame(cls, ratings_df):
+        """Build a store from a frame with userId, movieId and rating columns."""
+        return cls.from_chunks([ratings_df])
+
+    @classmethod
+    def from_chunks(cls, chunks):
+        """Build a store from frames of rating records, read one at a time.
+
+        Parameters
+        ----------
+        chunks : iterable (Pandas DataFrame)
+            Consecutive chunks with userId, movieId and rating columns,
+            such as `iter_ratings` yields. When a user rated a movie more
+            than once, the last rating is kept.
+
+        Returns
+        -------
+        RatingsStore
+            Store of every rating of the chunks.
+
+        """
+        users, items, ratings = [], [], []
+        user_ids = item_ids = np.empty(0, dtype=np.int32)
+        for chunk in chunks:
+            # Copies, so that the chunk itself can be released
+            users.append(chunk['userId'].to_numpy(np.int32, copy=True))
+            items.append(chunk['movieId'].to_numpy(np.int32, copy=True))
+            ratings.append(chunk['rating'].to_numpy(np.float32, copy=True))
+            user_ids = np.union1d(user_ids, users[-1])
+            item_ids = np.union1d(item_ids, items[-1])
+        n_ratings = sum(len(chunk) for chunk in ratings)
+        # Raw ids become positions chunk by chunk, each chunk being
+        # released once converted. Ratings are usually stored by user and
+        # movie already, without repeats, which is checked on the way.
+        rows = np.empty(n_ratings, dtype=np.int32)
+        cols = np.empty(n_ratings, dtype=np.int32)
+        data = np.empty(n_ratings, dtype=np.float32)
+        start, ordered, previous = 0, True, -1
+        while ratings:
+            stop = start + len(ratings[0])
+            rows[start:stop] = np.searchsorted(user_ids, users.pop(0))
+            cols[start:stop] = np.searchsorted(item_ids, items.pop(0))
+            data[start:stop] = ratings.pop(0)
+            if ordered and stop > start:
+                key = rows[start:stop].astype(np.int64) * len(item_ids) + cols[start:stop]
+                ordered = key[0] > previous and bool(np.all(key[1:] > key[:-1]))
+                previous = key[-1]
+            start = stop
+
+        if not ordered:
+            # A stable sort by user and movie keeps repeated ratings of a
+            # movie in file order, and only the last of them is kept
+            key = rows.astype(np.int64) * len(item_ids) + cols
+            order = np.argsort(key, kind='stable')
+            key, rows, cols, data = key[order], rows[order], cols[order], data[order]
+            del order
+            last = np.ones(n_ratings, dtype=bool)
+            last[:-1] = key[1:] != key[:-1]
+            del key
+            rows, cols, data = rows[last], cols[last], data[last]
+        indptr = np.zeros(len(user_ids) + 1, dtype=np.int32 if n_ratings < 2 ** 31 else np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(user_ids)), out=indptr[1:])
+        del rows
+        csr = sparse.csr_matrix((data, cols, indptr), shape=(len(user_ids), len(item_ids)))
+        csr.has_sorted_indices = True
+        return cls(user_ids, item_ids, csr)
+
+    @functools.cached_property
+    def item_counts(self):
+        """Number of ratings of each movie (column)."""
+        return np.diff(self.csc.indptr)
+
+    @functools.cached_property
+    def item_means(self):
+        """Mean rating of each movie (column); 0 for unrated movies."""
+        sums = np.bincount(self.csr.indices, weights=self.csr.data, minlength=self.shape[1])
+        counts = self.item_counts
+        return np.where(counts > 0, sums / np.maximum(counts, 1), 0.).astype(np.float32)
+
+    def to_trainset(self, rating_scale=(0, 5)):
+        """The ratings as a surprise Trainset, without an intermediate
+        frame. Inner ids are matrix positions, so `user_ids[inner_uid]`
+        is the raw id of an inner user id.
+
+        Parameters
+        ----------
+        rating_scale : tuple
+            (lowest, highest) possible rating.
+
+        Returns
+        -------
+        surprise.Trainset
+            Trainset holding every rating of the store.
+
+        """
+        from surprise import Trainset
+        ur = collections.defaultdict(list)
+        ir = collections.defaultdict(list)
+        for matrix, lists in ((self.csr, ur), (self.csc, ir)):
+            indices, data = matrix.indices.tolist(), matrix.data.tolist()
+            indptr = matrix.indptr.tolist()
+            for position, (start, stop) in enumerate(zip(indptr[:-1], indptr[1:])):
+                if stop > start:
+                    lists[position] = list(zip(indices[start:stop], data[start:stop]))
+        return Trainset(ur, ir, len(self.user_ids), len(self.item_ids), self.nnz,
+                        tuple(rating_scale),
+                        dict(zip(self.user_ids.tolist(), range(len(self.user_ids)))),
+                        dict(zip(self.item_ids.tolist(), range(len(self.item_ids)))))
+
+    def _positions(self, ids, raw_ids):
+        """Positions of raw ids within a sorted id array, -1 if absent."""
+        raw_ids = np.asarray(raw_ids)
+        pos = np.searchsorted(ids, raw_ids)
+        pos = np.minimum(pos, len(ids) - 1)
+        return np.where(ids[pos] == raw_ids, pos, -1)
+
+    def user_rows(self, user_ids):
+        """CSR rows of raw user ids (-1 for unknown users)."""
+        return self._positions(self.user_ids, user_ids)
+
+    def item_cols(self, item_ids):
+        """Matrix columns of raw movie ids (-1 for unknown movies)."""
+        return self._positions(self.item_ids, item_ids)
+
+    def user_ratings(self, user_id):
+        """Columns and ratings of one user, as views into the CSR matrix."""
+        row = self.user_rows([user_id])[0]
+        if row < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, stop = self.csr.indptr[row], self.csr.indptr[row + 1]
+        return self.csr.indices[start:stop], self.csr.data[start:stop]
+
+    def item_ratings(self, item_id):
+        """Rows and ratings of one movie, as views into the CSC matrix."""
+        col = self.item_cols([item_id])[0]
+        if col < 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float32)
+        start, stop = self.csc.indptr[col], self.csc.indptr[col + 1]
+        return self.csc.indices[start:stop], self.csc.data[start:stop]
+
+    def save(self, path, stamp=(0, 0)):
+        np.savez(path, user_ids=self.user_ids, item_ids=self.item_ids,
+                 data=self.csr.data, indices=self.csr.indices,
+                 indptr=self.csr.indptr, stamp=np.asarray(stamp, dtype=np.int64))
+
+    @classmethod
+    def load(cls, path):
+        """Load a saved store, returning it with the stamp of its source."""
+        with np.load(path) as saved:
+            shape = (len(saved['user_ids']), len(saved['item_ids']))
+            csr = sparse.csr_matrix(
+                (saved['data'], saved['indices'], saved['indptr']), shape=shape)
+            store = cls(saved['user_ids'], saved['item_ids'], csr)
+            return store, tuple(saved['stamp'].tolist())
+
+
+def _file_stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+# Stale stores drop out as the ratings file changes
+@functools.lru_cache(maxsize=4)
+def _load_ratings_store(path, store_path, stamp):
+    if store_path and os.path.exists(store_path):
+        store, saved_stamp = RatingsStore.load(store_path)
+        if saved_stamp == stamp:
+            return store
+    store = RatingsStore.from_chunks(
+        iter_ratings(path, columns=['userId', 'movieId', 'rating']))
+    if store_path:
+        store.save(store_path, stamp)
+    return store
+
+
+def load_ratings_store(path=RATINGS_PATH, store_path=STORE_PATH):
+    """Load the ratings store for a ratings file.
+
+    The store is read from `store_path` when it was built from the current
+    version of the ratings file, and rebuilt (then saved) otherwise. It is
+    held in memory once per process until the ratings file changes.
+
+    Parameters
+    ----------
+    path : str
+        Relative or absolute path to the ratings data in .csv format.
+    store_path : str or None
+        Location of the persisted store; None disables persistence.
+
+    Returns
+    -------
+    RatingsStore
+        Sparse ratings matrices and id maps.
+
+    """
+    store_path = os.path.abspath(store_path) if store_path else None
+    return _load_ratings_store(os.path.abspath(path), store_path,
+                               _file_stamp(path))
+
+
+# Shared with the rest of the app through the resource registry
+resources.register('ratings_store', load_ratings_store)
@@ -0,0 +1,166 @@
+"""
+
+    Lazy, process-wide loading of datasets and models.
+
+    Author: Explore Data Science Academy.
+
+    Description: Datasets and models are registered under a name together
+    with the function that loads them. Nothing is read until a resource is
+    first requested, after which the single loaded instance is shared by
+    every module. `warm_up` loads registered resources ahead of time on a
+    background thread, so that a Streamlit worker can serve its first page
+    immediately and have the models ready by the time they are needed.
+    A resource can also be given a stamp function, such as the version of a
+    published model. It is then reloaded as soon as the stamp changes.
+
+"""
+import threading
+
+_registry = {}
+_warm_up_thread = None
+_warm_up_lock = threading.Lock()
+
+
+class LazyResource:
+    """A value loaded on first call and shared afterwards.
+
+    Parameters
+    ----------
+    name : str
+        Name the resource is registered under.
+    loader : callable
+        Function without arguments which loads the resource.
+    stamp : callable, optional
+        Cheap function without arguments identifying the version of the
+        resource on disk. When given, it is checked on every call and the
+        resource is reloaded as soon as its value changes, so that a newly
+        published model is picked up without restarting the app.
+
+    """
+
+    def __init__(self, name, loader, stamp=None):
+        self.name = name
+        self.loader = loader
+        self.stamp = stamp
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._value = None
+        self._stamp = None
+
+    def __call__(self):
+        stamp = self.stamp() if self.stamp is not None else None
+        if not self._loaded or stamp != self._stamp:
+            with self._lock:
+                if not self._loaded or stamp != self._stamp:
+                    self._value = self.loader()
+                    self._stamp = stamp
+                    self._loaded = True
+        return self._value
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def invalidate(self):
+        """Drop the loaded instance so that the next call reloads it."""
+        with self._lock:
+            self._loaded = False
+            self._value = None
+
+
+def register(name, loader):
+    """Register a loader which manages its own caching.
+
+    Parameters
+    ----------
+    name : str
+        Name of the resource.
+    loader : callable
+        Function without arguments returning the resource.
+
+    Returns
+    -------
+    callable
+        The loader, unchanged.
+
+    """
+    _registry[name] = loader
+    return loader
+
+
+def lazy_resource(name, stamp=None):
+    """Decorator registering a loader whose result is loaded once.
+
+    The decorated function is replaced by a `LazyResource`; calling it
+    returns the shared instance. With a `stamp` function the instance is
+    reloaded whenever the stamp changes.
+
+    """
+    def decorator(loader):
+        resource = LazyResource(name, loader, stamp)
+        _registry[name] = resource
+        return resource
+    return decorator
+
+
+def get(name):
+    """Return the resource registered under `name`, loading it if needed."""
+    try:
+        loader = _registry[name]
+    except KeyError:
+        raise KeyError(f"No resource registered as {name!r}") from None
+    return loader()
+
+
+def invalidate(name=None):
+    """Drop loaded instances of one (or every) lazily loaded resource."""
+    names = list(_registry) if name is None else [name]
+    for resource_name in names:
+        resource = _registry[resource_name]
+        if isinstance(resource, LazyResource):
+            resource.invalidate()
+
+
+def registered():
+    """Names of every registered resource, in registration order."""
+    return list(_registry)
+
+
+def warm_up(names=None, background=True):
+    """Load resources ahead of their first use.
+
+    Parameters
+    ----------
+    names : list (str), optional
+        Resources to load, in order. Defaults to every registered resource.
+    background : bool
+        Load on a daemon thread and return immediately. Only one background
+        warm-up runs per process; later calls return the same thread.
+
+    Returns
+    -------
+    threading.Thread or None
+        The warm-up thread when loading in the background.
+
+    """
+    names = registered() if names is None else list(names)
+
+    def load_all():
+        for name in names:
+            try:
+                get(name)
+            except Exception:
+                # Errors surface again when the resource is actually used
+                pass
+
+    if not background:
+        for name in names:
+            get(name)
+        return None
+    global _warm_up_thread
+    with _warm_up_lock:
+        if _warm_up_thread is None:
+            _warm_up_thread = threading.Thread(target=load_all, name='warm-up',
+                                               daemon=True)
+            _warm_up_thread.start()
+    return _warm_up_thread
@@ -0,0 +1,273 @@
+"""
+
+    Persistent recommendation result cache shared between processes.
+
+    Author: Explore Data Science Academy.
+
+    Description: Stores finished recommendation lists in a SQLite database
+    in WAL mode. Every app worker, replica on the same disk, batch job and
+    service process reads and writes the same file, and the results survive
+    restarts. An entry is keyed by the engine, the version of the model
+    artifacts it was computed from, the aggregation method, the normalised
+    set of favourite movies with their weights, if any, and the number of
+    recommendations.
+
+    Entries are evicted in three ways:
+
+    - by age: entries older than `ttl` seconds are never returned, and are
+      deleted as they are found or when the cache is trimmed;
+    - by version: once a new model version is seen, entries computed from
+      earlier versions of that engine are deleted;
+    - by size: when the stored results exceed `max_bytes`, the least
+      recently used entries are deleted.
+
+    Models use the `cached` decorator. Cache errors, such as a locked or
+    read-only database, are logged and treated as misses, so the cache
+    never prevents a recommendation from being computed.
+
+    The database is kept at `.cache/result_cache.sqlite` under the working
+    directory, outside the tracked model files. Set the environment
+    variable RECOMMENDER_RESULT_CACHE to another path for the database, or
+    to 0 to turn the cache off.
+
+"""
+# Script dependencies
+import functools
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from utils.profiling import span
+
+ENV_VAR = 'RECOMMENDER_RESULT_CACHE'
+CACHE_PATH = '.cache/result_cache.sqlite'
+# Seconds an entry stays valid
+TTL = 7 * 24 * 3600
+# Total size of the stored results, in bytes
+MAX_BYTES = 64 * 2 ** 20
+# Seconds between two recordings of an entry's last access, which keeps
+# popular entries from causing a write on every hit
+ACCESS_RESOLUTION = 60
+# Insertions between two checks of the size budget
+TRIM_INTERVAL = 32
+
+logger = logging.getLogger('recommender.result_cache')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    engine TEXT NOT NULL,
+    version TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+CREATE INDEX IF NOT EXISTS results_engine ON results (engine, version);
+"""
+
+
+def normalise_seeds(movie_list, weights=None):
+    """Favourite movies as a sorted list without repeats or, with
+    `weights`, as sorted [movie, weight] pairs, the weights of a repeated
+    movie being added up."""
+    if weights is None:
+        return sorted(set(movie_list))
+    totals = {}
+    for movie, weight in zip(movie_list, weights, strict=True):
+        totals[movie] = totals.get(movie, 0.) + float(weight)
+    return sorted([movie, weight] for movie, weight in totals.items())
+
+
+def file_version(*paths):
+    """Identifier of the current contents of some files, or None if any
+    is missing."""
+    stamps = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        stamps.append(f'{stat.st_mtime_ns:x}.{stat.st_size:x}')
+    return '-'.join(stamps)
+
+
+class ResultCache:
+    """SQLite-backed cache of recommendation lists.
+
+    Parameters
+    ----------
+    path : str
+        Location of the database, created if missing.
+    ttl : float
+        Seconds an entry stays valid.
+    max_bytes : int
+        Total size of the stored results. The least recently used entries
+        are evicted beyond it.
+
+    """
+
+    def __init__(self, path=CACHE_PATH, ttl=TTL, max_bytes=MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._versions = {}
+        self._inserts = 0
+
+    def _connection(self):
+        # sqlite3 connections must stay in the thread, and the process,
+        # that opened them
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.executescript(_SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def key(engine, version, seeds, top_n, weights=None):
+        """Key of the entry for a request. Weighted requests use the
+        'weighted' aggregation and the others the engine's default one,
+        which its `version` accounts for."""
+        method = 'default' if weights is None else 'weighted'
+        text = json.dumps([engine, version, method, normalise_seeds(seeds, weights), top_n])
+        return hashlib.sha1(text.encode()).hexdigest()
+
+    def get(self, engine, version, seeds, top_n, weights=None):
+        """Cached recommendations of a request, or None."""
+        key = self.key(engine, version, seeds, top_n, weights)
+        now = time.time()
+        connection = self._connection()
+        row = connection.execute(
+            'SELECT value, created, accessed FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        value, created, accessed = row
+        if now - created > self.ttl:
+            connection.execute('DELETE FROM results WHERE key = ?', (key,))
+            return None
+        if now - accessed > ACCESS_RESOLUTION:
+            connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+        return json.loads(value)
+
+    def put(self, engine, version, seeds, top_n, value, weights=None):
+        """Store the recommendations of a request."""
+        key = self.key(engine, version, seeds, top_n, weights)
+        data = json.dumps(value)
+        now = time.time()
+        connection = self._connection()
+        with self._lock:
+            new_version = self._versions.get(engine) != version
+            self._versions[engine] = version
+            self._inserts += 1
+            trim = new_version or self._inserts % TRIM_INTERVAL == 0
+        if new_version:
+            connection.execute('DELETE FROM results WHERE engine = ? AND version != ?',
+                               (engine, version))
+        connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, engine, version, data, len(data), now, now))
+        if trim:
+            self.trim()
+
+    def trim(self):
+        """Delete expired entries, then the least recently used ones until
+        the results fit the size budget."""
+        connection = self._connection()
+        connection.execute('DELETE FROM results WHERE created < ?',
+                           (time.time() - self.ttl,))
+        total, = connection.execute('SELECT total(size) FROM results').fetchone()
+        if total <= self.max_bytes:
+            return
+        # Free a tenth of the budget beyond it, so that trimming is rare
+        excess = total - 0.9 * self.max_bytes
+        connection.execute("""
+            DELETE FROM results WHERE key IN (
+                SELECT key FROM (
+                    SELECT key, sum(size) OVER (ORDER BY accessed, key) - size AS freed_before
+                    FROM results)
+                WHERE freed_before < ?)
+            """, (excess,))
+
+    def clear(self):
+        self._connection().execute('DELETE FROM results')
+
+    def stats(self):
+        """Number of entries and total size of the stored results."""
+        count, size = self._connection().execute(
+            'SELECT count(*), total(size) FROM results').fetchone()
+        return {'entries': count, 'bytes': int(size)}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """The process-wide cache, or None when turned off."""
+    global _cache
+    setting = os.environ.get(ENV_VAR, CACHE_PATH).strip()
+    if setting.lower() in ('', '0', 'false', 'off', 'no'):
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != setting:
+            _cache = ResultCache(setting)
+        return _cache
+
+
+def cached(engine, version):
+    """Decorator caching a recommender's results in the result cache.
+
+    The decorated function takes a list of favourite movies, a number of
+    recommendations and optional per-movie weights, and is called with them
+    as given. Lists with the same favourites in another order or with
+    repeats, a repeat's weights adding up, share an entry (see
+    `normalise_seeds`), so its result must not depend on either.
+
+    Parameters
+    ----------
+    engine : str
+        Name of the recommender, such as 'content'.
+    version : callable
+        Function without arguments identifying the model artifacts the
+        recommender currently uses. Results are not cached while it
+        returns None.
+
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(movie_list, top_n=10, weights=None):
+            # Functions without weights are called as before
+            options = {} if weights is None else {'weights': weights}
+            cache = get_cache()
+            current = version() if cache is not None else None
+            if current is None:
+                return function(movie_list, top_n, **options)
+            try:
+                with span('result_cache'):
+                    hit = cache.get(engine, current, movie_list, top_n, weights)
+            except sqlite3.Error:
+                logger.warning('Result cache lookup failed', exc_info=True)
+                hit = None
+            if hit is not None:
+                return hit
+            result = function(movie_list, top_n, **options)
+            try:
+                cache.put(engine, current, movie_list, top_n, result, weights)
+            except sqlite3.Error:
+                logger.warning('Result cache update failed', exc_info=True)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,130 @@
+"""
+
+    Build step for the images served by the Streamlit app.
+
+    Author: Explore Data Science Academy.
+
+    Description: Resizes the page backgrounds, team photos and logos in
+    `resources/imgs/` to the largest size the app displays them at. They
+    are recompressed as WebP, with animated GIFs becoming animated WebP,
+    and written to `static/`. Streamlit serves that directory at
+    `/app/static/` when static serving is enabled in
+    `.streamlit/config.toml`. The browser then fetches each image once and
+    caches it, instead of receiving it inlined as base64 on every rerun.
+    Only images whose source is newer than the built copy are rebuilt, so
+    the app can run the step on start-up at little cost.
+
+    Usage (from the root of this repository):
+
+        python -m utils.static_assets
+
+"""
+# Image handling dependencies
+import argparse
+import os
+from PIL import Image, ImageSequence
+
+SOURCE_DIR = 'resources/imgs'
+STATIC_DIR = 'static'
+# Served from the root of the app's host, where st.image also expects it
+STATIC_URL = '/app/static'
+# Source images and the width, in pixels, they are scaled down to
+ASSETS = {
+    # Animated: each of its 120 frames costs as much as a still image
+    'bgimg1.gif': 1280,
+    'bgimg2.png': 1920,
+    'tv-screens2.png': 1920,
+    'AI human interact.png': 300,
+    'cineai Logo.png': 500,
+    'imi1.png': 300,
+    'reneilwe1.png': 300,
+    'olwethu1.png': 300,
+    'baartman1.png': 300,
+    'antonia1.png': 300,
+    'judy1.png': 300,
+    'thato1.png': 300,
+}
+QUALITY = 80
+
+
+def static_name(source):
+    """File name of the built copy of a source image."""
+    root, _ = os.path.splitext(source)
+    return root.replace(' ', '_') + '.webp'
+
+
+def static_url(source):
+    """URL the app serves the built copy of a source image at."""
+    return f'{STATIC_URL}/{static_name(source)}'
+
+
+def _scaled(frame, width):
+    if frame.width <= width:
+        return frame
+    height = round(frame.height * width / frame.width)
+    return frame.resize((width, height), Image.LANCZOS)
+
+
+def build_asset(source_path, output_path, width, quality=QUALITY):
+    """Write a resized WebP copy of an image, animated if the source is.
+
+    Parameters
+    ----------
+    source_path : str
+        Image to convert.
+    output_path : str
+        WebP file to write; replaced atomically.
+    width : int
+        Maximum width of the copy. Smaller images keep their size.
+    quality : int
+        WebP quality, from 0 to 100.
+
+    """
+    tmp_path = output_path + '.tmp'
+    with Image.open(source_path) as image:
+        if getattr(image, 'is_animated', False):
+            frames = [_scaled(frame.convert('RGB'), width)
+                      for frame in ImageSequence.Iterator(image)]
+            frames[0].save(tmp_path, format='WEBP', save_all=True,
+                           append_images=frames[1:], quality=quality,
+                           minimize_size=True, duration=image.info.get('duration', 100),
+                           loop=image.info.get('loop', 0))
+        else:
+            _scaled(image.convert('RGBA'), width).save(tmp_path, format='WEBP',
+                                                       quality=quality, method=6)
+    os.replace(tmp_path, output_path)
+
+
+def build_static_assets(source_dir=SOURCE_DIR, static_dir=STATIC_DIR, force=False):
+    """Build the static copy of every image in `ASSETS` that is missing or
+    older than its source.
+
+    Returns
+    -------
+    list (str)
+        Source images that were (re)built.
+
+    """
+    os.makedirs(static_dir, exist_ok=True)
+    built = []
+    for source, width in ASSETS.items():
+        source_path = os.path.join(source_dir, source)
+        output_path = os.path.join(static_dir, static_name(source))
+        if not force and os.path.exists(output_path) \
+                and os.path.getmtime(output_path) >= os.path.getmtime(source_path):
+            continue
+        build_asset(source_path, output_path, width)
+        built.append(source)
+    return built
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Build the static WebP copies of the app images.')
+    parser.add_argument('--force', action='store_true',
+                        help='Rebuild every image, even if it is up to date.')
+    args = parser.parse_args()
+    for source in build_static_assets(force=args.force):
+        source_size = os.path.getsize(os.path.join(SOURCE_DIR, source))
+        output_size = os.path.getsize(os.path.join(STATIC_DIR, static_name(source)))
+        print(f"{source}: {source_size / 1024:.0f} KB -> {output_size / 1024:.0f} KB")
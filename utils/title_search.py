@@ -0,0 +1,247 @@
+"""
+
+    Typeahead search index over movie titles.
+
+    Author: Explore Data Science Academy.
+
+    Description: Finds catalogue titles matching a partly typed query
+    without scanning the 62k titles. Titles are normalised to lowercase
+    ASCII words, and three structures are built once per process:
+
+    - a sorted list of whole normalised titles, for prefix matches;
+    - a sorted vocabulary of title words, with the titles using each word;
+    - the trigrams of every vocabulary word, for queries with typos.
+
+    A prefix always matches a contiguous range of a sorted list, which a
+    binary search finds. Matches are ranked in tiers. Titles starting with
+    the query come first, such as "toy s" for "Toy Story (1995)". Titles
+    with a word starting with every query word come next, such as "wars
+    empire". Last come titles matched after replacing query words that
+    start no title word by title words sharing most of their trigrams, so
+    "godfater" finds "Godfather, The (1972)". Leading articles moved to
+    the end, as in "Matrix, The (1999)", also match in their natural
+    order.
+
+    Within a tier, titles rank by popularity (number of ratings), then by
+    length. Titles are stored in that order, so the best matches of a tier
+    are simply its smallest row numbers.
+
+"""
+# Data handling dependencies
+import bisect
+import functools
+import os
+import re
+import unicodedata
+import numpy as np
+from utils import resources
+from utils.catalogue import load_catalogue
+from utils.ratings_store import load_ratings_store
+
+MOVIES_PATH = 'resources/data/movies.csv'
+# Sorts after every character of a normalised title
+_END = '{'
+_ARTICLE = re.compile(r'^(.*), (The|A|An)( \(\d{4}\))?$')
+_NON_WORD = re.compile(r'[^0-9a-z]+')
+
+
+def normalise(text):
+    """Lowercase ASCII words of a text, separated by single spaces."""
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    return _NON_WORD.sub(' ', text.lower()).strip()
+
+
+def _trigrams(word):
+    """Distinct trigrams of a word padded with a space on either side."""
+    padded = f' {word} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _group(keys, values):
+    """Sorted distinct keys, and CSR-style (indptr, values) of each key's
+    values in ascending order."""
+    distinct, inverse = np.unique(np.asarray(keys), return_inverse=True)
+    order = np.lexsort((values, inverse))
+    indptr = np.searchsorted(inverse[order], np.arange(len(distinct) + 1))
+    return distinct.tolist(), indptr, values[order]
+
+
+class TitleSearchIndex:
+    """Prefix, word-prefix and typo-tolerant search over titles.
+
+    Parameters
+    ----------
+    titles : list (str)
+        Titles to search. Repeated titles are kept once.
+    popularity : list (float), optional
+        Popularity of each title, such as its number of ratings. More
+        popular titles rank first among equally good matches.
+
+    """
+
+    def __init__(self, titles, popularity=None):
+        titles = list(titles)
+        popularity = np.zeros(len(titles)) if popularity is None \
+            else np.asarray(popularity, dtype=float)
+        first = {}
+        for position, title in enumerate(titles):
+            first.setdefault(title, position)
+        positions = np.fromiter(first.values(), dtype=np.intp, count=len(first))
+        lengths = np.fromiter(map(len, first), dtype=np.intp, count=len(first))
+        order = np.lexsort((positions, lengths, -popularity[positions]))
+        self.titles = np.asarray(list(first), dtype=object)[order]
+
+        keys, key_rows, words, word_rows = [], [], [], []
+        for row, title in enumerate(self.titles):
+            forms = {normalise(title)}
+            moved = _ARTICLE.match(title)
+            if moved:
+                forms.add(normalise(f'{moved[2]} {moved[1]}{moved[3] or ""}'))
+            keys.extend(forms)
+            key_rows.extend([row] * len(forms))
+            title_words = {word for form in forms for word in form.split()}
+            words.extend(title_words)
+            word_rows.extend([row] * len(title_words))
+        key_rows = np.asarray(key_rows, dtype=np.int32)
+        key_order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._keys = [keys[i] for i in key_order]
+        self._key_rows = key_rows[key_order]
+        self._words, self._word_indptr, self._word_rows = _group(
+            words, np.asarray(word_rows, dtype=np.int32))
+
+        grams, gram_words = [], []
+        for word_id, word in enumerate(self._words):
+            word_grams = _trigrams(word)
+            grams.extend(word_grams)
+            gram_words.extend([word_id] * len(word_grams))
+        gram_keys, indptr, word_ids = _group(grams, np.asarray(gram_words, dtype=np.int32))
+        self._gram_words = {gram: word_ids[indptr[i]:indptr[i + 1]]
+                            for i, gram in enumerate(gram_keys)}
+
+    def __len__(self):
+        return len(self.titles)
+
+    def _smallest(self, rows, limit, exclude):
+        """The `limit` smallest distinct rows not in `exclude`, ascending."""
+        wanted = limit + len(exclude)
+        while True:
+            if len(rows) > 4 * wanted:
+                best = np.unique(np.partition(rows, wanted - 1)[:wanted])
+            else:
+                best = np.unique(rows)
+            best = best[~np.isin(best, exclude)]
+            if len(best) >= limit or len(rows) <= 4 * wanted:
+                return best[:limit]
+            wanted *= 4
+
+    def _intersect(self, row_sets):
+        """Rows common to every array of rows (with repeats)."""
+        row_sets = sorted(row_sets, key=len)
+        rows = row_sets[0]
+        for other in row_sets[1:]:
+            if len(rows) == 0:
+                break
+            member = np.zeros(len(self), dtype=bool)
+            member[other] = True
+            rows = rows[member[rows]]
+        return rows
+
+    def _word_rows_for(self, word_ids):
+        return np.concatenate([np.empty(0, dtype=np.int32)] + [
+            self._word_rows[self._word_indptr[i]:self._word_indptr[i + 1]]
+            for i in word_ids])
+
+    def _prefix_rows(self, word):
+        """Rows of titles with a word starting with `word`."""
+        start = bisect.bisect_left(self._words, word)
+        stop = bisect.bisect_left(self._words, word + _END, start)
+        return self._word_rows[self._word_indptr[start]:self._word_indptr[stop]]
+
+    def _similar_rows(self, word, min_share):
+        """Rows of titles with a word sharing most trigrams with `word`."""
+        grams = _trigrams(word)
+        postings = [self._gram_words[gram] for gram in grams if gram in self._gram_words]
+        if not postings:
+            return np.empty(0, dtype=np.int32)
+        word_ids, hits = np.unique(np.concatenate(postings), return_counts=True)
+        return self._word_rows_for(word_ids[hits >= min_share * len(grams)])
+
+    def search_rows(self, query, limit=10, min_share=0.6):
+        """Rows of the titles best matching a query.
+
+        Parameters
+        ----------
+        query : str
+            Partly typed title.
+        limit : int
+            Maximum number of matches.
+        min_share : float
+            Share of a query word's trigrams that a title word must
+            contain to match it despite typos.
+
+        Returns
+        -------
+        np.ndarray (int)
+            Rows of `titles`, best match first.
+
+        """
+        query = normalise(query)
+        found = np.empty(0, dtype=np.int32)
+        if not query or limit <= 0:
+            return found
+        # Tier 1: whole-title prefix
+        start = bisect.bisect_left(self._keys, query)
+        stop = bisect.bisect_left(self._keys, query + _END, start)
+        found = self._smallest(self._key_rows[start:stop], limit, found)
+        # Tier 2: a title word starting with every query word
+        words = query.split()
+        prefix_rows = [self._prefix_rows(word) for word in words]
+        if len(found) < limit:
+            rows = self._intersect(prefix_rows)
+            found = np.concatenate([found, self._smallest(rows, limit - len(found), found)])
+        # Tier 3: as tier 2, but query words starting no title word may
+        # instead resemble one
+        misspelt = [i for i, rows in enumerate(prefix_rows) if len(rows) == 0]
+        if len(found) < limit and misspelt:
+            for i in misspelt:
+                prefix_rows[i] = self._similar_rows(words[i], min_share)
+            rows = self._intersect(prefix_rows)
+            found = np.concatenate([found, self._smallest(rows, limit - len(found), found)])
+        return found
+
+    def search(self, query, limit=10, min_share=0.6):
+        """Titles best matching a query, best match first (see `search_rows`)."""
+        return self.titles[self.search_rows(query, limit, min_share)].tolist()
+
+
+@functools.lru_cache(maxsize=None)
+def _load_title_search(path):
+    catalogue = load_catalogue(path)
+    store = load_ratings_store()
+    # Number of ratings of each catalogue movie
+    counts = np.zeros(len(catalogue))
+    rows = catalogue.rows_for_movie_ids(store.item_ids)
+    counts[rows[rows >= 0]] = store.item_counts[rows >= 0]
+    return TitleSearchIndex(catalogue.titles, counts)
+
+
+def load_title_search(path=MOVIES_PATH):
+    """Load the title search index, once per process and path.
+
+    Parameters
+    ----------
+    path : str
+        Relative or absolute path to movie database stored
+        in .csv format.
+
+    Returns
+    -------
+    TitleSearchIndex
+        Search index over the movie titles, ranked by number of ratings.
+
+    """
+    return _load_title_search(os.path.abspath(path))
+
+
+# Shared with the rest of the app through the resource registry
+resources.register('title_search', load_title_search)